@@ -0,0 +1,150 @@
+import asyncio
+import enum
+from concurrent.futures import Executor
+from typing import Callable, Optional, Tuple
+
+from file_system import FileSystem
+from file_system_entities.file_system_entities import FileSystemEntity, TextFile
+
+# Contents at least this long are written from the executor rather than from the event loop
+LARGE_CONTENT_THRESHOLD = 64 * 1024
+
+
+class AsyncFileSystem:
+    def __init__(self, file_system: FileSystem = None, executor: Executor = None,
+                 large_content_threshold: int = LARGE_CONTENT_THRESHOLD):
+        """
+        An asyncio front-end for a FileSystem.  Mutations are serialized through an internal queue, drained by a
+        single worker task; the ones that may block (journaled mutations, large writes) run in an executor so
+        that callers never block the event loop.  Lookups are answered directly
+        :param file_system: FileSystem - The wrapped file system; a new concurrent one by default
+        :param executor: Executor - The executor blocking work runs in; the event loop's default one by default
+        :param large_content_threshold: int - The content length from which writes run in the executor
+        """
+        self.file_system = file_system if file_system is not None else FileSystem(concurrent=True)
+        self.large_content_threshold = large_content_threshold
+        self._executor = executor
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Future] = None
+
+    async def create(self, type: enum.Enum, name: str, parent_path: str = None) -> FileSystemEntity:
+        return await self._submit(self.file_system.create, type, name, parent_path)
+
+    async def delete(self, path: str) -> bool:
+        return await self._submit(self.file_system.delete, path)
+
+    async def move(self, source_path: str, dest_path: str) -> FileSystemEntity:
+        return await self._submit(self.file_system.move, source_path, dest_path)
+
+    async def write_to_file(self, path: str, content: str) -> TextFile:
+        blocking = len(content) >= self.large_content_threshold
+        return await self._submit(self.file_system.write_to_file, path, content, blocking=blocking)
+
+    async def append_to_file(self, path: str, content: str) -> TextFile:
+        blocking = len(content) >= self.large_content_threshold
+        return await self._submit(self.file_system.append_to_file, path, content, blocking=blocking)
+
+    async def write_range(self, path: str, offset: int, content: str) -> TextFile:
+        blocking = len(content) >= self.large_content_threshold
+        return await self._submit(self.file_system.write_range, path, offset, content, blocking=blocking)
+
+    async def find_node_by_path(self, path: str) -> Optional[FileSystemEntity]:
+        return self.file_system.find_node_by_path(path)
+
+    async def save(self, path: str) -> None:
+        """
+        Save the file system to a snapshot file, from the executor, once every queued mutation has been applied
+        :param path: str - The path of the snapshot file on disk
+        """
+        await self._submit(self.file_system.save, path, blocking=True)
+
+    @classmethod
+    async def load(cls, path: str, executor: Executor = None, **kwargs) -> 'AsyncFileSystem':
+        """
+        Load a file system from a snapshot file, from the executor
+        :param path: str - The path of the snapshot file on disk
+        :param executor: Executor - See __init__
+        :param kwargs: Passed on to __init__
+        :return: AsyncFileSystem
+        """
+        loop = asyncio.get_event_loop()
+        file_system = await loop.run_in_executor(executor, lambda: FileSystem.load(path, concurrent=True))
+        return cls(file_system, executor, **kwargs)
+
+    async def close(self) -> None:
+        """
+        Wait for every queued mutation to be applied and stop the worker task
+        """
+        if self._worker is None:
+            return
+        await self._queue.join()
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+        self._queue = None
+
+    async def __aenter__(self) -> 'AsyncFileSystem':
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def _submit(self, operation: Callable, *args, blocking: bool = False):
+        """
+        Queue a mutation and wait for its result
+        :param operation: Callable - The FileSystem method to be called
+        :param args: The arguments of the method
+        :param blocking: bool - Whether the method must run in the executor regardless of the journal
+        :return: The result of the method
+        """
+        loop = asyncio.get_event_loop()
+        if self._worker is None:
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.ensure_future(self._drain())
+        result = loop.create_future()
+        await self._queue.put((operation, args, blocking or self.file_system.journal is not None, result))
+
+        return await result
+
+    async def _drain(self) -> None:
+        """
+        Apply the queued mutations one at a time, in order
+        """
+        loop = asyncio.get_event_loop()
+        while True:
+            operation, args, blocking, result = await self._queue.get()
+            try:
+                if blocking:
+                    try:
+                        value, error = await loop.run_in_executor(self._executor, _apply, operation, args)
+                    except Exception as executor_error:
+                        # The executor itself failed (e.g. it was shut down), so the mutation wasn't applied
+                        value, error = None, executor_error
+                else:
+                    value, error = _apply(operation, args)
+                if result.cancelled():
+                    continue
+                if error is not None:
+                    result.set_exception(error)
+                else:
+                    result.set_result(value)
+            finally:
+                self._queue.task_done()
+
+
+def _apply(operation: Callable, args: tuple) -> Tuple[object, Optional[Exception]]:
+    """
+    Apply a mutation, catching its error rather than raising it into the worker: the traceback of an error caught
+    by the worker would hold the worker's (suspended) frame, and a caller clearing the frames of the traceback
+    would close the worker
+    :param operation: Callable - The FileSystem method
+    :param args: tuple - Its arguments
+    :return: Tuple[object, Exception] - The result of the method, or the error it raised
+    """
+    try:
+        return operation(*args), None
+    except Exception as error:
+        return None, error
@@ -0,0 +1,163 @@
+import enum
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from helpers import propagate_size_delta
+from file_system_entities.file_system_entities import FileSystemEntity, TextFile
+
+
+class FileSystemBatch:
+    def __init__(self, file_system):
+        """
+        A group of mutations applied to a file system with deferred size propagation and all-or-nothing semantics.
+        Obtained through FileSystem.batch()
+        :param file_system: FileSystem - The file system the mutations are applied to
+        """
+        self.file_system = file_system
+        # id(container) => (container, pending change in the total size of its children)
+        self._pending_deltas: Dict[int, Tuple[FileSystemEntity, int]] = {}
+        self._undo_log: List[Callable[[], None]] = []
+        # Journal records of the mutations applied so far, appended as one group once the batch succeeds
+        self.journal_records: List[Tuple] = []
+        # Parents already resolved by this batch, by the path they were requested with
+        self._parents: Dict[str, FileSystemEntity] = {}
+        # (root, path) of the subtrees deleted by the batch, handed over to the reclaimer once the batch succeeds
+        self.deleted: List[Tuple[FileSystemEntity, str]] = []
+        # (kind, path, dest path, node) of the changes to be delivered to the watches once the batch succeeds
+        self.changes: List[Tuple] = []
+        # Nodes whose compressed zip file ancestors must have their size recomputed once the batch ends, by id
+        self.changed_nodes: Dict[int, FileSystemEntity] = {}
+
+    def create(self, type: enum.Enum, name: str, parent_path: str = None) -> FileSystemEntity:
+        """
+        Creates a file system node (entity), resolving each distinct parent path only once per batch
+        :param type: enum.Enum - The ID of the file system node type from the entity types enum
+        :param name: str - The name of the file system node (entity)
+        :param parent_path: str - Path of the parent file system node (entity)
+        :return: FileSystemEntity
+        :raises FileNotFoundError, FileExistsError, IllegalFileSystemOperation
+        """
+        parent_key = str(parent_path)
+        parent_node = self._parents.get(parent_key)
+        if parent_node is None:
+            parent_node = self.file_system.find_node_by_path(parent_path)
+            if parent_node is not None:
+                self._parents[parent_key] = parent_node
+
+        return self.file_system._create_child(type, name, parent_node, parent_path)
+
+    def bulk_create(self, entities: Iterable[Tuple[enum.Enum, str, str]]) -> List[FileSystemEntity]:
+        """
+        Creates many file system nodes (entities)
+        :param entities: Iterable[Tuple[enum.Enum, str, str]] - (type, name, parent path) of each node, parents first
+        :return: List[FileSystemEntity]
+        :raises FileNotFoundError, FileExistsError, IllegalFileSystemOperation
+        """
+        return [self.create(type, name, parent_path) for type, name, parent_path in entities]
+
+    def delete(self, path: str) -> bool:
+        self._parents.clear()
+        return self.file_system.delete(path)
+
+    def move(self, source_path: str, dest_path: str) -> FileSystemEntity:
+        self._parents.clear()
+        return self.file_system.move(source_path, dest_path)
+
+    def write_to_file(self, path: str, content: str) -> TextFile:
+        return self.file_system.write_to_file(path, content)
+
+    def append_to_file(self, path: str, content: str) -> TextFile:
+        return self.file_system.append_to_file(path, content)
+
+    def write_range(self, path: str, offset: int, content: str) -> TextFile:
+        return self.file_system.write_range(path, offset, content)
+
+    def record_undo(self, undo: Callable[[], None]) -> None:
+        """
+        Record how to revert a mutation that was just applied
+        :param undo: Callable[[], None] - Reverts the mutation
+        """
+        self._undo_log.append(undo)
+
+    def record_journal(self, op: int, *args) -> None:
+        """
+        Hold back the journal record of a mutation until the batch succeeds
+        :param op: int - One of the journal OP_* codes
+        :param args: The arguments of the mutation
+        """
+        self.journal_records.append((op, *args))
+
+    def defer_zip_refresh(self, nodes: Iterable[FileSystemEntity]) -> None:
+        """
+        Hold back recomputing the compressed size of the zip files above changed nodes until the batch ends
+        :param nodes: Iterable[FileSystemEntity] - The changed nodes
+        """
+        for node in nodes:
+            if node is not None:
+                self.changed_nodes[id(node)] = node
+
+    def defer_size_delta(self, node: FileSystemEntity, delta: int) -> None:
+        """
+        Accumulate a change in the total size of a container's children until the batch is flushed
+        :param node: FileSystemEntity - The container whose children's total size changed
+        :param delta: int - The change in the total size of the children of node
+        """
+        if node is None or not delta:
+            return
+        entry = self._pending_deltas.get(id(node))
+        self._pending_deltas[id(node)] = (node, delta + entry[1] if entry else delta)
+
+    def rollback(self) -> None:
+        """
+        Revert every mutation applied by the batch, most recent first
+        """
+        while self._undo_log:
+            self._undo_log.pop()()
+        self._parents.clear()
+        self.journal_records.clear()
+        self.changes.clear()
+
+    def flush_sizes(self) -> None:
+        """
+        Apply the pending size deltas in a single bottom-up pass: each container is updated once, after all of its
+        descendants, and the resulting change in its own size is handed to its parent
+        """
+        before_update = self.file_system._before_size_update()
+        after_update = self.file_system._after_size_update()
+        depths: Dict[int, int] = {}
+        levels: Dict[int, Dict[int, FileSystemEntity]] = defaultdict(dict)
+        for node, delta in self._pending_deltas.values():
+            levels[self._depth(node, depths)][id(node)] = node
+
+        depth = max(levels) if levels else -1
+        while depth >= 0:
+            for node in levels.pop(depth, {}).values():
+                node, delta = self._pending_deltas.pop(id(node))
+                parent = getattr(node, 'parent', None)
+                delta = propagate_size_delta(node, delta, parent, before_update=before_update,
+                                             after_update=after_update)
+                if parent is not None and delta:
+                    self.defer_size_delta(parent, delta)
+                    levels[depth - 1][id(parent)] = parent
+            depth -= 1
+
+        self._undo_log.clear()
+
+    @staticmethod
+    def _depth(node: FileSystemEntity, depths: Dict[int, int]) -> int:
+        """
+        Get the number of ancestors of a node, memoizing the depths of every node on the way up
+        :param node: FileSystemEntity - The file system node (entity)
+        :param depths: Dict[int, int] - id(node) => depth of the nodes seen so far
+        :return: int
+        """
+        chain = []
+        while node is not None and id(node) not in depths:
+            chain.append(node)
+            node = getattr(node, 'parent', None)
+        depth = depths[id(node)] if node is not None else -1
+        for ancestor in reversed(chain):
+            depth += 1
+            depths[id(ancestor)] = depth
+
+        return depths[id(chain[0])] if chain else depth
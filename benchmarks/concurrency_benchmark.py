@@ -0,0 +1,110 @@
+"""
+Reports the throughput of a FileSystem in concurrent mode, shared by an increasing number of threads.
+Each thread works in its own folder, with a mix of 90% lookups and 10% writes.  As a baseline, the same
+workload also runs with every operation, lookups included, serialized behind a single lock.
+
+Pure Python threads hold the GIL while they run, so on CPython the throughput stays flat as threads are added,
+and in memory the single lock is even slightly faster (one uncontended lock costs less than the tree and node
+locks).  Lookups only get ahead of the single lock when writers block outside of the GIL, e.g. on the fsync of
+a journal (--journal)
+
+    python benchmarks/concurrency_benchmark.py --operations 20000 --threads 1 2 4 8
+    python benchmarks/concurrency_benchmark.py --operations 2000 --threads 1 2 4 8 --journal
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, ContextManager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from file_system import FileSystem  # noqa: E402
+from file_system_entities.entity_types_enum import EntityTypes  # noqa: E402
+from helpers import MAIN_DRIVE  # noqa: E402
+from journal import FSYNC_ALWAYS, Journal  # noqa: E402
+
+FILES_PER_THREAD = 100
+
+
+def build_tree(file_system: FileSystem, threads: int) -> None:
+    with file_system.batch() as batch:
+        for i in range(threads):
+            folder_path = os.path.join(MAIN_DRIVE, f'folder{i}')
+            batch.create(EntityTypes.FOLDER, f'folder{i}', MAIN_DRIVE)
+            batch.bulk_create((EntityTypes.TEXT_FILE, f'file{j}', folder_path) for j in range(FILES_PER_THREAD))
+
+
+@contextmanager
+def no_lock():
+    yield
+
+
+def work(file_system: FileSystem, thread_index: int, operations: int,
+         guard: Callable[[], ContextManager] = no_lock) -> None:
+    paths = [os.path.join(MAIN_DRIVE, f'folder{thread_index}', f'file{j}') for j in range(FILES_PER_THREAD)]
+    for i in range(operations):
+        path = paths[i % FILES_PER_THREAD]
+        if i % 10:
+            with guard():
+                file_system.find_node_by_path(path)
+        else:
+            with guard():
+                file_system.write_to_file(path, 'x' * (i % 64))
+
+
+def run(thread_count: int, operations: int, single_lock: bool, journal_path: str = None) -> float:
+    """
+    Run the workload once
+    :param thread_count: int
+    :param operations: int - Operations per thread
+    :param single_lock: bool - Whether every operation is serialized behind a single lock
+    :param journal_path: str - Journal every write, synced to disk before it returns, if given
+    :return: float - Operations per second
+    """
+    journal = Journal(journal_path, FSYNC_ALWAYS) if journal_path else None
+    try:
+        file_system = FileSystem(journal, concurrent=True)
+        build_tree(file_system, thread_count)
+        lock = threading.Lock()
+        guard = (lambda: lock) if single_lock else no_lock
+        threads = [threading.Thread(target=work, args=(file_system, i, operations, guard))
+                   for i in range(thread_count)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return thread_count * operations / (time.perf_counter() - started)
+    finally:
+        if journal is not None:
+            journal.close()
+            os.remove(journal_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--operations', type=int, default=20000, help='operations per thread')
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--journal', action='store_true', help='journal every write, synced to disk')
+    args = parser.parse_args()
+
+    temp_dir = tempfile.mkdtemp()
+    journal_path = os.path.join(temp_dir, 'file_system.journal') if args.journal else None
+    try:
+        print(f'{"threads":>7} {"lock-free lookups":>18} {"single lock":>12}  (ops/sec)')
+        for thread_count in args.threads:
+            lock_free = run(thread_count, args.operations, False, journal_path)
+            single_lock = run(thread_count, args.operations, True, journal_path)
+            print(f'{thread_count:>7} {lock_free:>18.0f} {single_lock:>12.0f}')
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    main()
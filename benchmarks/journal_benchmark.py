@@ -0,0 +1,53 @@
+"""
+Reports journaled mutation throughput (ops/sec) under each fsync policy
+
+    python benchmarks/journal_benchmark.py --operations 2000
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from file_system import FileSystem  # noqa: E402
+from file_system_entities.entity_types_enum import EntityTypes  # noqa: E402
+from helpers import MAIN_DRIVE  # noqa: E402
+from journal import FSYNC_POLICIES, Journal  # noqa: E402
+
+
+def run_operations(file_system: FileSystem, operations: int) -> None:
+    """
+    Run a mix of creates and writes, in equal parts
+    :param file_system: FileSystem - The journaled file system
+    :param operations: int - The number of mutations to run
+    """
+    for i in range(operations // 2):
+        file_system.create(EntityTypes.TEXT_FILE, f'file{i}', MAIN_DRIVE)
+        file_system.write_to_file(os.path.join(MAIN_DRIVE, f'file{i}'), 'x' * 64)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--operations', type=int, default=2000)
+    args = parser.parse_args()
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        for policy in (None,) + FSYNC_POLICIES:
+            journal = Journal(os.path.join(temp_dir, f'{policy}.journal'), policy) if policy else None
+            file_system = FileSystem(journal)
+            started = time.perf_counter()
+            run_operations(file_system, args.operations)
+            if journal is not None:
+                journal.close()
+            elapsed = time.perf_counter() - started
+            print(f'{policy or "no journal":<10} {args.operations / elapsed:>12.0f} ops/sec')
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    main()
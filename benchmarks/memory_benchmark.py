@@ -0,0 +1,56 @@
+"""
+Reports the memory used per file system node (entity) for a synthetic tree
+
+    python benchmarks/memory_benchmark.py --folders 1000 --files-per-folder 100
+"""
+import argparse
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from file_system import FileSystem  # noqa: E402
+from file_system_entities.entity_types_enum import EntityTypes  # noqa: E402
+from helpers import MAIN_DRIVE  # noqa: E402
+
+
+def build_tree(file_system: FileSystem, folders: int, files_per_folder: int) -> int:
+    """
+    Build a two level tree of folders containing empty text files
+    :param file_system: FileSystem - The file system to build the tree in
+    :param folders: int - The number of folders under the main drive
+    :param files_per_folder: int - The number of text files in each folder
+    :return: int - The number of nodes created
+    """
+    with file_system.batch() as batch:
+        for i in range(folders):
+            folder_path = os.path.join(MAIN_DRIVE, f'folder{i}')
+            batch.create(EntityTypes.FOLDER, f'folder{i}', MAIN_DRIVE)
+            batch.bulk_create((EntityTypes.TEXT_FILE, f'file{j}', folder_path) for j in range(files_per_folder))
+
+    return folders * (files_per_folder + 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--folders', type=int, default=1000)
+    parser.add_argument('--files-per-folder', type=int, default=100)
+    args = parser.parse_args()
+
+    file_system = FileSystem()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    nodes = build_tree(file_system, args.folders, args.files_per_folder)
+    # Only the nodes themselves are measured, not the path index entries cached for them while building
+    file_system._path_index.clear()
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f'nodes:          {nodes}')
+    print(f'bytes per node: {(after - before) / nodes:.1f}')
+    print(f'peak bytes:     {peak - before}')
+
+
+if __name__ == '__main__':
+    main()
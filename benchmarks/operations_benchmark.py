@@ -0,0 +1,202 @@
+"""
+Reports the latency and throughput of every FileSystem operation, and the peak memory of building the tree, for a
+synthetic tree of configurable depth, fanout and content size.  Results are written as JSON, to compare commits
+
+    python benchmarks/operations_benchmark.py --depth 3 --fanout 10 --content-size 256 --output results.json
+
+The tree has `fanout` folders under the main drive, `fanout` folders under each of those, and so on down to `depth`
+levels of folders; each folder of the last level holds `fanout` text files of `content-size` characters.  Deep and
+narrow trees (e.g. --depth 200 --fanout 1) expose costs that grow with the depth of the paths, and shallow, wide
+ones (e.g. --depth 1 --fanout 20000) costs that grow with the number of siblings
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Sequence
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from end_user import pprint_tree  # noqa: E402
+from file_system import FileSystem  # noqa: E402
+from file_system_entities.entity_types_enum import EntityTypes  # noqa: E402
+from helpers import MAIN_DRIVE, file_path  # noqa: E402
+
+PERCENTILES = (50, 90, 99)
+
+
+def build_tree(file_system: FileSystem, depth: int, fanout: int, content_size: int) -> Dict[str, List[str]]:
+    """
+    Build the synthetic tree (see the module docstring)
+    :param file_system: FileSystem - The file system to build the tree in
+    :param depth: int - The number of levels of folders
+    :param fanout: int - The number of children of every folder
+    :param content_size: int - The length of the content of every text file
+    :return: Dict[str, List[str]] - The paths of the 'folders' of the last level, and of the 'files'
+    """
+    content = 'x' * content_size
+    level = [MAIN_DRIVE]
+    with file_system.batch() as batch:
+        for _ in range(depth):
+            next_level = []
+            for parent_path in level:
+                batch.bulk_create((EntityTypes.FOLDER, f'folder{i}', parent_path) for i in range(fanout))
+                next_level.extend(file_path(parent_path, f'folder{i}') for i in range(fanout))
+            level = next_level
+
+        files = []
+        for parent_path in level:
+            batch.bulk_create((EntityTypes.TEXT_FILE, f'file{i}', parent_path) for i in range(fanout))
+            files.extend(file_path(parent_path, f'file{i}') for i in range(fanout))
+        if content:
+            for path in files:
+                batch.write_to_file(path, content)
+
+    return {'folders': level, 'files': files}
+
+
+def measure(operation: Callable, arguments: Sequence[tuple]) -> Dict:
+    """
+    Time an operation once per set of arguments
+    :param operation: Callable - The operation
+    :param arguments: Sequence[tuple] - The arguments of each call
+    :return: Dict - The number of operations, their total time, their throughput and latency percentiles
+    """
+    latencies = []
+    for args in arguments:
+        start = time.perf_counter()
+        operation(*args)
+        latencies.append(time.perf_counter() - start)
+
+    latencies.sort()
+    total = sum(latencies)
+    result = {
+        'operations': len(latencies),
+        'total_seconds': total,
+        'ops_per_sec': len(latencies) / total if total else None,
+        'latency_us': {},
+    }
+    for percentile in PERCENTILES:
+        index = min(len(latencies) - 1, len(latencies) * percentile // 100)
+        result['latency_us'][f'p{percentile}'] = latencies[index] * 1e6 if latencies else None
+    result['latency_us']['max'] = latencies[-1] * 1e6 if latencies else None
+
+    return result
+
+
+def measure_memory(depth: int, fanout: int, content_size: int) -> Dict:
+    """
+    Build the tree again with allocation tracing on
+    :return: Dict - The number of nodes, and the peak and retained bytes of building the tree
+    """
+    file_system = FileSystem()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    paths = build_tree(file_system, depth, fanout, content_size)
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    nodes = sum(fanout ** level for level in range(1, depth + 1)) + len(paths['files'])
+
+    return {
+        'nodes': nodes,
+        'peak_bytes': peak - before,
+        'retained_bytes': after - before,
+        'bytes_per_node': (after - before) / nodes if nodes else None,
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(depth: int, fanout: int, content_size: int, operations: int, seed: int, memory: bool = True) -> Dict:
+    """
+    Run the whole benchmark
+    :param depth: int - The number of levels of folders
+    :param fanout: int - The number of children of every folder
+    :param content_size: int - The length of the content of every text file
+    :param operations: int - The number of calls of each operation
+    :param seed: int - The seed of the random choice of paths
+    :param memory: bool - Whether to measure the peak memory as well
+    :return: Dict - The JSON-serializable results
+    """
+    rng = random.Random(seed)
+    file_system = FileSystem()
+    start = time.perf_counter()
+    paths = build_tree(file_system, depth, fanout, content_size)
+    build_seconds = time.perf_counter() - start
+    folders, files = paths['folders'], paths['files']
+    content = 'y' * content_size
+
+    created = [(EntityTypes.TEXT_FILE, f'new_file{i}', rng.choice(folders)) for i in range(operations)]
+    created_paths = [file_path(parent_path, name) for _, name, parent_path in created]
+    moved_paths = [file_path(rng.choice(folders), f'moved_file{i}') for i in range(operations)]
+
+    results = {
+        'create': measure(file_system.create, created),
+        'find_node_by_path': measure(file_system.find_node_by_path, [(rng.choice(files),) for _ in range(operations)]),
+        'write_to_file': measure(file_system.write_to_file,
+                                 [(rng.choice(files), content) for _ in range(operations)]),
+        'move': measure(file_system.move, list(zip(created_paths, moved_paths))),
+        'delete': measure(file_system.delete, [(path,) for path in moved_paths]),
+    }
+    # Lookups that miss the path index walk the tree from the drive
+    cold_paths = [(rng.choice(files),) for _ in range(operations)]
+
+    def find_cold(path: str):
+        file_system._path_index.clear()
+        return file_system.find_node_by_path(path)
+
+    results['find_node_by_path_cold'] = measure(find_cold, cold_paths)
+
+    def render():
+        pprint_tree(file_system.get_root_node(), file=io.StringIO())
+
+    results['pprint_tree'] = measure(render, [()] * max(1, min(operations // 100, 10)))
+
+    report = {
+        'config': {'depth': depth, 'fanout': fanout, 'content_size': content_size, 'operations': operations,
+                   'seed': seed},
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'commit': git_commit()},
+        'build_seconds': build_seconds,
+        'results': results,
+    }
+    if memory:
+        report['memory'] = measure_memory(depth, fanout, content_size)
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--fanout', type=int, default=10)
+    parser.add_argument('--content-size', type=int, default=256)
+    parser.add_argument('--operations', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', dest='memory', action='store_false', help='Skip the peak memory measurement')
+    parser.add_argument('--output', help='Write the JSON results to this file rather than to stdout')
+    args = parser.parse_args()
+
+    report = run(args.depth, args.fanout, args.content_size, args.operations, args.seed, args.memory)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
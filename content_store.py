@@ -0,0 +1,268 @@
+"""
+Content stores hold the contents of text files behind immutable content handles.
+
+ChunkedContentStore splits every content into fixed-size chunks, stored once per distinct chunk (content-addressed,
+reference counted), so that identical bodies share their memory, appends only build the chunks past the end of the
+content and ranged writes and reads only touch the chunks they overlap.  A chunk is released once no handle
+refers to it anymore; handles retained by snapshots or batch undo logs keep their chunks alive.  Contents shorter
+than a chunk are kept inline as a plain str, since a handle would cost more than they do.
+"""
+import collections
+import hashlib
+import threading
+import weakref
+from typing import Dict, List, Sequence, Tuple, Union
+
+# Contents are cut into chunks of this many characters (the last chunk of a content may be shorter)
+CHUNK_SIZE = 4096
+
+
+class ContentHandle:
+    __slots__ = ('store', 'keys', 'length', '__weakref__')
+
+    def __init__(self, store: 'ContentStore', keys: Tuple, length: int):
+        """
+        An immutable reference to a content held by a content store
+        :param store: ContentStore - The store holding the content
+        :param keys: Tuple - The store-specific keys of the content
+        :param length: int - The length of the content
+        """
+        self.store = store
+        self.keys = keys
+        self.length = length
+
+    def __len__(self) -> int:
+        return self.length
+
+    def read(self, start: int = 0, end: int = None) -> str:
+        """
+        Read the content, or a range of it, like content[start:end]
+        :param start: int
+        :param end: int
+        :return: str
+        """
+        return self.store.read(self, start, end)
+
+
+Content = Union[str, ContentHandle]
+
+
+class ContentStore:
+    """
+    Base class of the content stores.  A store only needs to implement put and read; appends and ranged writes
+    fall back to rewriting the whole content
+    """
+    def put(self, content: str) -> Content:
+        """
+        Store a content
+        :param content: str
+        :return: Content - A handle, or the str itself if the store keeps it inline
+        """
+        raise NotImplementedError
+
+    def read(self, handle: ContentHandle, start: int = 0, end: int = None) -> str:
+        """
+        Read a content, or a range of it, like content[start:end]
+        :param handle: ContentHandle - A handle from this store
+        :param start: int
+        :param end: int
+        :return: str
+        """
+        raise NotImplementedError
+
+    def append(self, content: Content, appended: str) -> Content:
+        """
+        Get a content with text appended to it.  The original content is left untouched
+        :param content: Content - A handle from any store, or a str
+        :param appended: str - The text to be appended
+        :return: Content
+        """
+        return self.put(self._read_all(content) + appended)
+
+    def write_range(self, content: Content, offset: int, written: str) -> Content:
+        """
+        Get a content with text written over it from an offset, extending it if needed.  The original content is
+        left untouched
+        :param content: Content - A handle from any store, or a str
+        :param offset: int - Where to start writing; at most the length of the content
+        :param written: str - The text to be written
+        :return: Content
+        :raises ValueError - If offset is negative or past the end of the content
+        """
+        check_offset(content, offset)
+        text = self._read_all(content)
+        return self.put(text[:offset] + written + text[offset + len(written):])
+
+    def _own(self, content: Content) -> ContentHandle:
+        """
+        Get a handle from this store for a content
+        :param content: Content - A handle from any store, or a str
+        :return: ContentHandle
+        """
+        if isinstance(content, ContentHandle) and content.store is self:
+            return content
+        return self.put(self._read_all(content))
+
+    @staticmethod
+    def _read_all(content: Content) -> str:
+        return content.read() if isinstance(content, ContentHandle) else content
+
+
+def check_offset(content: Content, offset: int) -> None:
+    """
+    Check that a ranged write may start at an offset of a content
+    :param content: Content - A handle or a str
+    :param offset: int
+    :raises ValueError - If offset is negative or past the end of content
+    """
+    if offset < 0 or offset > len(content):
+        raise ValueError(f'Offset {offset} is out of range for a content of length {len(content)}')
+
+
+class ChunkedContentStore(ContentStore):
+    def __init__(self, chunk_size: int = CHUNK_SIZE):
+        """
+        An in-memory, content-addressed and deduplicated chunk store.  Every chunk of a content but the last one
+        is exactly chunk_size long, so identical contents always share all of their chunks.  Contents shorter than
+        chunk_size are not stored, but returned as they are
+        :param chunk_size: int - The length of the chunks, in characters
+        """
+        self.chunk_size = chunk_size
+        # Chunk digest => [chunk, number of handles referring to it]
+        self._chunks: Dict[bytes, List] = {}
+        self._lock = threading.Lock()
+        # The keys of the handles collected since the queue was last drained.  Finalizers may run from the garbage
+        # collector while this thread holds the lock, so they never take it themselves (see _release)
+        self._released: collections.deque = collections.deque()
+
+    def __len__(self) -> int:
+        """
+        :return: int - The number of distinct chunks stored
+        """
+        with self._lock:
+            self._drain_released()
+        return len(self._chunks)
+
+    def put(self, content: str) -> Content:
+        if len(content) < self.chunk_size:
+            return content
+        return self._handle([], content, 0)
+
+    def read(self, handle: ContentHandle, start: int = 0, end: int = None) -> str:
+        start, end, _ = slice(start, end).indices(handle.length)
+        if start >= end:
+            return ''
+
+        first, last = start // self.chunk_size, (end - 1) // self.chunk_size
+        chunks = self._chunks
+        text = ''.join(chunks[key][0] for key in handle.keys[first:last + 1])
+        offset = first * self.chunk_size
+
+        return text[start - offset:end - offset]
+
+    def append(self, content: Content, appended: str) -> Content:
+        """
+        Get a content with text appended to it, only rebuilding its last chunk and the chunks after it
+        """
+        if len(content) + len(appended) < self.chunk_size:
+            return self._read_all(content) + appended
+        handle = self._own(content)
+        if not appended:
+            return handle
+
+        keys = list(handle.keys)
+        base = len(keys) * self.chunk_size
+        if handle.length < base:
+            # Complete the partial last chunk
+            base -= self.chunk_size
+            appended = self._chunks[keys.pop()][0] + appended
+
+        return self._handle(keys, appended, base)
+
+    def write_range(self, content: Content, offset: int, written: str) -> Content:
+        """
+        Get a content with text written over it from an offset, only rebuilding the chunks the text overlaps
+        """
+        check_offset(content, offset)
+        if max(len(content), offset + len(written)) < self.chunk_size:
+            text = self._read_all(content)
+            return text[:offset] + written + text[offset + len(written):]
+        handle = self._own(content)
+        if not written:
+            return handle
+
+        end = offset + len(written)
+        first, last = offset // self.chunk_size, (end - 1) // self.chunk_size
+        base = first * self.chunk_size
+        text = self.read(handle, base, offset) + written + self.read(handle, end, (last + 1) * self.chunk_size)
+
+        return self._handle(list(handle.keys[:first]), text, base, handle.keys[last + 1:], handle.length)
+
+    def _handle(self, prefix: List[bytes], text: str, base: int, suffix: Sequence[bytes] = (),
+                length: int = 0) -> ContentHandle:
+        """
+        Build a handle from the chunks of an existing content and new text, and take references to its chunks
+        :param prefix: List[bytes] - Keys of existing chunks, before the text
+        :param text: str - The new text, starting on a chunk boundary
+        :param base: int - The offset of the text in the content (the length of the prefix chunks)
+        :param suffix: Sequence[bytes] - Keys of existing chunks, after the text
+        :param length: int - The length of the whole content, if the suffix isn't empty
+        :return: ContentHandle
+        """
+        size = self.chunk_size
+        keys = prefix
+        with self._lock:
+            self._drain_released()
+            for start in range(0, len(text), size):
+                keys.append(self._intern(text[start:start + size]))
+            keys.extend(suffix)
+            for key in keys:
+                self._chunks[key][1] += 1
+        handle = ContentHandle(self, tuple(keys), max(length, base + len(text)))
+        weakref.finalize(handle, self._release, handle.keys)
+
+        return handle
+
+    def _intern(self, chunk: str) -> bytes:
+        """
+        Store a chunk, unless an identical chunk is already stored.  Must be called while holding the lock
+        :param chunk: str
+        :return: bytes - The key of the chunk
+        """
+        key = hashlib.sha1(chunk.encode('utf-8', 'surrogatepass')).digest()
+        if key not in self._chunks:
+            self._chunks[key] = [chunk, 0]
+
+        return key
+
+    def _own(self, content: Content) -> ContentHandle:
+        if isinstance(content, ContentHandle) and content.store is self:
+            return content
+        # Unlike put, always chunk the content, even a short one
+        return self._handle([], self._read_all(content), 0)
+
+    def _release(self, keys: Tuple[bytes, ...]) -> None:
+        """
+        Called when a handle is collected: queue the references of the handle to its chunks to be dropped, and drop
+        them at once unless the lock is held (it is then drained by the next operation)
+        :param keys: Tuple[bytes, ...] - The keys of the chunks of the handle
+        """
+        self._released.append(keys)
+        if self._lock.acquire(blocking=False):
+            try:
+                self._drain_released()
+            finally:
+                self._lock.release()
+
+    def _drain_released(self) -> None:
+        """
+        Drop the queued references of collected handles to their chunks, and every chunk no handle refers to anymore.
+        Must be called while holding the lock
+        """
+        released = self._released
+        while released:
+            for key in released.popleft():
+                entry = self._chunks[key]
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._chunks[key]
@@ -0,0 +1,2 @@
+class CorruptSnapshotError(Exception):
+    pass
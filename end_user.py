@@ -2,22 +2,18 @@
 This is a helper module that can assist with interaction with the File System
 """
 import os
+from typing import TextIO
 
 from file_system_entities.entity_types_enum import EntityTypes
 from file_system import FileSystem, MAIN_DRIVE
 from file_system_entities.file_system_entities import FileSystemEntity
+from tree_walk import render_tree
 
 file_system = FileSystem()
 
 
-def pprint_tree(node: FileSystemEntity, file: str = None, _prefix: str = "", _last: bool = True):
-    print(_prefix, "|- ", f"{node.name} ({node.size})", sep="", file=file)
-    _prefix += "   " if _last else "|  "
-    if hasattr(node, 'children'):
-        child_count = len(node.children)
-        for i, child in enumerate(node.children.values()):
-            _last = i == (child_count - 1)
-            pprint_tree(child, file, _prefix, _last)
+def pprint_tree(node: FileSystemEntity, file: TextIO = None, max_depth: int = None):
+    render_tree(node, file, max_depth)
 
 
 if __name__ == "__main__":
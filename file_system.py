@@ -1,26 +1,266 @@
+import asyncio
 import enum
 import errno
 import os
-from pathlib import Path
-from typing import List, Dict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
 
+from batch import FileSystemBatch
+from content_store import ChunkedContentStore, Content, ContentStore
 from file_system_entities.entity_factory import FileSystemEntityFactory
 from file_system_entities.entity_types_enum import EntityTypes
-from helpers import file_path, recursive_size_update, MAIN_DRIVE, get_parent_path_and_name, valid_move_operation
-from file_system_entities.file_system_entities import FileSystemEntity, Drive, TextFile
+from helpers import file_path, propagate_size_delta, MAIN_DRIVE, get_parent_path_and_name, valid_move_operation, \
+    normalize_path, drive_name
+from file_system_entities.file_system_entities import FileSystemEntity, Drive, PathCache, TextFile
 from illegal_file_system_operation import IllegalFileSystemOperation
+from journal import Journal, OP_APPEND, OP_CREATE, OP_CREATE_DRIVE, OP_DELETE, OP_DELETE_DRIVE, OP_MOVE, OP_WRITE, \
+    OP_WRITE_RANGE
+from locking import LockManager, NullLockManager, NULL_CONTEXT
+from metrics import Metrics, NullMetrics, instrumented
 from not_a_text_file_error import NotATextFileError
+from reclaimer import Reclaimer
+from secondary_indexes import NullSecondaryIndexes, SecondaryIndexes
+from snapshot import SnapshotReader, write_snapshot
+from tree_import import build_tree
+from tree_walk import TreeEntry, iter_tree
+from versioning import FileSystemSnapshot, VersionStore
+from watching import CREATED, DELETED, MODIFIED, MOVED, Event, NullWatchManager, Watch, WatchManager
+from zip_compression import CompressedZipFile, ZipCache, ZIP_CACHE_SIZE, compressed_size, containing_zip, evict, \
+    is_compressed, member_size_delta, subtree_compressed_size
 
 
 class FileSystem:
-    def __init__(self):
+    def __init__(self, journal: Journal = None, concurrent: bool = False, indexed: bool = False,
+                 content_store: ContentStore = None, zip_codec: str = None, zip_cache_size: int = ZIP_CACHE_SIZE,
+                 metrics: bool = False):
         """
         Initialize the File System instance
+        :param journal: Journal - An optional journal every mutation is recorded to (see attach_journal)
+        :param concurrent: bool - Whether the file system is shared between threads, in which case mutations take
+                fine-grained locks (see the locking module); lookups never lock
+        :param indexed: bool - Whether to maintain the secondary indexes used by find() (see enable_indexes)
+        :param content_store: ContentStore - Where the contents of text files are kept; a deduplicating
+                ChunkedContentStore by default
+        :param zip_codec: str - 'zlib' or 'lzma' to have the zip files created from now on really compress their
+                subtree and report its true compressed size (see the zip_compression module); by default, the size
+                of a zip file is half the size of its children
+        :param zip_cache_size: int - How many compressed zip files may stay decompressed in memory (see
+                trim_zip_cache)
+        :param metrics: bool - Whether to count and time every operation (see enable_metrics)
         """
-        self.drives: Dict[str, FileSystemEntity] = {
+        self.journal: Optional[Journal] = journal
+        # The LSN of the last journal record the tree reflects, while no journal is attached (see journal.py)
+        self.journal_lsn: int = 0
+        self.concurrent: bool = concurrent
+        self.content_store: ContentStore = content_store if content_store is not None else ChunkedContentStore()
+        self._locks = LockManager() if concurrent else NullLockManager()
+        self._versions = VersionStore()
+        self._indexes = NullSecondaryIndexes()
+        self.metrics = Metrics() if metrics else NullMetrics()
+        self._watches = NullWatchManager()
+        self.zip_codec: Optional[str] = zip_codec
+        self._zip_cache_size = zip_cache_size
+        self._zip_cache = ZipCache(zip_cache_size, self._on_zip_load) if zip_codec else None
+        # The memoized paths of the entities of the file system, referred to by its drives.  Its generations also
+        # tell which path index entries are stale, see _bump_topology
+        self.path_cache = PathCache()
+        # The batch currently collecting mutations, if any (see batch())
+        self._batch: Optional[FileSystemBatch] = None
+        self._reclaimer = Reclaimer(self._reclaim, self._sweep)
+        self._set_drives({
             MAIN_DRIVE: Drive(EntityTypes.DRIVE, MAIN_DRIVE)
+        })
+        if indexed:
+            self.enable_indexes()
+
+    def _set_drives(self, drives: Dict[str, FileSystemEntity]) -> None:
+        """
+        Replace all the drives of the file system
+        :param drives: Dict[str, FileSystemEntity] - The new drives, by name
+        """
+        self.drives: Dict[str, FileSystemEntity] = drives
+        for drive in drives.values():
+            drive.path_cache = self.path_cache
+        generation = self._bump_topology()
+        # Flat map of normalized path => (node, path cache generation at which the entry was known to be valid)
+        self._path_index: Dict[str, Tuple[FileSystemEntity, int]] = {
+            normalize_path(drive.path): (drive, generation) for drive in drives.values()
         }
+        if self.indexed:
+            self._indexes = SecondaryIndexes()
+            for drive in drives.values():
+                self._indexes.add_subtree(drive)
+
+    def _bump_topology(self, *paths: str) -> int:
+        """
+        Record that the paths of some nodes changed (a subtree was moved, detached or re-attached), so that the
+        path index entries and the memoized paths at or under their former paths are revalidated, and have the
+        stale ones swept in the background
+        :param paths: str - The normalized former paths of the subtrees, or none if any path may have changed
+        :return: int - The new path cache generation
+        """
+        generation = self.path_cache.invalidate(*paths)
+        if paths:
+            self._reclaimer.request_sweep()
+
+        return generation
+
+    @property
+    def indexed(self) -> bool:
+        return isinstance(self._indexes, SecondaryIndexes)
+
+    def enable_indexes(self) -> None:
+        """
+        Start maintaining the secondary indexes (by name, by type and by size) used by find().  Indexing the
+        existing tree walks all of it once (which builds every node of a loaded snapshot); from then on every
+        mutation keeps the indexes up to date, at a small cost per size update
+        """
+        with self._locks.tree.exclusive():
+            if self.indexed:
+                return
+            indexes = SecondaryIndexes()
+            for drive in self.drives.values():
+                indexes.add_subtree(drive)
+            self._indexes = indexes
+
+    def enable_metrics(self) -> Metrics:
+        """
+        Start counting and timing every create/delete/move/write/lookup, along with the nodes visited by lookups
+        walking the tree and the ancestors updated by size propagation.  Hooks and sampled profiling are set up on
+        the returned Metrics, and metrics.export() snapshots everything as plain dicts
+        :return: Metrics - The metrics of the file system
+        """
+        if not self.metrics.enabled:
+            self.metrics = Metrics()
+
+        return self.metrics
+
+    def watch(self, path: str, callback: Callable[[List[Event]], None], recursive: bool = True,
+              loop: asyncio.AbstractEventLoop = None) -> Watch:
+        """
+        Get notified of the changes to a subtree made from now on: nodes created, deleted, moved or modified (text
+        files written to, and the size of the watched node itself), including the watched node being deleted or
+        moved along with an ancestor.  Mutations only enqueue their change; the changes are coalesced and delivered
+        in batches by a dispatcher thread (see the watching module).  The changes made by a batch() are only
+        delivered once it succeeds
+        :param path: str - The path of the watched node; it doesn't need to exist yet
+        :param callback: Callable[[List[Event]], None] - Called with each batch of events
+        :param recursive: bool - Whether to watch the whole subtree, or only the node and its children
+        :param loop: asyncio.AbstractEventLoop - If given, the callback is called on this event loop (e.g. to put
+                the events in an asyncio.Queue) rather than on the dispatcher thread
+        :return: Watch - Call its cancel() to stop watching
+        """
+        with self._locks.tree.exclusive():
+            if not self._watches.enabled:
+                self._watches = WatchManager(self.find_node_by_path)
+
+        return self._watches.add(normalize_path(path), callback, recursive, loop)
+
+    def wait_for_watchers(self) -> None:
+        """
+        Block until the changes made so far have been delivered to the watches, then raise the first error raised by
+        a callback since the last call, if any
+        """
+        self._watches.wait()
+
+    def _notify(self, kind: str, path: str, dest_path: str = None, node: FileSystemEntity = None) -> None:
+        """
+        Enqueue a change for the watches, or hold it back until the current batch succeeds
+        :param kind: str - One of the watching event kinds
+        :param path: str - The normalized path of the changed node (its former path, for a move)
+        :param dest_path: str - The normalized new path of a moved node
+        :param node: FileSystemEntity - The changed node
+        """
+        if not self._watches.enabled:
+            return
+        if self._batch is not None:
+            self._batch.changes.append((kind, path, dest_path, node))
+        else:
+            self._watches.emit(kind, path, dest_path, node)
+
+    def find(self, name: str = None, type: enum.Enum = None, min_size: int = None, max_size: int = None,
+             largest: int = None) -> List[FileSystemEntity]:
+        """
+        Find the nodes matching every given criterion, without walking the tree if the file system is indexed
+        (see enable_indexes), or with a full walk otherwise
+        :param name: str - The exact name of the nodes
+        :param type: enum.Enum - The ID of the node type from the entity types enum
+        :param min_size: int - The minimum size of the nodes (inclusive)
+        :param max_size: int - The maximum size of the nodes (inclusive)
+        :param largest: int - Only return this many nodes, the largest first (e.g. the 10 largest zip files)
+        :return: List[FileSystemEntity] - Ordered by size (largest first if largest is given, smallest first
+                otherwise) unless only name and/or type are given
+        """
+        if self.indexed:
+            if not self._reclaimer.pending and not (self._batch is not None and self._batch.deleted):
+                return self._indexes.find(name, type, min_size, max_size, largest)
+            # Deleted nodes are only deregistered by the reclaimer, so they may still be indexed
+            found = self._indexes.find(name, type, min_size, max_size)
+            found = [node for node in found if self._resolve_path(node) is not None]
+            if largest is not None:
+                return sorted(found, key=lambda node: node.size, reverse=True)[:largest]
+            return found
+
+        indexes = SecondaryIndexes()
+        for drive in self.drives.values():
+            for node, _, _ in iter_tree(drive):
+                indexes.add(node)
+        return indexes.find(name, type, min_size, max_size, largest)
+
+    def attach_journal(self, journal: Optional[Journal]) -> None:
+        """
+        Record every subsequent create/delete/move/write_to_file to a journal, or stop recording if None.
+        Mutations made inside a batch are only recorded, as one group, once the batch succeeds
+        :param journal: Journal - The journal
+        """
+        if self.journal is not None:
+            self.journal_lsn = self.journal.lsn
+        self.journal = journal
+
+    def _record(self, op: int, *args) -> None:
+        """
+        Record a successful mutation to the journal, if any
+        :param op: int - One of the journal OP_* codes
+        :param args: The arguments of the mutation
+        """
+        if self.journal is None:
+            return
+        if self._batch is not None:
+            self._batch.record_journal(op, *args)
+        else:
+            self.journal.append(op, *args)
+
+    def save(self, path: str) -> None:
+        """
+        Save the whole file system to a binary snapshot file.  In concurrent mode, mutations wait until it is written
+        :param path: str - The path of the snapshot file on disk
+        """
+        # Holding the tree lock exclusively, the snapshot reflects exactly the mutations journaled so far
+        with self._locks.tree.exclusive():
+            journal_lsn = self.journal.lsn if self.journal is not None else self.journal_lsn
+            write_snapshot(self.drives, path, journal_lsn)
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> 'FileSystem':
+        """
+        Load a file system from a binary snapshot file.  The file is memory-mapped and only the drives are built
+        upfront; every other node, and the content of every text file, is built on first access
+        :param path: str - The path of the snapshot file on disk
+        :param kwargs: Passed on to the FileSystem constructor
+        :return: FileSystem
+        :raises CorruptSnapshotError
+        """
+        file_system = cls(**kwargs)
+        reader = SnapshotReader(path)
+        file_system._set_drives(reader.read_drives())
+        file_system.journal_lsn = reader.journal_lsn
+        if reader.has_compressed_zips and file_system._zip_cache is None:
+            # Keep the compressed sizes of the loaded zip files up to date, even if new ones won't be compressed
+            file_system._zip_cache = ZipCache(file_system._zip_cache_size, file_system._on_zip_load)
 
+        return file_system
+
+    @instrumented('create')
     def create(self, type: enum.Enum, name: str, parent_path: str = None) -> FileSystemEntity:
         """
         Creates a file system node (entity)
@@ -30,73 +270,347 @@ class FileSystem:
         :return: FileSystemEntity
         :raises FileNotFoundError, FileExistsError, IllegalFileSystemOperation
         """
-        parent_node = self.find_node_by_path(parent_path)
+        if type == EntityTypes.DRIVE:
+            if parent_path is not None:
+                raise IllegalFileSystemOperation('A drive cannot be contained in any entity')
+            return self.create_drive(name)
+
+        with self._lock_paths(parent_path):
+            new_entity = self._create_child(type, name, self.find_node_by_path(parent_path), parent_path)
+        self._trim_zip_cache()
+
+        return new_entity
 
+    def _create_child(self, type: enum.Enum, name: str, parent_node: Optional[FileSystemEntity],
+                      parent_path: str) -> FileSystemEntity:
+        """
+        Creates a file system node (entity) under an already resolved parent node
+        :param type: enum.Enum - The ID of the file system node type from the entity types enum
+        :param name: str - The name of the file system node (entity)
+        :param parent_node: FileSystemEntity - The parent file system node (entity), or None if it wasn't found
+        :param parent_path: str - Path of the parent file system node (entity)
+        :return: FileSystemEntity
+        :raises FileNotFoundError, FileExistsError, IllegalFileSystemOperation
+        """
         # If the parent path doesn't exist
         if not parent_node:
             raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), parent_path)
-        # If object to be created already exists
-        if hasattr(parent_node, 'children') and parent_node.children.get(name):
-            raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), file_path(parent_node.path, name))
 
-        new_entity = FileSystemEntityFactory.for_type(type)(type, name, parent_node)
+        with self._locks.node(parent_node):
+            # If object to be created already exists
+            if hasattr(parent_node, 'children') and parent_node.children.get(name):
+                raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), file_path(parent_node.path, name))
+
+            if type == EntityTypes.ZIP_FILE and self.zip_codec:
+                new_entity = CompressedZipFile(type, name, parent_node, self.zip_codec)
+            else:
+                new_entity = FileSystemEntityFactory.for_type(type)(type, name, parent_node)
+            if not new_entity:
+                return new_entity
 
-        if new_entity:
-            self.insert_node(new_entity, parent_node)
-            recursive_size_update(new_entity)
+        self._attach_subtree(new_entity, parent_node, parent_path)
 
         return new_entity
 
+    def _attach_subtree(self, root: FileSystemEntity, parent_node: FileSystemEntity, parent_path: str) -> None:
+        """
+        Insert a new node, along with any descendants it was built with, under a parent node: register and journal
+        the whole subtree and propagate its size, which must already be correct
+        :param root: FileSystemEntity - The root of the detached subtree
+        :param parent_node: FileSystemEntity - The parent file system node (entity)
+        :param parent_path: str - Path of the parent file system node (entity)
+        :raises FileNotFoundError, FileExistsError, IllegalFileSystemOperation
+        """
+        name = root.name
+        key = file_path(normalize_path(parent_path), name)
+        with self._locks.node(parent_node):
+            # Read before checking that the parent is attached: if an ancestor is deleted after the check, its path
+            # is invalidated with a later generation, and the index entry below is revalidated rather than trusted
+            generation = self.path_cache.generation
+            self._check_attached(parent_node, parent_path)
+            self._versions.preserve_child(parent_node, name)
+            self.insert_node(root, parent_node)
+            if root.parent is not parent_node:
+                root.parent = parent_node
+                self._bump_topology(key)
+            self._path_index[key] = (root, generation)
+            self._indexes.add_subtree(root)
+            self._register_new_subtree(root, normalize_path(parent_path))
+            self._notify(CREATED, key, node=root)
+
+        self._apply_size_delta(parent_node, root.size)
+        self._update_zips(parent_node, lambda zip_file: subtree_compressed_size(zip_file, root))
+
+        if self._batch is not None:
+            def undo_attach():
+                self._versions.preserve_child(parent_node, name)
+                parent_node.remove_child(name)
+                self._versions.preserve(root)
+                root.parent = None
+                self._bump_topology(key)
+                self._path_index.pop(key, None)
+                self._indexes.remove_subtree(root)
+                self._apply_size_delta(parent_node, -root.size)
+            self._batch.record_undo(undo_attach)
+
+    def _register_new_subtree(self, root: FileSystemEntity, parent_path: str) -> None:
+        """
+        Journal the creation of a new subtree node by node, parents first, and hand its compressed zip files over
+        to the zip cache
+        :param root: FileSystemEntity - The root of the new subtree
+        :param parent_path: str - The normalized path of its parent
+        """
+        if self.journal is None and self._zip_cache is None:
+            return
+
+        stack = [(root, parent_path)]
+        while stack:
+            node, node_parent_path = stack.pop()
+            node_path = file_path(node_parent_path, node.name)
+            self._record(OP_CREATE, node.type, node.name, node_parent_path)
+            if isinstance(node, TextFile) and node.size:
+                self._record(OP_WRITE, node_path, node.content)
+            if isinstance(node, CompressedZipFile):
+                self._zip_cache.touch(node)
+            if not is_compressed(node):
+                stack.extend((child, node_path) for child in reversed(list(getattr(node, 'children', {}).values())))
+
+    @instrumented('import')
+    def import_tree(self, source: str, parent_path: str = MAIN_DRIVE, workers: int = None,
+                    executor: str = 'process') -> List[FileSystemEntity]:
+        """
+        Import a real directory tree, or a JSONL/CSV manifest of entities, under a node.  The directories are
+        listed and the files read by a pool of workers, the imported subtrees are built detached, and they are all
+        grafted in a single batch: either everything is imported or nothing is.  See the tree_import module
+        :param source: str - The path of a directory (its entries are imported, as folders and text files) or of a
+                .jsonl or .csv manifest
+        :param parent_path: str - Path of the node to import under
+        :param workers: int - The size of the pool
+        :param executor: str - 'process' or 'thread'
+        :return: List[FileSystemEntity] - The imported nodes directly under the parent node
+        :raises FileNotFoundError, FileExistsError, IllegalFileSystemOperation, ValueError
+        """
+        roots = build_tree(source, self.content_store.put, self.zip_codec, workers, executor)
+        with self.batch():
+            parent_node = self.find_node_by_path(parent_path)
+            if not parent_node:
+                raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), parent_path)
+            for root in roots:
+                self._attach_subtree(root, parent_node, parent_path)
+
+        return roots
+
+    @instrumented('delete')
     def delete(self, path: str) -> bool:
         """
-        Deletes a file system node (entity)
+        Deletes a file system node (entity).  The subtree is detached in O(depth), and deregistered from the
+        indexes and freed by a background reclaimer (see wait_for_reclaimer)
         :param path: str - Path of the parent file system node (entity)
         :return: bool
         :raises FileNotFoundError, FileExistsError, IllegalFileSystemOperation
         """
-        parent_path, name = get_parent_path_and_name(path)
-        parent_node = self.find_node_by_path(parent_path)
+        if normalize_path(path) in self.drives:
+            return self.delete_drive(path)
 
-        if parent_node and hasattr(parent_node, 'children'):
-            if name in parent_node.children and parent_node.children[name]:
-                del parent_node.children[name]
-                recursive_size_update(parent_node)
+        with self._lock_paths(path):
+            parent_path, name = get_parent_path_and_name(path)
+            parent_node = self.find_node_by_path(parent_path)
+            children = getattr(parent_node, 'children', None)
 
-                return True
+            node = children.get(name) if children is not None else None
+            while node is not None:
+                with self._locks.nodes(parent_node, node):
+                    # Retry if the node was replaced while its lock was being acquired
+                    if parent_node.children.get(name) is node:
+                        self._versions.preserve_child(parent_node, name)
+                        parent_node.remove_child(name)
+                        self._path_index.pop(normalize_path(path), None)
+                        # Detach the subtree in O(1), so that no size delta from within it can reach its former
+                        # ancestors; the cached paths of its descendants are revalidated on their next lookup
+                        self._versions.preserve(node)
+                        node.parent = None
+                        self._bump_topology(normalize_path(path))
+                        size = node.size
+                        self._record(OP_DELETE, normalize_path(path))
+                        self._notify(DELETED, normalize_path(path))
+                        break
+                node = parent_node.children.get(name)
 
-        raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+            if node is None:
+                raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), path)
 
+            self._apply_size_delta(parent_node, -size)
+            self._update_zips(parent_node, lambda zip_file: -subtree_compressed_size(zip_file, node, remove=True))
+
+            if self._batch is not None:
+                def undo_delete():
+                    self._versions.preserve(node)
+                    node.parent = parent_node
+                    self._bump_topology(normalize_path(path))
+                    self._versions.preserve_child(parent_node, name)
+                    parent_node.add_child(node)
+                    self._apply_size_delta(parent_node, node.size)
+                self._batch.record_undo(undo_delete)
+                # The subtree can only be torn down once the batch can no longer be rolled back
+                self._batch.deleted.append((node, normalize_path(path)))
+            else:
+                self._reclaimer.submit(node, normalize_path(path))
+
+        self._trim_zip_cache()
+        return True
+
+    @instrumented('move')
     def move(self, source_path: str, dest_path: str) -> FileSystemEntity:
         """
         Move a file system node (entity) to a new path
         :param source_path: str - The source path where the file was located previously
         :param dest_path: str - The destination path where the file is to be moved to
-        :return: FileSystemEntity - The new file system entity if moved successfully, else the old/current entity
+        :return: FileSystemEntity - The moved file system entity if moved successfully, else the old/current entity
+        :raises FileNotFoundError, FileExistsError, IllegalFileSystemOperation
         """
-        # Get the destination parent path and the destination name
-        dest_parent_path, dest_name = get_parent_path_and_name(dest_path)
-        source_node = self.find_node_by_path(source_path)
-        source_parent = source_node.parent
-        dest_parent_node = self.find_node_by_path(dest_parent_path)
+        with self._lock_paths(source_path, dest_path), self._locks.rename:
+            # Get the destination parent path and the destination name
+            dest_parent_path, dest_name = get_parent_path_and_name(dest_path)
+            source_node = self.find_node_by_path(source_path)
+            dest_parent_node = self.find_node_by_path(dest_parent_path)
 
-        if not valid_move_operation(dest_path, dest_name, dest_parent_node, source_path, source_node):
-            return source_node
+            if not valid_move_operation(dest_path, dest_name, dest_parent_node, source_path, source_node):
+                return source_node
+            if not hasattr(source_node, 'parent'):
+                raise IllegalFileSystemOperation('A drive cannot be moved')
+            if not hasattr(dest_parent_node, 'children'):
+                raise IllegalFileSystemOperation('Parent cannot contain any other entity')
 
-        new_entity = self.create(source_node.type, dest_name, dest_parent_path)
+            source_parent = source_node.parent
+            source_name = source_node.name
+            with self._locks.nodes(source_parent, dest_parent_node, source_node):
+                # See _attach_subtree
+                generation = self.path_cache.generation
+                # The source or the destination may have been deleted, or the destination created, by a concurrent
+                # operation
+                if source_parent is None or source_parent.children.get(source_name) is not source_node:
+                    raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), source_path)
+                self._check_attached(source_node, source_path)
+                self._check_attached(dest_parent_node, dest_parent_path)
+                if dest_parent_node.children.get(dest_name):
+                    raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), dest_path)
 
-        if hasattr(source_node, 'children'):
-            new_entity.children = source_node.children
+                self._relink(source_node, source_parent, dest_parent_node, dest_name, normalize_path(source_path))
+                size = source_node.size
+                self._path_index.pop(normalize_path(source_path), None)
+                self._path_index[normalize_path(dest_path)] = (source_node, generation)
+                self._record(OP_MOVE, normalize_path(source_path), normalize_path(dest_path))
+                self._notify(MOVED, normalize_path(source_path), normalize_path(dest_path), source_node)
 
-        if hasattr(source_node, 'content'):
-            new_entity.content = source_node.content
+            self._apply_move_delta(source_parent, dest_parent_node, size)
+            if containing_zip(source_parent) is containing_zip(dest_parent_node):
+                # Only the name of the node changes within the zip file
+                name_delta = len(dest_name.encode('utf-8')) - len(source_name.encode('utf-8'))
+                self._update_zips(dest_parent_node, lambda zip_file: name_delta)
+            else:
+                self._update_zips(source_parent,
+                                  lambda zip_file: -subtree_compressed_size(zip_file, source_node, remove=True))
+                self._update_zips(dest_parent_node, lambda zip_file: subtree_compressed_size(zip_file, source_node))
 
-        recursive_size_update(new_entity)
-        self.delete(source_path)
-        recursive_size_update(source_parent)
+            if self._batch is not None:
+                def undo_move():
+                    self._relink(source_node, dest_parent_node, source_parent, source_name, normalize_path(dest_path))
+                    self._apply_move_delta(dest_parent_node, source_parent, source_node.size)
+                self._batch.record_undo(undo_move)
 
-        return new_entity
+        self._trim_zip_cache()
+        return source_node
 
+    def _relink(self, node: FileSystemEntity, source_parent: FileSystemEntity, dest_parent: FileSystemEntity,
+                dest_name: str, source_path: str) -> None:
+        """
+        Re-link an existing node under a new parent and name; descendant paths follow from the parent links, and
+        only the ones under the former path of the node are invalidated
+        :param node: FileSystemEntity - The file system node (entity) to be moved
+        :param source_parent: FileSystemEntity - The current parent of node
+        :param dest_parent: FileSystemEntity - The new parent of node
+        :param dest_name: str - The new name of node
+        :param source_path: str - The normalized current path of node
+        """
+        self._versions.preserve_child(source_parent, node.name)
+        source_parent.remove_child(node.name)
+        self._versions.preserve(node)
+        source_name, node.name = node.name, dest_name
+        self._indexes.rename(node, source_name)
+        node.parent = dest_parent
+        self._versions.preserve_child(dest_parent, dest_name)
+        dest_parent.add_child(node)
+        self._bump_topology(source_path)
+
+    def _apply_move_delta(self, source_parent: FileSystemEntity, dest_parent: FileSystemEntity, size: int) -> None:
+        """
+        Propagate the size change caused by moving a node of a given size from one parent to another
+        :param source_parent: FileSystemEntity - The former parent of the moved node
+        :param dest_parent: FileSystemEntity - The new parent of the moved node
+        :param size: int - The size of the moved node
+        """
+        if self._batch is not None or self.concurrent:
+            self._apply_size_delta(source_parent, -size)
+            self._apply_size_delta(dest_parent, size)
+            return
+
+        # Apply the size delta along both ancestor chains up to their common ancestor, then once above it
+        hooks = {'before_update': self._before_size_update(), 'after_update': self._after_size_update()}
+        common_ancestor = self._common_ancestor(source_parent, dest_parent)
+        delta = propagate_size_delta(source_parent, -size, common_ancestor, **hooks)
+        delta += propagate_size_delta(dest_parent, size, common_ancestor, **hooks)
+        propagate_size_delta(common_ancestor, delta, **hooks)
+
+    @instrumented('write')
     def write_to_file(self, path: str, content: str) -> TextFile:
+        return self._update_content(path, lambda old_content: content, OP_WRITE, content)
+
+    @instrumented('append')
+    def append_to_file(self, path: str, content: str) -> TextFile:
+        """
+        Append to the content of a text file, without rewriting the existing content
+        :param path: str - The path of the text file
+        :param content: str - The text to be appended
+        :return: TextFile
+        :raises FileNotFoundError, NotATextFileError
+        """
+        return self._update_content(path, lambda old_content: self.content_store.append(old_content, content),
+                                    OP_APPEND, content)
+
+    @instrumented('write_range')
+    def write_range(self, path: str, offset: int, content: str) -> TextFile:
+        """
+        Write over the content of a text file from an offset, extending it if needed, without rewriting the rest
+        :param path: str - The path of the text file
+        :param offset: int - Where to start writing; at most the length of the content
+        :param content: str - The text to be written
+        :return: TextFile
+        :raises FileNotFoundError, NotATextFileError, ValueError
+        """
+        def update(old_content: Content) -> Content:
+            return self.content_store.write_range(old_content, offset, content)
+
+        return self._update_content(path, update, OP_WRITE_RANGE, offset, content)
+
+    def read_range(self, path: str, start: int = 0, end: int = None) -> str:
+        """
+        Read a range of the content of a text file, like content[start:end], without reading all of it
+        :param path: str - The path of the text file
+        :param start: int
+        :param end: int
+        :return: str
+        :raises FileNotFoundError, NotATextFileError
+        """
+        file_entity = self._find_text_file(path)
+        # Reading a text file counts as a use of the zip files it is in, like accessing their children does
+        zip_file = containing_zip(file_entity.parent) if self._zip_cache is not None else None
+        while zip_file is not None:
+            self._zip_cache.used(zip_file)
+            zip_file = containing_zip(zip_file.parent)
+
+        return file_entity.read_range(start, end)
+
+    def _find_text_file(self, path: str) -> TextFile:
         file_entity = self.find_node_by_path(path)
         # If the file system entity is not found
         if not file_entity:
@@ -105,57 +619,607 @@ class FileSystem:
         if not isinstance(file_entity, TextFile):
             raise NotATextFileError('Error => Not a text file')
 
+        return file_entity
+
+    def _update_content(self, path: str, update: Callable[[Content], Content], op: int, *args) -> TextFile:
+        """
+        Replace the content of a text file with one derived from its current content
+        :param path: str - The path of the text file
+        :param update: Callable[[Content], Content] - Maps the current content to the new one
+        :param op: int - The journal OP_* code of the mutation
+        :param args: The arguments of the mutation, after the path
+        :return: TextFile
+        :raises FileNotFoundError, NotATextFileError
+        """
+        with self._lock_paths(path):
+            file_entity = self._find_text_file(path)
+
+            with self._locks.node(file_entity):
+                old_content = file_entity.stored_content
+                parent, delta = self._replace_content(file_entity, update(old_content))
+                if self._batch is not None:
+                    self._batch.record_undo(lambda: self._set_content(file_entity, old_content))
+                self._record(op, normalize_path(path), *args)
+                self._notify(MODIFIED, normalize_path(path), node=file_entity)
+            self._apply_size_delta(parent, delta)
+            self._update_zips(parent, lambda zip_file: member_size_delta(zip_file, file_entity, old_content))
+
+        self._trim_zip_cache()
+        return file_entity
+
+    def _replace_content(self, file_entity: TextFile, content: Content) -> Tuple[Optional[FileSystemEntity], int]:
+        """
+        Replace the content of a text file and its size
+        :param file_entity: TextFile - The text file to be written to
+        :param content: Content - The new content of the text file; a str is put in the content store
+        :return: Tuple[FileSystemEntity, int] - The parent of the text file, and the change in its size
+        """
+        if isinstance(content, str):
+            content = self.content_store.put(content)
+        self._versions.preserve(file_entity)
+        delta = len(content) - file_entity.size
         file_entity.content = content
         file_entity.size = len(content)
-        recursive_size_update(file_entity)
+        self._indexes.resize(file_entity)
 
-        return file_entity
+        return file_entity.parent, delta
+
+    def _set_content(self, file_entity: TextFile, content: Content) -> None:
+        """
+        Replace the content of a text file and propagate the change in its size
+        :param file_entity: TextFile - The text file to be written to
+        :param content: Content - The new content of the text file
+        """
+        self._apply_size_delta(*self._replace_content(file_entity, content))
+
+    @contextmanager
+    def batch(self) -> Iterator[FileSystemBatch]:
+        """
+        Group many mutations together.  Size propagation is deferred to a single bottom-up pass when the batch
+        ends, so sizes read inside the batch may be stale.  If any operation in the batch raises, every operation
+        already applied by the batch is rolled back before the error is re-raised.  Nested batches join the
+        outermost one
+        :return: FileSystemBatch - The batch, exposing create/delete/move/write_to_file/append_to_file/write_range/
+                bulk_create
+        """
+        # In concurrent mode a batch holds the tree lock exclusively, so it never sees another thread's mutations
+        with self._locks.tree.exclusive():
+            if self._batch is not None:
+                yield self._batch
+                return
+
+            self._batch = FileSystemBatch(self)
+            try:
+                yield self._batch
+            except BaseException:
+                self._batch.rollback()
+                raise
+            finally:
+                batch, self._batch = self._batch, None
+                batch.flush_sizes()
+                self._refresh_zips(*batch.changed_nodes.values())
+            if self.journal is not None:
+                self.journal.append_many(batch.journal_records)
+            self._watches.emit_many(batch.changes)
+            for node, path in batch.deleted:
+                self._reclaimer.submit(node, path)
+        self._trim_zip_cache()
+
+    def _apply_size_delta(self, node: Optional[FileSystemEntity], delta: int) -> None:
+        """
+        Propagate a size delta from a container upward, or defer it to the end of the current batch
+        :param node: FileSystemEntity - The container whose children's total size changed
+        :param delta: int - The change in the total size of the children of node
+        """
+        if self._batch is not None:
+            self._batch.defer_size_delta(node, delta)
+        elif self.concurrent:
+            propagate_size_delta(node, delta, lock_for=self._locks.node, before_update=self._before_size_update(),
+                                 after_update=self._after_size_update())
+        else:
+            propagate_size_delta(node, delta, before_update=self._before_size_update(),
+                                 after_update=self._after_size_update())
+
+    def _before_size_update(self):
+        """
+        Get the callback to run on each node before its size is updated, if any
+        :return: Callable[[FileSystemEntity], None]
+        """
+        preserve = self._versions.preserve if self._versions.active else None
+        count_step = self.metrics.size_propagation_step if self.metrics.enabled else None
+        if preserve is None or count_step is None:
+            return preserve or count_step
+
+        def before_update(node: FileSystemEntity) -> None:
+            preserve(node)
+            count_step(node)
+
+        return before_update
+
+    def _after_size_update(self):
+        """
+        Get the callback to run on each node after its size is updated, if any
+        :return: Callable[[FileSystemEntity], None]
+        """
+        return self._indexes.resize if self.indexed else None
+
+    def _update_zips(self, node: Optional[FileSystemEntity], size_delta: Callable[[CompressedZipFile], int]) -> None:
+        """
+        Apply the change in compressed size caused by a change under a node to the compressed zip files above it,
+        once the change is complete (or have their size recomputed once the current batch ends, see _refresh_zips)
+        :param node: FileSystemEntity - The container whose children changed
+        :param size_delta: Callable[[CompressedZipFile], int] - Given the innermost compressed zip file above the
+                change, registers the change with it and returns the change in its compressed size
+        """
+        if self._zip_cache is None:
+            return
+        if self._batch is not None:
+            self._batch.defer_zip_refresh((node,))
+            return
+
+        zip_file = containing_zip(node)
+        if zip_file is None:
+            return
+        with self._locks.node(zip_file):
+            delta = size_delta(zip_file)
+        # A nested zip file counts for its own size, so the zip files above it change just as much
+        while zip_file is not None:
+            self._zip_cache.touch(zip_file)
+            self._resize_zip(zip_file, delta)
+            zip_file = containing_zip(zip_file.parent)
+
+    def _refresh_zips(self, *nodes: Optional[FileSystemEntity]) -> None:
+        """
+        Recompute the size of the compressed zip files at or above changed nodes, innermost first, from their whole
+        subtree.  Only used once a batch ends: a batch can be rolled back, so its changes aren't applied as deltas
+        :param nodes: FileSystemEntity - The changed nodes
+        """
+        if self._zip_cache is None:
+            return
+
+        # id => (depth from the top, zip file)
+        zip_files: Dict[int, Tuple[int, CompressedZipFile]] = {}
+        for node in nodes:
+            chain = []
+            while node is not None:
+                if isinstance(node, CompressedZipFile):
+                    chain.append(node)
+                node = getattr(node, 'parent', None)
+            for depth, zip_file in enumerate(reversed(chain)):
+                zip_files[id(zip_file)] = (depth, zip_file)
+
+        for _, zip_file in sorted(zip_files.values(), key=lambda entry: -entry[0]):
+            self._zip_cache.touch(zip_file)
+            with self._locks.node(zip_file):
+                delta = compressed_size(zip_file) - zip_file.size
+            self._resize_zip(zip_file, delta)
+
+    def _resize_zip(self, zip_file: CompressedZipFile, delta: int) -> None:
+        """
+        Change the size of a compressed zip file, and propagate the change to its ancestors up to the next
+        compressed zip file
+        :param zip_file: CompressedZipFile
+        :param delta: int - The change in its compressed size
+        """
+        if not delta:
+            return
+        with self._locks.node(zip_file):
+            before_update, after_update = self._before_size_update(), self._after_size_update()
+            if before_update is not None:
+                before_update(zip_file)
+            zip_file.size += delta
+            if after_update is not None:
+                after_update(zip_file)
+        self._apply_size_delta(zip_file.parent, delta)
+
+    def trim_zip_cache(self) -> None:
+        """
+        Evict the least recently used compressed zip files beyond zip_cache_size from memory, keeping only their
+        compressed subtree until it is accessed again.  References to nodes inside an evicted zip file are stale;
+        look them up again by path.  Runs automatically after every mutation unless the file system is concurrent
+        (then, call it while no other thread holds nodes inside zip files).  Nothing is evicted while a snapshot is
+        alive
+        """
+        if self._zip_cache is None:
+            return
+        with self._locks.tree.exclusive():
+            if self._batch is not None or self._versions.active:
+                return
+            for zip_file in self._zip_cache.overflow():
+                path = self._resolve_path(zip_file)
+                # Deleted zip files are simply forgotten
+                if path is None or is_compressed(zip_file):
+                    continue
+                for child in zip_file.children.values():
+                    self._unindex_subtree(child, file_path(path, child.name))
+                    self._indexes.remove_subtree(child)
+                evict(zip_file, self._zip_cache)
+                self._bump_topology(path)
+
+    def wait_for_reclaimer(self) -> None:
+        """
+        Block until every deleted subtree has been deregistered from the indexes and freed, then raise the first
+        error raised while deregistering them, if any
+        """
+        self._reclaimer.wait()
+
+    def _reclaim(self, node: FileSystemEntity, path: str) -> None:
+        """
+        Deregister a deleted subtree from the path index and the secondary indexes (runs on the reclaimer thread)
+        :param node: FileSystemEntity - The root of the deleted subtree
+        :param path: str - The normalized path it was deleted from
+        """
+        self._unindex_subtree(node, path)
+        self._indexes.remove_subtree(node)
+
+    def _sweep(self) -> None:
+        """
+        Drop the path index entries made stale by moves and deletes, which would otherwise keep their nodes alive,
+        and stamp the other ones with the current generation, so that the path cache can retire the invalidated
+        paths and lookups stop checking them (runs on the sweeper thread of the reclaimer, in O(entries))
+        """
+        generation = self.path_cache.generation
+        is_stale = self.path_cache.is_stale
+        for key, entry in list(self._path_index.items()):
+            if entry[1] >= generation or self._path_index.get(key) is not entry:
+                continue
+            if is_stale(key, entry[1]):
+                self._path_index.pop(key, None)
+            else:
+                # Overwriting a concurrently stored entry is harmless: unless a subtree above it was re-parented
+                # meanwhile (which is invalidated with a later generation), both map the path to the same node
+                self._path_index[key] = (entry[0], generation)
+        self.path_cache.sweep(generation)
+
+    def _trim_zip_cache(self) -> None:
+        if not self.concurrent:
+            self.trim_zip_cache()
+
+    def _on_zip_load(self, zip_file: CompressedZipFile, children: Dict[str, FileSystemEntity]) -> None:
+        """
+        Index the children of a compressed zip file that were just decompressed
+        :param zip_file: CompressedZipFile
+        :param children: Dict[str, FileSystemEntity] - Its children, by name
+        """
+        for child in children.values():
+            self._indexes.add_subtree(child)
+
+    def snapshot(self, drive: str = None) -> FileSystemSnapshot:
+        """
+        Take an immutable, read-only view of the whole file system as it is now, in O(1).  Later changes to the
+        live tree copy only the state they overwrite, for as long as the snapshot is referenced.  A snapshot taken
+        inside a batch sees the sizes as they are before the batch's deferred size propagation
+        :param drive: str - Only take a view of this drive, which in concurrent mode only waits for the mutations
+                of that drive rather than of the whole file system
+        :return: FileSystemSnapshot
+        :raises FileNotFoundError
+        """
+        if drive is None:
+            with self._locks.tree.exclusive():
+                return self._versions.snapshot(self.drives)
+
+        with self._lock_drive(drive) as drive_node:
+            return self._versions.snapshot({drive_node.name: drive_node})
+
+    @contextmanager
+    def lock_drive(self, name: str) -> Iterator[Drive]:
+        """
+        In concurrent mode, hold a drive exclusively: the mutations of other threads on that drive wait until it
+        is released, while the other drives stay available.  Mutations by the holding thread are allowed.  Only
+        hold one drive at a time
+        :param name: str - The name of the drive
+        :return: Drive
+        :raises FileNotFoundError
+        """
+        with self._lock_drive(name) as drive:
+            yield drive
+
+    @contextmanager
+    def _lock_drive(self, name: str) -> Iterator[Drive]:
+        key = normalize_path(os.path.join(os.sep, name))
+        with self._locks.tree.shared(), self._locks.drive(key).exclusive():
+            drive = self.drives.get(key)
+            if drive is None:
+                raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), name)
+            yield drive
+
+    def _lock_paths(self, *paths: Optional[str]):
+        """
+        In concurrent mode, hold the tree lock and the locks of the drives of some paths in shared mode
+        :param paths: str - The paths touched by a mutation
+        :return: A context manager
+        """
+        if not self.concurrent:
+            return NULL_CONTEXT
+        return self._locks.drives(*(drive_name(path) for path in paths))
+
+    def create_drive(self, name: str) -> Drive:
+        """
+        Create a new, empty drive
+        :param name: str - The name of the drive, e.g. /tenant1 (the leading / may be omitted)
+        :return: Drive
+        :raises FileExistsError, IllegalFileSystemOperation
+        """
+        key = normalize_path(os.path.join(os.sep, name))
+        if drive_name(key) != key:
+            raise IllegalFileSystemOperation(f'Invalid drive name {name}')
+
+        with self._locks.tree.exclusive():
+            if key in self.drives:
+                raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), key)
+            drive = FileSystemEntityFactory.for_type(EntityTypes.DRIVE)(EntityTypes.DRIVE, key)
+            drive.path_cache = self.path_cache
+            # Replaced rather than updated, so that lock-free lookups never see the dict change size
+            self.drives = {**self.drives, key: drive}
+            self._path_index[key] = (drive, self.path_cache.generation)
+            self._indexes.add_subtree(drive)
+            self._record(OP_CREATE_DRIVE, key)
+            self._notify(CREATED, key, node=drive)
+
+            if self._batch is not None:
+                def undo_create_drive():
+                    self.drives = {name: node for name, node in self.drives.items() if node is not drive}
+                    self._path_index.pop(key, None)
+                    self._bump_topology(key)
+                    self._indexes.remove_subtree(drive)
+                self._batch.record_undo(undo_create_drive)
+
+        return drive
+
+    def delete_drive(self, name: str) -> bool:
+        """
+        Delete a drive and everything it contains.  Like delete, the drive is detached in O(1) and reclaimed in
+        the background
+        :param name: str - The name of the drive
+        :return: bool
+        :raises FileNotFoundError, IllegalFileSystemOperation
+        """
+        key = normalize_path(os.path.join(os.sep, name))
+        if key == MAIN_DRIVE:
+            raise IllegalFileSystemOperation('The main drive cannot be deleted')
+
+        with self._locks.tree.exclusive():
+            drive = self.drives.get(key)
+            if drive is None:
+                raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), name)
+            self.drives = {name: node for name, node in self.drives.items() if node is not drive}
+            self._path_index.pop(key, None)
+            self._bump_topology(key)
+            self._record(OP_DELETE_DRIVE, key)
+            self._notify(DELETED, key)
+
+            if self._batch is not None:
+                def undo_delete_drive():
+                    self.drives = {**self.drives, key: drive}
+                    self._path_index[key] = (drive, self.path_cache.generation)
+                self._batch.record_undo(undo_delete_drive)
+                self._batch.deleted.append((drive, key))
+            else:
+                self._reclaimer.submit(drive, key)
+
+        return True
+
+    def walk(self, path: str = None, order: str = 'pre', max_depth: int = None,
+             prune: Callable[[FileSystemEntity], bool] = None) -> Iterator[TreeEntry]:
+        """
+        Walk a subtree, including its root, without recursion
+        :param path: str - The path of the root of the walk; the main drive by default
+        :param order: str - 'pre' (parents before children), 'post' (children before parents) or 'bfs'
+        :param max_depth: int - Don't descend below this depth (the root of the walk is at depth 0)
+        :param prune: Callable[[FileSystemEntity], bool] - Don't descend into the nodes for which this returns True
+        :return: Iterator[TreeEntry] - (node, depth, is_last) of each node
+        :raises FileNotFoundError
+        """
+        node = self.find_node_by_path(path) if path else self.get_root_node()
+        if node is None:
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+
+        return iter_tree(node, order, max_depth, prune)
+
+    def iter_descendants(self, path: str, order: str = 'pre', max_depth: int = None,
+                         prune: Callable[[FileSystemEntity], bool] = None) -> Iterator[FileSystemEntity]:
+        """
+        Iterate over the descendants of a node, without recursion
+        :param path: str - The path of the node
+        :param order: str - 'pre' (parents before children), 'post' (children before parents) or 'bfs'
+        :param max_depth: int - Don't descend below this depth (the children of the node are at depth 1)
+        :param prune: Callable[[FileSystemEntity], bool] - Don't descend into the nodes for which this returns True
+        :return: Iterator[FileSystemEntity]
+        :raises FileNotFoundError
+        """
+        return (entry.node for entry in self.walk(path, order, max_depth, prune) if entry.depth)
+
+    def verify_sizes(self) -> List[str]:
+        """
+        Audit the incrementally maintained sizes by recomputing every size from scratch, bottom-up
+        :return: List[str] - The paths of the nodes whose stored size doesn't match the recomputed size
+        """
+        mismatched = []
+        for drive in self.drives.values():
+            expected = {}
+            stack = [(drive, drive.path, False)]
+            while stack:
+                node, path, children_done = stack.pop()
+                children = getattr(node, 'children', None)
+                if children is not None and not children_done:
+                    stack.append((node, path, True))
+                    for child in children.values():
+                        stack.append((child, file_path(path, child.name), False))
+                    continue
+
+                if children is None:
+                    size = len(node.stored_content)
+                    valid = size == node.size
+                else:
+                    children_size = sum(expected[id(child)] for child in children.values())
+                    size = node.size_for(children_size)
+                    valid = size == node.size and children_size == node.children_size
+                expected[id(node)] = size
+                if not valid:
+                    mismatched.append(path)
+
+        return mismatched
 
     def get_root_node(self):
         return self.drives[MAIN_DRIVE]
 
+    @instrumented('lookup')
     def find_node_by_path(self, path: str):
         """
-        Find the parent node based on its file path
+        Find a node based on its file path, using the path index and falling back to walking the tree
         :param path: str - The full path of the node (entity) to be located
         :return: FileSystemEntity - The file system node (entity)
         """
         if not path:
             return None
-        path = Path(path)
+        key = normalize_path(path)
+        entry = self._path_index.get(key)
+
+        if entry is not None:
+            node, generation = entry
+            if not self.path_cache.is_stale(key, generation):
+                self.metrics.count('lookup.index_hits')
+                return node
+            # A subtree above the entry was re-parented since it was stored; keep it only if it still resolves to
+            # the path
+            self.metrics.count('lookup.revalidations')
+            generation = self.path_cache.generation
+            if self._resolve_path(node) == key:
+                return self._cache_lookup(key, node, generation)
+            self._path_index.pop(key, None)
+        self.metrics.count('lookup.index_misses')
 
-        return self.find_descendant_node(self.drives[MAIN_DRIVE], path.parts, str(path))
+        # Read before walking, see _attach_subtree
+        generation = self.path_cache.generation
+        # Route the path to its drive by its first component, and walk the rest by name
+        path_parts = key.split(os.sep)
+        drive = self.drives.get(os.sep + path_parts[1]) if len(path_parts) > 1 and not path_parts[0] else None
+        if drive is None:
+            return None
+        node, visited = self._walk_descendants(drive, path_parts[2:])
+        self.metrics.count('lookup.nodes_visited', visited)
+        if node is not None:
+            return self._cache_lookup(key, node, generation)
 
-    def find_descendant_node(self, node: FileSystemEntity, path_parts: List[str], path: str, current_index: int = 1):
+        return node
+
+    def _cache_lookup(self, key: str, node: FileSystemEntity, generation: int) -> Optional[FileSystemEntity]:
         """
-        Recursively traverse children of a file system node to find a given node by path
-        :param node: FileSystemEntity - The file system node (entity) to be searched
-        :param path_parts: List[str] - The list of path parts (found by splitting full path by the SEPARATOR)
-        :param path: str - The full path of the node (entity) to be located
-        :param current_index: int - the index of the path list in the current iteration
-        :return: FileSystemEntity - The file system node (entity)
+        Store the result of a lookup that missed the path index
+        :param key: str - The normalized path that was looked up
+        :param node: FileSystemEntity - The node found at that path
+        :param generation: int - The path cache generation read before looking the node up
+        :return: FileSystemEntity - The node, or None if it was concurrently deleted or moved
         """
-        if node.path == path:
-            return node
+        self._path_index[key] = (node, generation)
+        # Lookups don't lock, so a concurrent delete or move may have unindexed the node before it was cached
+        if self.concurrent and self._resolve_path(node) != key:
+            entry = self._path_index.get(key)
+            if entry is not None and entry[0] is node:
+                self._path_index.pop(key, None)
+            return None
 
-        if hasattr(node, 'children'):
-            # Get the first file path part from the list, leaving the remaining non-traversed file path parts
-            path_obj = Path(path)
-            current_iteration_path = '/'.join(path_obj.parts[0:current_index + 1]).replace('//', '/')
+        return node
 
-            if current_iteration_path == node.path:
-                current_index += 1
+    @staticmethod
+    def find_descendant_node(node: FileSystemEntity, path_parts: Sequence[str]) -> Optional[FileSystemEntity]:
+        """
+        Iteratively walk the children of a file system node to find a descendant node by its name components
+        :param node: FileSystemEntity - The file system node (entity) to start the walk from
+        :param path_parts: Sequence[str] - The names of the descendants to traverse, relative to node
+        :return: FileSystemEntity - The file system node (entity), or None if it doesn't exist
+        """
+        return FileSystem._walk_descendants(node, path_parts)[0]
 
-            # if path_obj.parts[current_index] == Path(node.path).parts[-1]:
-            #     current_index += 1
-            next_path = path_obj.parts[current_index]
-            next_node = node.children.get(next_path)
+    @staticmethod
+    def _walk_descendants(node: FileSystemEntity, path_parts: Sequence[str]) -> Tuple[Optional[FileSystemEntity], int]:
+        """
+        See find_descendant_node
+        :return: Tuple[FileSystemEntity, int] - The descendant node or None, and the number of nodes visited
+        """
+        visited = 0
+        for name in path_parts:
+            children = getattr(node, 'children', None)
+            if children is None:
+                return None, visited
+            node = children.get(name)
+            if node is None:
+                return None, visited
+            visited += 1
+
+        return node, visited
+
+    def _check_attached(self, node: FileSystemEntity, path: str) -> None:
+        """
+        In concurrent mode, check that a node resolved without locks wasn't deleted (itself or along with one of its
+        ancestors) since, so that nothing is created into, or moved into or out of, a detached subtree.  Its lock must
+        be held: a delete afterwards then waits, and detaches whatever the operation added along with the rest
+        :param node: FileSystemEntity - The file system node (entity)
+        :param path: str - The path it was resolved from
+        :raises FileNotFoundError
+        """
+        if not self.concurrent:
+            return
+        while hasattr(node, 'parent'):
+            parent = node.parent
+            if parent is None or parent.children.get(node.name) is not node:
+                raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+            node = parent
+        if self.drives.get(node.name) is not node:
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), path)
 
-            if not next_node:
+    def _resolve_path(self, node: FileSystemEntity) -> Optional[str]:
+        """
+        Get the path of a node by following its parent links, checking that each link is still in place
+        :param node: FileSystemEntity - The file system node (entity)
+        :return: str - The normalized path of the node, or None if it is no longer attached to a drive
+        """
+        names = []
+        while hasattr(node, 'parent'):
+            parent = node.parent
+            if parent is None or parent.children.get(node.name) is not node:
                 return None
-            return self.find_descendant_node(next_node, path_parts[1:], path, current_index)
+            names.append(node.name)
+            node = parent
+        if self.drives.get(node.name) is not node:
+            return None
+
+        return normalize_path(os.path.join(node.path, *reversed(names)))
 
-        return None
+    @staticmethod
+    def _common_ancestor(first: FileSystemEntity, second: FileSystemEntity) -> Optional[FileSystemEntity]:
+        """
+        Find the closest node that is an ancestor of (or the same node as) both first and second
+        :param first: FileSystemEntity - A file system node (entity)
+        :param second: FileSystemEntity - Another file system node (entity)
+        :return: FileSystemEntity - The common ancestor, or None if the nodes are on different drives
+        """
+        ancestors = set()
+        while first is not None:
+            ancestors.add(id(first))
+            first = getattr(first, 'parent', None)
+        while second is not None and id(second) not in ancestors:
+            second = getattr(second, 'parent', None)
+
+        return second
+
+    def _unindex_subtree(self, node: FileSystemEntity, path: str) -> None:
+        """
+        Remove a node and all of its descendants from the path index
+        :param node: FileSystemEntity - The root of the subtree to be removed from the index
+        :param path: str - The normalized path of node
+        """
+        stack = [(node, path)]
+        while stack:
+            current, current_path = stack.pop()
+            entry = self._path_index.get(current_path)
+            if entry is not None and entry[0] is current:
+                self._path_index.pop(current_path, None)
+            self.path_cache.discard(current)
+            if is_compressed(current):
+                continue
+            for child in getattr(current, 'children', {}).values():
+                stack.append((child, file_path(current_path, child.name)))
 
     @staticmethod
     def insert_node(entity: FileSystemEntity, parent_node: FileSystemEntity) -> None:
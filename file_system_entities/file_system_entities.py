@@ -1,31 +1,268 @@
 import enum
-from typing import Dict
+import os
+import threading
+from collections import OrderedDict
+from types import MappingProxyType
+from typing import Callable, Dict, Mapping, Optional, Tuple
 
-from helpers import file_path, calc_size
+from content_store import Content, ContentHandle
+from file_system_entities.entity_types_enum import EntityTypes
+from helpers import calc_size
+
+# Serializes building lazily loaded children and contents, so that concurrent readers never build them twice
+_LAZY_LOAD_LOCK = threading.RLock()
+# Shared, read-only children store of every container that has no children
+_NO_CHILDREN: Mapping[str, 'FileSystemEntity'] = MappingProxyType({})
+# How many entity paths are memoized
+PATH_CACHE_SIZE = 4096
+# How many invalidated paths are checked individually before everything memoized is invalidated at once
+STALE_PATHS = 64
+
+
+class LazyChildren:
+    """
+    Placeholder for the children store of a container whose children are only built on first access
+    """
+    __slots__ = ()
+
+    def load(self, parent: 'FileSystemEntity') -> Dict[str, 'FileSystemEntity']:
+        """
+        Build the children of a container
+        :param parent: FileSystemEntity - The container the children belong to
+        :return: Dict[str, FileSystemEntity] - The children of parent, by name
+        """
+        raise NotImplementedError
+
+
+class LazyContent:
+    """
+    Placeholder for the content of a text file that is only read on first access
+    """
+    __slots__ = ()
+
+    def load(self) -> str:
+        raise NotImplementedError
+
+
+class PathCache:
+    def __init__(self, capacity: int = PATH_CACHE_SIZE):
+        """
+        Memoizes the paths of the entities of a file system (each file system has its own, which its drives refer
+        to), on the entities themselves, so that a memoized path is read in O(1).  Paths follow from the parent links
+        and names, so every change to them (moving, renaming, detaching or re-attaching a subtree) must be recorded
+        with invalidate, which only stamps the changed path with a new generation: the paths memoized before, at or
+        under it, are stale from then on.  The same stamps tell whether the path index entries of the file system
+        are stale (see is_stale)
+        :param capacity: int - How many paths are kept, first memoized first out
+        """
+        self.capacity = capacity
+        self.generation = 0
+        # Everything stamped before it is stale
+        self.floor = 0
+        # (invalidated path, generation at which it was invalidated), replaced rather than updated so that it can be
+        # read without locking; bounded by STALE_PATHS, see sweep
+        self._stale: Tuple[Tuple[str, int], ...] = ()
+        # id(entity) => entity, of the entities whose path is memoized, first memoized first
+        self._entities: 'OrderedDict[int, FileSystemEntity]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entities)
+
+    def invalidate(self, *paths: str) -> int:
+        """
+        Record that the paths at and under some normalized paths changed, or every path if none is given
+        :param paths: str - The normalized paths of the moved, detached or re-attached subtrees
+        :return: int - The new generation: what is stamped with it or later is unaffected
+        """
+        with self._lock:
+            self.generation += 1
+            if not paths or len(self._stale) + len(paths) > STALE_PATHS:
+                self.floor = self.generation
+                self._stale = ()
+            else:
+                self._stale += tuple((path, self.generation) for path in paths)
+
+            return self.generation
+
+    def is_stale(self, path: str, generation: int) -> bool:
+        """
+        Check whether something that was known to be at a path, as of a generation, may no longer be: O(1) unless
+        paths were invalidated since the last sweep
+        :param path: str - The normalized path
+        :param generation: int - The generation it was stamped with
+        :return: bool
+        """
+        if generation < self.floor:
+            return True
+        for stale_path, invalidated in self._stale:
+            if invalidated > generation and path.startswith(stale_path) and \
+                    (len(path) == len(stale_path) or path[len(stale_path)] == os.sep):
+                return True
+
+        return False
+
+    def sweep(self, generation: int) -> None:
+        """
+        Forget the memoized paths made stale by the paths invalidated up to a generation, and stamp the others with
+        it, so that the invalidated paths no longer need to be checked.  Whatever else was stamped with these paths
+        in mind (e.g. the path index) must have been swept first
+        :param generation: int - The generation read before sweeping
+        """
+        for entity in list(self._entities.values()):
+            memo = entity._path_memo
+            if memo is None or memo[2] is not self or memo[1] >= generation:
+                continue
+            entity._path_memo = None if self.is_stale(memo[0], memo[1]) else (memo[0], generation, self)
+        with self._lock:
+            # What was stamped before the generation without being swept (e.g. memoized while sweeping) is stale
+            self.floor = max(self.floor, generation)
+            self._stale = tuple(entry for entry in self._stale if entry[1] > generation)
+
+    def discard(self, entity: 'FileSystemEntity') -> None:
+        """
+        Forget the path of an entity, so that the cache doesn't keep a deleted entity alive
+        :param entity: FileSystemEntity
+        """
+        with self._lock:
+            if self._entities.get(id(entity)) is entity:
+                del self._entities[id(entity)]
+            memo = entity._path_memo
+            if memo is not None and memo[2] is self:
+                entity._path_memo = None
+
+    def get(self, entity: 'FileSystemEntity') -> Optional[str]:
+        """
+        :param entity: FileSystemEntity
+        :return: str - The memoized path of the entity, or None
+        """
+        memo = entity._path_memo
+        if memo is None or memo[2] is not self or self.is_stale(memo[0], memo[1]):
+            return None
+
+        return memo[0]
+
+    def path(self, entity: 'FileSystemEntity') -> str:
+        """
+        Get the path of an entity, walking its parent links up to the first ancestor whose path is memoized.  The
+        path of the entity and of its parent (shared by its siblings) are memoized
+        :param entity: FileSystemEntity
+        :return: str
+        """
+        path = self.get(entity)
+        if path is not None:
+            return path
+
+        # Read before walking, so that a concurrent invalidation makes the result stale rather than wrong
+        generation = self.generation
+        parent_path, path = build_path(entity, self.get)
+        with self._lock:
+            parent = getattr(entity, 'parent', None)
+            if parent_path is not None and parent is not None:
+                self._store(parent, generation, parent_path)
+            self._store(entity, generation, path)
+
+        return path
+
+    def _store(self, entity: 'FileSystemEntity', generation: int, path: str) -> None:
+        entity._path_memo = (path, generation, self)
+        self._entities[id(entity)] = entity
+        self._entities.move_to_end(id(entity))
+        while len(self._entities) > self.capacity:
+            evicted = self._entities.popitem(last=False)[1]
+            memo = evicted._path_memo
+            if memo is not None and memo[2] is self:
+                evicted._path_memo = None
+
+
+def build_path(entity: 'FileSystemEntity', memoized: Callable[['FileSystemEntity'], Optional[str]] = None
+               ) -> Tuple[Optional[str], str]:
+    """
+    Build the path of an entity from its parent links
+    :param entity: FileSystemEntity
+    :param memoized: Callable[[FileSystemEntity], Optional[str]] - Gets the memoized path of an ancestor, if any, where
+            the walk stops
+    :return: Tuple[str, str] - The path of the parent of the entity (None for a root), and the path of the entity
+    """
+    names = []
+    node = entity
+    prefix = None
+    while node is not None:
+        prefix = memoized(node) if memoized is not None and node is not entity else None
+        if prefix is not None:
+            break
+        names.append(node.name)
+        node = getattr(node, 'parent', None)
+    if prefix is None:
+        prefix = names.pop()
+
+    names.reverse()
+    parent_path = os.path.join(prefix, *names[:-1]) if names else None
+    return parent_path, os.path.join(parent_path, names[-1]) if names else prefix
 
 
 class FileSystemEntity:
-    def __init__(self, type: enum.Enum, name: str, path: str, size: int):
+    # Entities are allocated in the millions, so none of them carries a per-instance __dict__
+    __slots__ = ('name', 'size', '_path_memo')
+    # The entity type is a tag shared by every instance of a class rather than a per-instance reference
+    type: enum.Enum = None
+
+    def __init__(self, type: enum.Enum, name: str, size: int):
         """
-        :param type: enum.Enum - The ID of the file system node type from the entity types enum
+        :param type: enum.Enum - The ID of the file system node type from the entity types enum (implied by the class)
         :param name: str - The name of the file system node (entity)
-        :param path: str - The concatenation of the names of the containing file_system_entities, from the drive
-                down to and including the entity.  The names are separated by '\'
         :param size: int - An integer defined as follows:
                 * For a text file - it is the length of its contents
                 * For a drive or folder, it is the sum of all sizes of the file_system_entities it contains
                 * For a zip file, it is one half of the sum of all sizes of the file_system_entities it contains
         """
-        self.type: enum.Enum = type
         self.name: str = name
-        self.path: str = path
         self.size: int = size
+        # (path, generation, PathCache) once memoized, see PathCache
+        self._path_memo: Optional[Tuple[str, int, PathCache]] = None
+
+    @property
+    def path(self) -> str:
+        """
+        The concatenation of the names of the containing file_system_entities, from the drive down to and including
+        the entity.  It is derived from the parent links, and memoized by the file system of the drive until they
+        change (see PathCache)
+        :return: str
+        """
+        memo = self._path_memo
+        if memo is not None:
+            path, generation, path_cache = memo
+            if not path_cache.is_stale(path, generation):
+                return path
+            return path_cache.path(self)
+
+        root = self
+        parent = getattr(root, 'parent', None)
+        while parent is not None:
+            root = parent
+            parent = getattr(root, 'parent', None)
+        # Only the drives of a file system have a path cache; detached subtrees aren't memoized
+        path_cache = getattr(root, 'path_cache', None)
+        if path_cache is None:
+            return build_path(self)[1]
+
+        return path_cache.path(self)
 
     def set_size(self):
         raise NotImplementedError
 
+    def size_for(self, children_size: int) -> int:
+        """
+        Get the size of the entity given the total size of the entities it contains
+        :param children_size: int - The sum of the sizes of the contained file system nodes (file_system_entities)
+        :return: int
+        """
+        raise NotImplementedError
+
 
 class ContainableMixin:
+    __slots__ = ()
+
     def __init__(self, parent: FileSystemEntity):
         """
         A shared, inheritable class for file system nodes (file_system_entities) that can be contained by other nodes
@@ -35,21 +272,74 @@ class ContainableMixin:
 
 
 class ContainerMixin:
+    __slots__ = ()
+
     def __init__(self):
         """
-        A shared, inheritable class for file system nodes (file_system_entities) that can contain other nodes
+        A shared, inheritable class for file system nodes (file_system_entities) that can contain other nodes.
+        Containers without children share a single read-only empty store until their first child is added
         """
-        self.children: Dict[str, FileSystemEntity] = {}
+        self._children: Mapping[str, FileSystemEntity] = _NO_CHILDREN
+        # Running sum of the children sizes, kept up to date by size deltas
+        self.children_size: int = 0
+
+    @property
+    def children(self) -> Mapping[str, FileSystemEntity]:
+        """
+        The contained file system nodes (file_system_entities), by name.  Use add_child/remove_child to change them
+        :return: Mapping[str, FileSystemEntity]
+        """
+        children = self._children
+        if isinstance(children, LazyChildren):
+            with _LAZY_LOAD_LOCK:
+                children = self._children
+                if isinstance(children, LazyChildren):
+                    children = self._children = children.load(self) or _NO_CHILDREN
+
+        return children
+
+    def defer_children(self, lazy_children: LazyChildren) -> None:
+        """
+        Replace the children with a placeholder that builds them on first access
+        :param lazy_children: LazyChildren - The placeholder
+        """
+        self._children = lazy_children
+
+    def children_loaded(self) -> bool:
+        """
+        Check whether the children have been built, without building them
+        :return: bool
+        """
+        return not isinstance(self._children, LazyChildren)
 
     def add_child(self, child: FileSystemEntity):
         """
         Add a child to the children list
         :param child: FileSystemEntity - the child node to be added
         """
-        self.children[child.name] = child
+        if self.children is _NO_CHILDREN:
+            self._children = {}
+        self._children[child.name] = child
+
+    def remove_child(self, name: str) -> FileSystemEntity:
+        """
+        Remove a child from the children list
+        :param name: str - the name of the child node to be removed
+        :return: FileSystemEntity - the removed child node
+        """
+        if name not in self.children:
+            raise KeyError(name)
+        child = self._children.pop(name)
+        if not self._children:
+            self._children = _NO_CHILDREN
+
+        return child
 
 
 class Drive(FileSystemEntity, ContainerMixin):
+    __slots__ = ('_children', 'children_size', 'path_cache')
+    type = EntityTypes.DRIVE
+
     def __init__(self, type: enum.Enum, name: str):
         """
         Initialize a Drive instance
@@ -59,13 +349,22 @@ class Drive(FileSystemEntity, ContainerMixin):
         """
         ContainerMixin.__init__(self)
         size = calc_size(self.children)
-        super().__init__(type, name, name, size)
+        super().__init__(type, name, size)
+        # The path cache of the file system the drive belongs to, if any
+        self.path_cache: Optional[PathCache] = None
 
     def set_size(self) -> None:
-        self.size = calc_size(self.children)
+        self.children_size = calc_size(self.children)
+        self.size = self.size_for(self.children_size)
+
+    def size_for(self, children_size: int) -> int:
+        return children_size
 
 
 class Folder(FileSystemEntity, ContainerMixin, ContainableMixin):
+    __slots__ = ('_children', 'children_size', 'parent')
+    type = EntityTypes.FOLDER
+
     def __init__(self, type: enum.Enum, name: str, parent: FileSystemEntity):
         """
         Initialize a Folder instance
@@ -76,13 +375,20 @@ class Folder(FileSystemEntity, ContainerMixin, ContainableMixin):
         ContainerMixin.__init__(self)
         ContainableMixin.__init__(self, parent)
         size = calc_size(self.children)
-        super().__init__(type, name, file_path(parent.path, name), size)
+        super().__init__(type, name, size)
 
     def set_size(self) -> None:
-        self.size = calc_size(self.children)
+        self.children_size = calc_size(self.children)
+        self.size = self.size_for(self.children_size)
+
+    def size_for(self, children_size: int) -> int:
+        return children_size
 
 
 class TextFile(FileSystemEntity, ContainableMixin):
+    __slots__ = ('_content', 'parent')
+    type = EntityTypes.TEXT_FILE
+
     def __init__(self, type: enum.Enum, name: str, parent: FileSystemEntity, content: str = ''):
         """
         Initialize a TextFile instance
@@ -91,14 +397,65 @@ class TextFile(FileSystemEntity, ContainableMixin):
         :param parent: FileSystemEntity - Parent file system node (entity)
         """
         ContainableMixin.__init__(self, parent)
-        super().__init__(type, name, file_path(parent.path, name), 0)
+        super().__init__(type, name, 0)
         self.content = content
 
+    @property
+    def content(self) -> str:
+        content = self.stored_content
+        if isinstance(content, ContentHandle):
+            return content.read()
+
+        return content
+
+    @content.setter
+    def content(self, content: Content) -> None:
+        self._content = content
+
+    @property
+    def stored_content(self) -> Content:
+        """
+        The content as it is stored, either a str or a handle into a content store, without reading it from the
+        store (a placeholder is still loaded)
+        :return: Content
+        """
+        content = self._content
+        if isinstance(content, LazyContent):
+            with _LAZY_LOAD_LOCK:
+                content = self._content
+                if isinstance(content, LazyContent):
+                    content = self._content = content.load()
+
+        return content
+
+    def read_range(self, start: int = 0, end: int = None) -> str:
+        """
+        Read a range of the content, like content[start:end], only reading the chunks it overlaps from a store
+        :param start: int
+        :param end: int
+        :return: str
+        """
+        content = self.stored_content
+        if isinstance(content, ContentHandle):
+            return content.read(start, end)
+
+        return content[start:end]
+
+    def defer_content(self, lazy_content: LazyContent) -> None:
+        """
+        Replace the content with a placeholder that reads it on first access
+        :param lazy_content: LazyContent - The placeholder
+        """
+        self._content = lazy_content
+
     def set_size(self) -> None:
-        self.size = len(self.content)
+        self.size = len(self.stored_content)
 
 
 class ZipFile(FileSystemEntity, ContainerMixin, ContainableMixin):
+    __slots__ = ('_children', 'children_size', 'parent')
+    type = EntityTypes.ZIP_FILE
+
     def __init__(self, type: enum.Enum, name: str, parent: FileSystemEntity):
         """
         Initialize a ZipFile instance
@@ -109,7 +466,11 @@ class ZipFile(FileSystemEntity, ContainerMixin, ContainableMixin):
         ContainerMixin.__init__(self)
         ContainableMixin.__init__(self, parent)
         size = int(round(calc_size(self.children) / 2))
-        super().__init__(type, name, file_path(rf'{parent.path}', name), int(round(size)))
+        super().__init__(type, name, int(round(size)))
 
     def set_size(self) -> None:
-        self.size = int(round(calc_size(self.children) / 2))
+        self.children_size = calc_size(self.children)
+        self.size = self.size_for(self.children_size)
+
+    def size_for(self, children_size: int) -> int:
+        return int(round(children_size / 2))
@@ -1,9 +1,10 @@
 import errno
 import os
 from pathlib import Path
-from typing import List
+from typing import List, Optional
 
 from illegal_file_system_operation import IllegalFileSystemOperation
+from locking import NULL_CONTEXT
 
 MAIN_DRIVE = '/root'
 
@@ -18,14 +19,41 @@ def file_path(parent_path: str, name: str) -> str:
     return os.path.join(parent_path, name)
 
 
-def recursive_size_update(node) -> None:
+def normalize_path(path) -> str:
     """
-    Recursively update the size attribute upward through the file system tree
-    :param node: FileSystemEntity
+    Normalize a file system path (str or Path) into the canonical string form used as a path index key
+    :param path: str | Path - The path to be normalized
+    :return: str - The normalized path
     """
-    node.set_size()
-    if hasattr(node, 'parent'):
-        recursive_size_update(node.parent)
+    return os.path.normpath(str(path))
+
+
+def propagate_size_delta(node, delta: int, stop=None, lock_for=None, before_update=None, after_update=None) -> int:
+    """
+    Push a signed size delta up through the file system tree, starting at the container whose children changed.
+    Each container keeps the running sum of its children sizes, so its new size is derived exactly (no rounding
+    drift for zip files) and only the resulting change in its own size is passed on to its parent
+    :param node: FileSystemEntity - The container whose children's total size changed
+    :param delta: int - The change in the total size of the children of node
+    :param stop: FileSystemEntity - An optional ancestor at which to stop, without applying the delta to it
+    :param lock_for: Callable - Optionally maps each node to a lock held while it is updated, one at a time
+    :param before_update: Callable - Optionally called with each node right before it is updated
+    :param after_update: Callable - Optionally called with each node right after it is updated
+    :return: int - The delta left to be applied to stop (0 if the walk reached the top of the tree)
+    """
+    while node is not None and node is not stop and delta:
+        with lock_for(node) if lock_for is not None else NULL_CONTEXT:
+            if before_update is not None:
+                before_update(node)
+            node.children_size += delta
+            old_size = node.size
+            node.size = node.size_for(node.children_size)
+            delta = node.size - old_size
+            if after_update is not None and delta:
+                after_update(node)
+            node = getattr(node, 'parent', None)
+
+    return delta if node is stop else 0
 
 
 def calc_size(children: List, size: int = 0):
@@ -41,6 +69,21 @@ def calc_size(children: List, size: int = 0):
     return size
 
 
+def drive_name(path) -> Optional[str]:
+    """
+    Get the name of the drive a path is on, i.e. its first component (e.g. /root for /root/folder)
+    :param path: str - An absolute path
+    :return: str - The name of the drive, or None if the path has no drive component
+    """
+    if not path:
+        return None
+    parts = Path(normalize_path(path)).parts
+    if len(parts) < 2 or parts[0] != os.sep:
+        return None
+
+    return os.path.join(parts[0], parts[1])
+
+
 def get_parent_path_and_name(full_path: str):
     if not full_path:
         return None, None
@@ -53,9 +96,12 @@ def get_parent_path_and_name(full_path: str):
 
 
 def valid_move_operation(dest_path: str, dest_name: str, dest_parent_node, source_path: str, source_node) -> bool:
-    # Raise if attempting to move entity into itself
-    if dest_parent_node == source_node:
-        raise IllegalFileSystemOperation(errno.ENOENT, os.strerror(errno.ENOENT), dest_parent_node)
+    # Raise if attempting to move entity into itself or one of its descendants
+    ancestor = dest_parent_node
+    while ancestor is not None:
+        if ancestor is source_node:
+            raise IllegalFileSystemOperation(errno.ENOENT, os.strerror(errno.ENOENT), dest_path)
+        ancestor = getattr(ancestor, 'parent', None)
     # Raise if the source node or parent path doesn't exist
     if not source_node or not dest_parent_node:
         missing_path = source_path if not source_node else dest_path
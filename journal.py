@@ -0,0 +1,420 @@
+"""
+Append-only journal of file system mutations, with crash recovery and compaction into snapshots.
+
+Each record is framed as: payload length (uint32) | payload | CRC32 of payload (uint32).  A torn or corrupt
+record at the end of the journal (e.g. after a crash mid-write) ends the replay; everything before it is kept.
+Opening a Journal cuts such a tail off (see repair), so that the records appended after a restart are replayed.
+
+Every record has a log sequence number (LSN): the offset of its end in the journal as if it had never been
+truncated.  A compacted journal starts with an OP_BASE record holding the LSN it resumes from, and a snapshot
+stores the LSN of the last record it reflects, so that replaying a journal over a snapshot skips the records the
+snapshot already holds.
+
+    python journal.py compact --journal fs.journal --snapshot fs.snapshot
+
+A Journal notices that its file was replaced by a compaction and appends to the new file from then on, but the
+records it appends while the compaction runs are only kept if the compaction is given the Journal (the command
+line can't be, so only run it while no process appends to the journal).
+"""
+import argparse
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+from file_system_entities.entity_types_enum import EntityTypes
+
+FSYNC_ALWAYS = 'always'
+FSYNC_BATCH = 'batch'
+FSYNC_NEVER = 'never'
+FSYNC_POLICIES = (FSYNC_ALWAYS, FSYNC_BATCH, FSYNC_NEVER)
+
+OP_CREATE = 1
+OP_DELETE = 2
+OP_MOVE = 3
+OP_WRITE = 4
+OP_APPEND = 5
+OP_WRITE_RANGE = 6
+OP_CREATE_DRIVE = 7
+OP_DELETE_DRIVE = 8
+# The LSN of the end of the records dropped from the journal; only ever the first record, and not itself counted
+OP_BASE = 9
+
+FRAME = struct.Struct('<I')
+OP = struct.Struct('<BB')
+STRING_LENGTH = struct.Struct('<I')
+
+
+def encode_record(op: int, *args) -> bytes:
+    """
+    Encode a mutation as a journal record payload
+    :param op: int - One of the OP_* codes
+    :param args: The arguments of the mutation; an EntityTypes member followed by strings for OP_CREATE,
+            strings otherwise (the offset of OP_WRITE_RANGE is encoded as a string)
+    :return: bytes
+    """
+    type_value = 0
+    if op == OP_CREATE:
+        type_value = args[0].value
+        args = args[1:]
+    parts = [OP.pack(op, type_value)]
+    for arg in args:
+        encoded = str(arg).encode('utf-8')
+        parts.append(STRING_LENGTH.pack(len(encoded)))
+        parts.append(encoded)
+
+    return b''.join(parts)
+
+
+def decode_record(payload: bytes) -> Tuple:
+    """
+    Decode a journal record payload
+    :param payload: bytes
+    :return: Tuple - (op, *args), see encode_record
+    """
+    op, type_value = OP.unpack_from(payload, 0)
+    offset = OP.size
+    args = []
+    while offset < len(payload):
+        length, = STRING_LENGTH.unpack_from(payload, offset)
+        offset += STRING_LENGTH.size
+        args.append(payload[offset:offset + length].decode('utf-8'))
+        offset += length
+    if op == OP_CREATE:
+        args.insert(0, EntityTypes(type_value))
+
+    return (op, *args)
+
+
+def frame(payload: bytes) -> bytes:
+    """
+    Frame a record payload (see the module docstring)
+    :param payload: bytes
+    :return: bytes
+    """
+    return FRAME.pack(len(payload)) + payload + FRAME.pack(zlib.crc32(payload))
+
+
+def read_frames(journal_file: BinaryIO) -> Iterator[Tuple[int, bytes]]:
+    """
+    Read the framed payloads of a journal from the current position, stopping at the first torn or corrupt record
+    :param journal_file: BinaryIO - The journal file, opened for reading
+    :return: Iterator[Tuple[int, bytes]] - The offset of the end of each record in the file, and its payload
+    """
+    while True:
+        header = journal_file.read(FRAME.size)
+        if len(header) < FRAME.size:
+            return
+        length, = FRAME.unpack(header)
+        payload = journal_file.read(length)
+        checksum = journal_file.read(FRAME.size)
+        if len(payload) < length or len(checksum) < FRAME.size:
+            return
+        if FRAME.unpack(checksum)[0] != zlib.crc32(payload):
+            return
+        yield journal_file.tell(), payload
+
+
+def read_records_with_lsn(path: str) -> Iterator[Tuple[int, Tuple]]:
+    """
+    Read the records of a journal along with their LSNs, stopping at the first torn or corrupt record
+    :param path: str - The path of the journal file on disk
+    :return: Iterator[Tuple[int, Tuple]] - The LSN of each record, and the decoded record (see decode_record)
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb') as journal_file:
+        base = 0
+        for end, payload in read_frames(journal_file):
+            record = decode_record(payload)
+            if record[0] == OP_BASE:
+                base = int(record[1]) - end
+                continue
+            yield base + end, record
+
+
+def read_base(path: str) -> int:
+    """
+    Get the LSN of the start of a journal file
+    :param path: str - The path of the journal file on disk
+    :return: int - 0 unless the journal was truncated
+    """
+    if not os.path.exists(path):
+        return 0
+    with open(path, 'rb') as journal_file:
+        for end, payload in read_frames(journal_file):
+            record = decode_record(payload)
+            return int(record[1]) - end if record[0] == OP_BASE else 0
+
+    return 0
+
+
+def repair(path: str) -> int:
+    """
+    Cut a torn or corrupt tail off a journal, which would otherwise hide every record appended after it
+    :param path: str - The path of the journal file on disk
+    :return: int - The number of bytes cut off
+    """
+    if not os.path.exists(path):
+        return 0
+    with open(path, 'r+b') as journal_file:
+        end = 0
+        for end, _ in read_frames(journal_file):
+            pass
+        size = os.fstat(journal_file.fileno()).st_size
+        if size > end:
+            journal_file.truncate(end)
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+
+    return size - end
+
+
+def read_records(path: str) -> Iterator[Tuple]:
+    """
+    Read the records of a journal, stopping at the first torn or corrupt record
+    :param path: str - The path of the journal file on disk
+    :return: Iterator[Tuple] - The decoded records, see decode_record
+    """
+    for _, record in read_records_with_lsn(path):
+        yield record
+
+
+def replay(file_system, path: str) -> int:
+    """
+    Apply the records of a journal to a file system, skipping the ones it already reflects (see
+    FileSystem.journal_lsn)
+    :param file_system: FileSystem - The file system, in the state the journal started from
+    :param path: str - The path of the journal file on disk
+    :return: int - The number of records applied
+    """
+    count = 0
+    for lsn, (op, *args) in read_records_with_lsn(path):
+        if lsn <= file_system.journal_lsn:
+            continue
+        if op == OP_CREATE:
+            file_system.create(*args)
+        elif op == OP_DELETE:
+            file_system.delete(*args)
+        elif op == OP_MOVE:
+            file_system.move(*args)
+        elif op == OP_WRITE:
+            file_system.write_to_file(*args)
+        elif op == OP_APPEND:
+            file_system.append_to_file(*args)
+        elif op == OP_WRITE_RANGE:
+            path, offset, content = args
+            file_system.write_range(path, int(offset), content)
+        elif op == OP_CREATE_DRIVE:
+            file_system.create_drive(*args)
+        elif op == OP_DELETE_DRIVE:
+            file_system.delete_drive(*args)
+        file_system.journal_lsn = lsn
+        count += 1
+
+    return count
+
+
+def recover(journal_path: str, snapshot_path: str = None, zip_codec: str = None):
+    """
+    Rebuild a file system after a restart or crash: load the last snapshot, if any, and replay the journal on top
+    :param journal_path: str - The path of the journal file on disk
+    :param snapshot_path: str - The path of the snapshot file the journal started from
+    :param zip_codec: str - The zip_codec the file system was created with (see FileSystem)
+    :return: FileSystem
+    """
+    file_system = _load(snapshot_path, zip_codec)
+    with file_system.batch():
+        replay(file_system, journal_path)
+
+    return file_system
+
+
+def _load(snapshot_path: Optional[str], zip_codec: Optional[str]):
+    """
+    Load a snapshot, or start from an empty file system if there is none yet
+    :param snapshot_path: str - The path of the snapshot file on disk
+    :param zip_codec: str - See FileSystem
+    :return: FileSystem
+    """
+    from file_system import FileSystem
+
+    if snapshot_path and os.path.exists(snapshot_path):
+        return FileSystem.load(snapshot_path, zip_codec=zip_codec)
+    return FileSystem(zip_codec=zip_codec)
+
+
+def compact(journal_path: str, snapshot_path: str, journal: 'Journal' = None, zip_codec: str = None) -> int:
+    """
+    Fold a journal into a fresh snapshot, then drop the records the snapshot holds from the journal.  The snapshot
+    is replaced atomically and records the LSN it reflects, so a crash at any point leaves a snapshot and a journal
+    that recover to the same file system
+    :param journal_path: str - The path of the journal file on disk
+    :param snapshot_path: str - The path of the snapshot file the journal started from, which is replaced
+    :param journal: Journal - The journal appending to journal_path in this process, if any; the records it appends
+            meanwhile are kept
+    :param zip_codec: str - The zip_codec the file system was created with (see FileSystem)
+    :return: int - The number of records folded into the snapshot
+    """
+    file_system = _load(snapshot_path, zip_codec)
+    with file_system.batch():
+        count = replay(file_system, journal_path)
+    file_system.save(snapshot_path)
+    if journal is not None:
+        journal.truncate(file_system.journal_lsn)
+    else:
+        truncate(journal_path, file_system.journal_lsn)
+
+    return count
+
+
+def truncate(path: str, lsn: int) -> None:
+    """
+    Atomically drop the records of a journal up to an LSN, keeping the LSNs of the records after it
+    :param path: str - The path of the journal file on disk
+    :param lsn: int - The LSN of the last record to be dropped
+    """
+    tail = [frame(encode_record(op, *args)) for record_lsn, (op, *args) in read_records_with_lsn(path)
+            if record_lsn > lsn]
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'wb') as journal_file:
+        journal_file.write(frame(encode_record(OP_BASE, lsn)))
+        journal_file.writelines(tail)
+        journal_file.flush()
+        os.fsync(journal_file.fileno())
+    os.replace(temp_path, path)
+
+
+class Journal:
+    def __init__(self, path: str, fsync_policy: str = FSYNC_BATCH, group_size: int = 128,
+                 group_interval: float = 0.01):
+        """
+        Open (or create) a journal for appending, cutting off the torn tail left by a crash, if any (see repair)
+        :param path: str - The path of the journal file on disk
+        :param fsync_policy: str - When records are made durable:
+                * FSYNC_ALWAYS - fsync after every record
+                * FSYNC_BATCH - group commit; fsync once group_size records are pending, and otherwise every
+                  group_interval seconds from a background thread
+                * FSYNC_NEVER - leave it to the operating system
+        :param group_size: int - The number of pending records that triggers a group commit
+        :param group_interval: float - The maximum delay, in seconds, of a group commit
+        """
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f'Unknown fsync policy {fsync_policy}')
+        self.path = path
+        self.fsync_policy = fsync_policy
+        self.group_size = group_size
+        self.group_interval = group_interval
+        repair(path)
+        self._file = open(path, 'ab')
+        # The LSN of the end of the journal
+        self.lsn: int = read_base(path) + self._file.tell()
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._closed = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        if fsync_policy == FSYNC_BATCH:
+            self._flusher = threading.Thread(target=self._flush_periodically, name='journal-flusher', daemon=True)
+            self._flusher.start()
+
+    def append(self, op: int, *args) -> None:
+        """
+        Append a record to the journal
+        :param op: int - One of the OP_* codes
+        :param args: The arguments of the mutation, see encode_record
+        """
+        self.append_many([(op, *args)])
+
+    def append_many(self, records) -> None:
+        """
+        Append several records to the journal with a single write (and at most one fsync)
+        :param records: Iterable[Tuple] - (op, *args) of each record
+        """
+        frames = [frame(encode_record(op, *args)) for op, *args in records]
+        if not frames:
+            return
+
+        data = b''.join(frames)
+        with self._lock:
+            if not os.fstat(self._file.fileno()).st_nlink:
+                # The journal was truncated by a compaction that wasn't given this Journal: append to the new file
+                self._file.close()
+                self._file = open(self.path, 'ab')
+            self._file.write(data)
+            self.lsn += len(data)
+            self._pending += len(frames)
+            group_full = self.fsync_policy == FSYNC_BATCH and self._pending >= self.group_size
+            if self.fsync_policy == FSYNC_ALWAYS or group_full:
+                self._sync()
+            elif self.fsync_policy == FSYNC_NEVER:
+                self._file.flush()
+                self._pending = 0
+
+    def sync(self) -> None:
+        """
+        Make every record appended so far durable
+        """
+        with self._lock:
+            self._sync()
+
+    def truncate(self, lsn: int) -> None:
+        """
+        Atomically drop the records up to an LSN (see truncate), and keep appending to the truncated journal
+        :param lsn: int - The LSN of the last record to be dropped
+        """
+        with self._lock:
+            self._sync()
+            self._file.close()
+            truncate(self.path, lsn)
+            self._file = open(self.path, 'ab')
+
+    def close(self) -> None:
+        self._closed.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        with self._lock:
+            if not self._file.closed:
+                self._sync()
+                self._file.close()
+
+    def _sync(self) -> None:
+        self._file.flush()
+        if self._pending:
+            os.fsync(self._file.fileno())
+            self._pending = 0
+
+    def _flush_periodically(self) -> None:
+        while not self._closed.wait(self.group_interval):
+            with self._lock:
+                if self._pending and not self._file.closed:
+                    self._sync()
+
+    def __enter__(self) -> 'Journal':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command')
+    compact_parser = subparsers.add_parser('compact', help='fold a journal into a fresh snapshot')
+    compact_parser.add_argument('--journal', required=True)
+    compact_parser.add_argument('--snapshot', required=True)
+    compact_parser.add_argument('--zip-codec', choices=('zlib', 'lzma'),
+                                help='the zip codec the file system was created with')
+    args = parser.parse_args()
+
+    if args.command == 'compact':
+        started = time.perf_counter()
+        count = compact(args.journal, args.snapshot, zip_codec=args.zip_codec)
+        print(f'Folded {count} records into {args.snapshot} in {time.perf_counter() - started:.3f}s')
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""
+Locks used by a FileSystem in concurrent mode.
+
+* Every public mutation holds the tree lock and the lock of each drive it touches in shared mode (drives in name
+  order); a batch, a snapshot of the whole file system, saving it, and creating or deleting a drive hold the tree
+  lock in exclusive mode.  A snapshot of a single drive, or FileSystem.lock_drive, holds only that drive in exclusive mode
+* Structural changes lock the containers (and entities) they touch through a fixed set of striped locks,
+  always acquired in stripe order, so that writers to unrelated subtrees don't contend
+* Size deltas are propagated hand over hand, holding a single stripe at a time
+* Moves are additionally serialized by a rename lock, so that two concurrent moves can't form a cycle
+* Lookups take no lock at all
+"""
+import threading
+from contextlib import ExitStack, contextmanager
+from typing import Dict, Iterator, Optional
+
+
+class _NullContext:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_CONTEXT = _NullContext()
+
+
+class ReadWriteLock:
+    def __init__(self):
+        """
+        A writer-preferring readers/writer lock.  Both modes are reentrant, and the thread holding the lock in
+        exclusive mode may also acquire it in shared mode
+        """
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._waiting_writers = 0
+        self._writer = None
+        self._writer_depth = 0
+        self._local = threading.local()
+
+    @contextmanager
+    def shared(self) -> Iterator[None]:
+        me = threading.get_ident()
+        depth = getattr(self._local, 'depth', 0)
+        if self._writer == me or depth:
+            self._local.depth = depth + 1
+            try:
+                yield
+            finally:
+                self._local.depth = depth
+            return
+
+        with self._condition:
+            while self._writer is not None or self._waiting_writers:
+                self._condition.wait()
+            self._readers += 1
+        self._local.depth = 1
+        try:
+            yield
+        finally:
+            self._local.depth = 0
+            with self._condition:
+                self._readers -= 1
+                if not self._readers:
+                    self._condition.notify_all()
+
+    @contextmanager
+    def exclusive(self) -> Iterator[None]:
+        me = threading.get_ident()
+        with self._condition:
+            if self._writer != me:
+                self._waiting_writers += 1
+                while self._writer is not None or self._readers:
+                    self._condition.wait()
+                self._waiting_writers -= 1
+                self._writer = me
+            self._writer_depth += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writer_depth -= 1
+                if not self._writer_depth:
+                    self._writer = None
+                    self._condition.notify_all()
+
+
+class LockManager:
+    def __init__(self, stripes: int = 64):
+        """
+        The locks of a FileSystem in concurrent mode
+        :param stripes: int - The number of striped locks entities are hashed onto
+        """
+        self.tree = ReadWriteLock()
+        self.rename = threading.Lock()
+        self._stripes = [threading.RLock() for _ in range(stripes)]
+        self._drives: Dict[str, ReadWriteLock] = {}
+        self._drives_lock = threading.Lock()
+
+    def drive(self, name: str) -> ReadWriteLock:
+        """
+        Get the lock of a drive
+        :param name: str - The name of the drive
+        :return: ReadWriteLock
+        """
+        lock = self._drives.get(name)
+        if lock is None:
+            with self._drives_lock:
+                lock = self._drives.setdefault(name, ReadWriteLock())
+
+        return lock
+
+    @contextmanager
+    def drives(self, *names: Optional[str]) -> Iterator[None]:
+        """
+        Hold the tree lock and the locks of several drives in shared mode, the drives acquired in name order
+        :param names: str - The names of the drives; None values are ignored
+        """
+        with ExitStack() as stack:
+            stack.enter_context(self.tree.shared())
+            for name in sorted({name for name in names if name is not None}):
+                stack.enter_context(self.drive(name).shared())
+            yield
+
+    def node(self, node) -> threading.RLock:
+        """
+        Get the lock of a single file system node (entity)
+        :param node: FileSystemEntity
+        :return: threading.RLock
+        """
+        return self._stripes[hash(node) % len(self._stripes)]
+
+    @contextmanager
+    def nodes(self, *nodes) -> Iterator[None]:
+        """
+        Hold the locks of several file system nodes (entities), acquired in stripe order
+        :param nodes: FileSystemEntity - The nodes to be locked; None values are ignored
+        """
+        indexes = sorted({hash(node) % len(self._stripes) for node in nodes if node is not None})
+        for index in indexes:
+            self._stripes[index].acquire()
+        try:
+            yield
+        finally:
+            for index in reversed(indexes):
+                self._stripes[index].release()
+
+
+class NullLockManager:
+    """
+    The locks of a FileSystem that isn't in concurrent mode, none of which does anything
+    """
+    def __init__(self):
+        self.tree = self
+        self.rename = NULL_CONTEXT
+
+    def shared(self) -> _NullContext:
+        return NULL_CONTEXT
+
+    def exclusive(self) -> _NullContext:
+        return NULL_CONTEXT
+
+    def drive(self, name: str) -> 'NullLockManager':
+        return self
+
+    def drives(self, *names: Optional[str]) -> _NullContext:
+        return NULL_CONTEXT
+
+    def node(self, node) -> _NullContext:
+        return NULL_CONTEXT
+
+    def nodes(self, *nodes) -> _NullContext:
+        return NULL_CONTEXT
@@ -0,0 +1,281 @@
+"""
+Operation metrics and profiling hooks of a FileSystem.
+
+Every instrumented operation is counted and timed into a latency histogram, and pre/post hooks are called around
+it.  Lookups also count the index hits and misses and the nodes visited walking the tree, and size propagation
+counts every ancestor it updates, so that a slow operation can be told apart as a deep lookup or a wide size
+update.  Optionally, a sample of the operations runs under cProfile.
+"""
+import cProfile
+import functools
+import io
+import math
+import pstats
+import random
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from locking import NULL_CONTEXT
+
+# Latencies are bucketed by powers of two of microseconds: bucket i holds the latencies of at most 2 ** i us
+HISTOGRAM_BUCKETS = 32
+
+
+class LatencyHistogram:
+    __slots__ = ('count', 'total', 'min', 'max', 'buckets')
+
+    def __init__(self):
+        """
+        A histogram of latencies with logarithmic buckets
+        """
+        self.count = 0
+        self.total = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+        self.buckets = [0] * HISTOGRAM_BUCKETS
+
+    def record(self, seconds: float) -> None:
+        """
+        Add a latency to the histogram
+        :param seconds: float
+        """
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+        bucket = (math.ceil(seconds * 1e6) - 1).bit_length() if seconds > 1e-6 else 0
+        self.buckets[min(bucket, HISTOGRAM_BUCKETS - 1)] += 1
+
+    def percentile(self, percent: float) -> Optional[float]:
+        """
+        Estimate a percentile of the latencies, as the upper bound of the bucket it falls in
+        :param percent: float - Between 0 and 100
+        :return: float - In seconds, or None if the histogram is empty
+        """
+        if not self.count:
+            return None
+        rank = percent / 100 * self.count
+        seen = 0
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= rank:
+                return min(2 ** bucket / 1e6, self.max)
+
+        return self.max
+
+    def export(self) -> Dict:
+        """
+        :return: Dict - The count, total, min, max and estimated percentiles (in seconds), and the non-empty buckets
+                as {upper bound in microseconds: count}
+        """
+        return {
+            'count': self.count,
+            'total_seconds': self.total,
+            'min_seconds': self.min,
+            'max_seconds': self.max,
+            'p50_seconds': self.percentile(50),
+            'p90_seconds': self.percentile(90),
+            'p99_seconds': self.percentile(99),
+            'buckets_us': {2 ** bucket: count for bucket, count in enumerate(self.buckets) if count},
+        }
+
+
+class _Measurement:
+    __slots__ = ('metrics', 'operation', 'args', 'start', 'profiled')
+
+    def __init__(self, metrics: 'Metrics', operation: str, args: tuple):
+        self.metrics = metrics
+        self.operation = operation
+        self.args = args
+
+    def __enter__(self):
+        for hook in self.metrics.pre_hooks:
+            hook(self.operation, self.args)
+        self.profiled = self.metrics._start_profile()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = time.perf_counter() - self.start
+        if self.profiled:
+            self.metrics._stop_profile()
+        self.metrics._record(self.operation, seconds, exc_value)
+        for hook in self.metrics.post_hooks:
+            hook(self.operation, self.args, seconds, exc_value)
+        return False
+
+
+class Metrics:
+    enabled = True
+
+    def __init__(self):
+        """
+        The metrics of a FileSystem (see FileSystem.enable_metrics)
+        """
+        self.counters: Dict[str, int] = {}
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        # Called with (operation, args) before each operation
+        self.pre_hooks: List[Callable[[str, tuple], None]] = []
+        # Called with (operation, args, seconds, error or None) after each operation
+        self.post_hooks: List[Callable[[str, tuple, float, Optional[BaseException]], None]] = []
+        self.profile_sample_rate = 0.0
+        self._profiler: Optional[cProfile.Profile] = None
+        self._profiling = False
+        self._lock = threading.Lock()
+
+    def measure(self, operation: str, *args) -> _Measurement:
+        """
+        Count and time an operation, and call the hooks around it
+        :param operation: str - The name of the operation
+        :param args: The arguments of the operation, given to the hooks
+        :return: A context manager wrapping the operation
+        """
+        return _Measurement(self, operation, args)
+
+    def count(self, counter: str, amount: int = 1) -> None:
+        """
+        Increment a counter
+        :param counter: str - The name of the counter
+        :param amount: int
+        """
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def size_propagation_step(self, node) -> None:
+        """
+        Count an ancestor updated by a size propagation (a before_update hook of propagate_size_delta)
+        """
+        self.count('size_propagation_steps')
+
+    def add_hooks(self, pre: Callable[[str, tuple], None] = None,
+                  post: Callable[[str, tuple, float, Optional[BaseException]], None] = None) -> None:
+        """
+        Register callbacks to be called around every operation
+        :param pre: Callable - Called with (operation, args) before each operation
+        :param post: Callable - Called with (operation, args, seconds, error or None) after each operation
+        """
+        if pre is not None:
+            self.pre_hooks.append(pre)
+        if post is not None:
+            self.post_hooks.append(post)
+
+    def enable_profiling(self, sample_rate: float = 0.01) -> None:
+        """
+        Run a random sample of the operations under cProfile (one at a time), accumulating into one profile
+        :param sample_rate: float - The fraction of the operations to profile; 0 disables profiling
+        """
+        self.profile_sample_rate = sample_rate
+        if sample_rate and self._profiler is None:
+            self._profiler = cProfile.Profile()
+
+    def profile_stats(self, sort: str = 'cumulative', limit: int = 20) -> List[Dict]:
+        """
+        Get the most expensive functions of the profiled operations
+        :param sort: str - A pstats sort key
+        :param limit: int - How many functions to return
+        :return: List[Dict] - The file, line, function, call count, total time and cumulative time of each function
+        """
+        with self._lock:
+            # Building the stats disables the profiler, so it can't be done while an operation is being profiled
+            if self._profiler is None or self._profiling:
+                return []
+            try:
+                stats = pstats.Stats(self._profiler, stream=io.StringIO())
+            except TypeError:
+                # Nothing was profiled yet
+                return []
+        stats.sort_stats(sort)
+        functions = []
+        for file_name, line, function in stats.fcn_list[:limit]:
+            _, calls, total_time, cumulative_time, _ = stats.stats[(file_name, line, function)]
+            functions.append({'file': file_name, 'line': line, 'function': function, 'calls': calls,
+                              'total_seconds': total_time, 'cumulative_seconds': cumulative_time})
+
+        return functions
+
+    def export(self) -> Dict:
+        """
+        Get a snapshot of every metric as plain dicts
+        :return: Dict - The 'operations' (latency histograms and error counts by operation), the 'counters', and the
+                'profile' if profiling is enabled
+        """
+        with self._lock:
+            operations = {operation: histogram.export() for operation, histogram in self.histograms.items()}
+            for operation, exported in operations.items():
+                exported['errors'] = self.counters.get(f'{operation}.errors', 0)
+            counters = {counter: value for counter, value in self.counters.items() if not counter.endswith('.errors')}
+        export = {'operations': operations, 'counters': counters}
+        if self._profiler is not None:
+            export['profile'] = self.profile_stats()
+
+        return export
+
+    def reset(self) -> None:
+        """
+        Clear every metric and the profile, keeping the hooks
+        """
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+            if self._profiler is not None:
+                self._profiler = cProfile.Profile()
+
+    def _record(self, operation: str, seconds: float, error: Optional[BaseException]) -> None:
+        with self._lock:
+            histogram = self.histograms.get(operation)
+            if histogram is None:
+                histogram = self.histograms[operation] = LatencyHistogram()
+            histogram.record(seconds)
+            if error is not None:
+                self.counters[f'{operation}.errors'] = self.counters.get(f'{operation}.errors', 0) + 1
+
+    def _start_profile(self) -> bool:
+        if not self.profile_sample_rate or random.random() >= self.profile_sample_rate:
+            return False
+        with self._lock:
+            # Nested and concurrent operations are never sampled while one is being profiled
+            if self._profiling or self._profiler is None:
+                return False
+            self._profiling = True
+        self._profiler.enable()
+        return True
+
+    def _stop_profile(self) -> None:
+        self._profiler.disable()
+        with self._lock:
+            self._profiling = False
+
+
+class NullMetrics:
+    """
+    Stands in for Metrics while a file system isn't instrumented
+    """
+    enabled = False
+
+    def measure(self, operation: str, *args):
+        return NULL_CONTEXT
+
+    def count(self, counter: str, amount: int = 1) -> None:
+        pass
+
+
+def instrumented(operation: str) -> Callable:
+    """
+    Decorate a FileSystem method so that it is measured as an operation by the metrics of the file system
+    :param operation: str - The name of the operation
+    :return: Callable - The decorator
+    """
+    def decorator(method: Callable) -> Callable:
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            metrics = self.metrics
+            if not metrics.enabled:
+                return method(self, *args, **kwargs)
+            with metrics.measure(operation, *args):
+                return method(self, *args, **kwargs)
+        return wrapper
+
+    return decorator
@@ -0,0 +1,68 @@
+from typing import Callable, List, Tuple
+
+from file_system_entities.file_system_entities import FileSystemEntity
+from worker import IDLE_TIMEOUT, Worker
+
+# The maximum number of sweep requests handled by a single sweep
+SWEEP_BATCH = 1 << 20
+
+
+class Reclaimer:
+    def __init__(self, reclaim: Callable[[FileSystemEntity, str], None], sweep: Callable[[], None] = None,
+                 idle_timeout: float = IDLE_TIMEOUT):
+        """
+        Tears deleted subtrees down on a background thread: deregisters them from the indexes and caches of the file
+        system, then drops the last reference to them, so that freeing a huge subtree never runs on the thread that
+        deleted it.  Also sweeps the stale entries left behind by moves and deletes out of the caches of the file
+        system, on a thread of its own.  The threads are only running while there is work to do (see Worker)
+        :param reclaim: Callable[[FileSystemEntity, str], None] - Deregisters a deleted subtree, given its root and
+                the normalized path it was deleted from
+        :param sweep: Callable[[], None] - Sweeps the caches of the file system
+        :param idle_timeout: float - See IDLE_TIMEOUT
+        """
+        self._reclaim = reclaim
+        self._sweep = sweep
+        self._worker = Worker(self._run, 'file-system-reclaimer', idle_timeout)
+        # Every sweep requested while one runs is handled by a single sweep afterwards
+        self._sweeper = Worker(self._run_sweep, 'file-system-sweeper', idle_timeout, max_batch=SWEEP_BATCH)
+
+    @property
+    def pending(self) -> int:
+        """
+        The number of deleted subtrees not reclaimed yet
+        :return: int
+        """
+        return self._worker.pending
+
+    def submit(self, node: FileSystemEntity, path: str) -> None:
+        """
+        Hand a detached subtree over to the reclaimer
+        :param node: FileSystemEntity - The root of the deleted subtree
+        :param path: str - The normalized path it was deleted from
+        """
+        self._worker.submit((node, path))
+
+    def request_sweep(self) -> None:
+        """
+        Have the caches of the file system swept (see FileSystem._sweep), in the background
+        """
+        if self._sweep is not None:
+            self._sweeper.submit(None)
+
+    def wait(self) -> None:
+        """
+        Block until every subtree submitted so far has been reclaimed, and every sweep requested so far is done,
+        then raise the first error raised while reclaiming or sweeping, if any (the subtree is freed all the same,
+        only leaving stale entries behind, which lookups revalidate)
+        """
+        try:
+            self._worker.wait()
+        finally:
+            self._sweeper.wait()
+
+    def _run(self, items: List[Tuple[FileSystemEntity, str]]) -> None:
+        for node, path in items:
+            self._reclaim(node, path)
+
+    def _run_sweep(self, items: List[None]) -> None:
+        self._sweep()
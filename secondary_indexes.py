@@ -0,0 +1,264 @@
+"""
+Secondary indexes of a file system: name => nodes, type => nodes, and per type a sorted size index
+"""
+import enum
+import heapq
+import threading
+from bisect import bisect_left, insort
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from file_system_entities.file_system_entities import FileSystemEntity
+from tree_walk import iter_tree
+from zip_compression import is_compressed
+
+# Entries are (size, id(node)), so that nodes of the same size are kept apart
+_SizeKey = Tuple[int, int]
+
+
+class SortedSizeIndex:
+    # Buckets are split once they hold twice this many entries
+    LOAD = 512
+
+    def __init__(self):
+        """
+        Nodes sorted by size, stored as a list of sorted buckets so that an update costs O(log n + LOAD) rather
+        than shifting one huge list
+        """
+        self._buckets: List[List[_SizeKey]] = []
+        # The greatest key of each bucket
+        self._maxes: List[_SizeKey] = []
+        self._nodes: Dict[int, FileSystemEntity] = {}
+        self._sizes: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    def __contains__(self, node: FileSystemEntity) -> bool:
+        return id(node) in self._nodes
+
+    def add(self, node: FileSystemEntity) -> None:
+        """
+        Add a node with its current size, or move it to its current size if it is already indexed
+        :param node: FileSystemEntity
+        """
+        size = self._sizes.get(id(node))
+        if size is not None:
+            if size == node.size:
+                return
+            self._remove_key((size, id(node)))
+        self._nodes[id(node)] = node
+        self._sizes[id(node)] = node.size
+        self._insert_key((node.size, id(node)))
+
+    def discard(self, node: FileSystemEntity) -> None:
+        """
+        Remove a node, if it is indexed
+        :param node: FileSystemEntity
+        """
+        size = self._sizes.pop(id(node), None)
+        if size is not None:
+            del self._nodes[id(node)]
+            self._remove_key((size, id(node)))
+
+    def iter_descending(self) -> Iterator[FileSystemEntity]:
+        """
+        Iterate over the nodes from the largest to the smallest
+        :return: Iterator[FileSystemEntity]
+        """
+        for bucket in reversed(self._buckets):
+            for _, node_id in reversed(bucket):
+                yield self._nodes[node_id]
+
+    def iter_range(self, min_size: int = None, max_size: int = None) -> Iterator[FileSystemEntity]:
+        """
+        Iterate over the nodes whose size is between min_size and max_size (inclusive), from the smallest
+        :param min_size: int - No lower bound if None
+        :param max_size: int - No upper bound if None
+        :return: Iterator[FileSystemEntity]
+        """
+        index = 0 if min_size is None else bisect_left(self._maxes, (min_size, -1))
+        if index == len(self._buckets):
+            return
+        start = 0 if min_size is None else bisect_left(self._buckets[index], (min_size, -1))
+        for bucket in self._buckets[index:]:
+            for size, node_id in bucket[start:]:
+                if max_size is not None and size > max_size:
+                    return
+                yield self._nodes[node_id]
+            start = 0
+
+    def _insert_key(self, key: _SizeKey) -> None:
+        if not self._buckets:
+            self._buckets.append([key])
+            self._maxes.append(key)
+            return
+
+        index = min(bisect_left(self._maxes, key), len(self._buckets) - 1)
+        bucket = self._buckets[index]
+        insort(bucket, key)
+        self._maxes[index] = bucket[-1]
+        if len(bucket) > 2 * self.LOAD:
+            self._buckets[index:index + 1] = [bucket[:self.LOAD], bucket[self.LOAD:]]
+            self._maxes[index:index + 1] = [bucket[self.LOAD - 1], bucket[-1]]
+
+    def _remove_key(self, key: _SizeKey) -> None:
+        index = bisect_left(self._maxes, key)
+        bucket = self._buckets[index]
+        del bucket[bisect_left(bucket, key)]
+        if bucket:
+            self._maxes[index] = bucket[-1]
+        else:
+            del self._buckets[index]
+            del self._maxes[index]
+
+
+class SecondaryIndexes:
+    def __init__(self):
+        """
+        Indexes of the attached nodes of a file system by name, by type and by size (per type)
+        """
+        self._by_name: Dict[str, Dict[int, FileSystemEntity]] = {}
+        self._by_type: Dict[enum.Enum, Dict[int, FileSystemEntity]] = {}
+        self._sizes: Dict[enum.Enum, SortedSizeIndex] = {}
+        self._lock = threading.RLock()
+
+    def add_subtree(self, root: FileSystemEntity) -> None:
+        """
+        Index a node and all of its descendants (the subtrees of compressed zip files are indexed once they are
+        decompressed)
+        :param root: FileSystemEntity
+        """
+        with self._lock:
+            for node, _, _ in iter_tree(root, prune=is_compressed):
+                self.add(node)
+
+    def add(self, node: FileSystemEntity) -> None:
+        """
+        Index a single node
+        :param node: FileSystemEntity
+        """
+        with self._lock:
+            self._by_name.setdefault(node.name, {})[id(node)] = node
+            self._by_type.setdefault(node.type, {})[id(node)] = node
+            self._sizes.setdefault(node.type, SortedSizeIndex()).add(node)
+
+    def remove_subtree(self, root: FileSystemEntity) -> None:
+        """
+        Stop indexing a node and all of its descendants
+        :param root: FileSystemEntity
+        """
+        for node, _, _ in iter_tree(root, prune=is_compressed):
+            self.discard(node)
+
+    def discard(self, node: FileSystemEntity) -> None:
+        """
+        Stop indexing a single node.  Subtrees are removed one node at a time, so that removing a huge subtree never
+        holds up queries for long
+        :param node: FileSystemEntity
+        """
+        with self._lock:
+            self._discard(self._by_name, node.name, node)
+            self._discard(self._by_type, node.type, node)
+            sizes = self._sizes.get(node.type)
+            if sizes is not None:
+                sizes.discard(node)
+
+    def rename(self, node: FileSystemEntity, old_name: str) -> None:
+        """
+        Re-index a node under its current name
+        :param node: FileSystemEntity
+        :param old_name: str - The name the node is indexed under
+        """
+        if node.name == old_name:
+            return
+        with self._lock:
+            self._discard(self._by_name, old_name, node)
+            self._by_name.setdefault(node.name, {})[id(node)] = node
+
+    def resize(self, node: FileSystemEntity) -> None:
+        """
+        Re-index a node under its current size, if it is indexed
+        :param node: FileSystemEntity
+        """
+        with self._lock:
+            sizes = self._sizes.get(node.type)
+            if sizes is not None and node in sizes:
+                sizes.add(node)
+
+    def find(self, name: str = None, type: enum.Enum = None, min_size: int = None, max_size: int = None,
+             largest: int = None) -> List[FileSystemEntity]:
+        """
+        Query the indexed nodes.  Every given criterion must match
+        :param name: str - The exact name of the nodes
+        :param type: enum.Enum - The type of the nodes
+        :param min_size: int - The minimum size of the nodes (inclusive)
+        :param max_size: int - The maximum size of the nodes (inclusive)
+        :param largest: int - Only return this many nodes, the largest first
+        :return: List[FileSystemEntity] - Ordered by size (largest first if largest is given, smallest first
+                otherwise) unless only name and/or type are given
+        """
+        with self._lock:
+            if name is not None:
+                candidates = list(self._by_name.get(name, {}).values())
+                if type is not None:
+                    candidates = [node for node in candidates if node.type == type]
+                if min_size is not None:
+                    candidates = [node for node in candidates if node.size >= min_size]
+                if max_size is not None:
+                    candidates = [node for node in candidates if node.size <= max_size]
+                if largest is not None:
+                    return heapq.nlargest(largest, candidates, key=lambda node: node.size)
+                if min_size is not None or max_size is not None:
+                    candidates.sort(key=lambda node: node.size)
+                return candidates
+
+            if min_size is None and max_size is None and largest is None:
+                if type is not None:
+                    return list(self._by_type.get(type, {}).values())
+                return [node for nodes in self._by_type.values() for node in nodes.values()]
+
+            size_indexes = [self._sizes[type]] if type in self._sizes else []
+            if type is None:
+                size_indexes = list(self._sizes.values())
+
+            if largest is not None:
+                descending = heapq.merge(*(sizes.iter_descending() for sizes in size_indexes),
+                                         key=lambda node: node.size, reverse=True)
+                matches = []
+                for node in descending:
+                    if len(matches) == largest or (min_size is not None and node.size < min_size):
+                        break
+                    if max_size is None or node.size <= max_size:
+                        matches.append(node)
+                return matches
+
+            return list(heapq.merge(*(sizes.iter_range(min_size, max_size) for sizes in size_indexes),
+                                    key=lambda node: node.size))
+
+    @staticmethod
+    def _discard(index: Dict, key, node: FileSystemEntity) -> None:
+        nodes = index.get(key)
+        if nodes is not None:
+            nodes.pop(id(node), None)
+            if not nodes:
+                del index[key]
+
+
+class NullSecondaryIndexes:
+    """
+    Stands in for SecondaryIndexes while a file system isn't indexed
+    """
+    def add_subtree(self, root: FileSystemEntity) -> None:
+        pass
+
+    def remove_subtree(self, root: FileSystemEntity) -> None:
+        pass
+
+    def rename(self, node: FileSystemEntity, old_name: str) -> None:
+        pass
+
+    def resize(self, node: FileSystemEntity) -> None:
+        pass
+
+    def find(self, *args, **kwargs) -> Optional[List[FileSystemEntity]]:
+        return None
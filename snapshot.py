@@ -0,0 +1,212 @@
+"""
+Binary snapshot format of a file system tree, laid out so that it can be memory-mapped and loaded lazily.
+
+    header | node table | heap
+
+The node table holds one fixed-size record per node, in breadth-first order, so that the children of a node are
+the contiguous records [first_child, first_child + child_count).  Drives are the first records of the table.
+Names and text file contents live in the heap, as UTF-8, and are referenced by offset and length.  Compressed zip
+files keep their codec and compressed size, but their subtree is stored uncompressed like any other.
+"""
+import mmap
+import os
+import struct
+from typing import Dict, List, Tuple
+
+from corrupt_snapshot_error import CorruptSnapshotError
+from file_system_entities.entity_factory import FileSystemEntityFactory
+from file_system_entities.entity_types_enum import EntityTypes
+from file_system_entities.file_system_entities import Drive, FileSystemEntity, LazyChildren, LazyContent
+from zip_compression import CODEC_IDS, CODEC_NAMES, CompressedZipFile
+
+MAGIC = b'OOFSSNAP'
+FORMAT_VERSION = 2
+# Versions this module still reads
+READABLE_VERSIONS = (1, 2)
+# magic, format version
+PREFIX = struct.Struct('<8sI')
+# magic, format version, drive count, node count, journal LSN (see journal.py), flags
+HEADER = struct.Struct('<8sIIIQI')
+HEADER_V1 = struct.Struct('<8sIII')
+# Set if the snapshot holds compressed zip files
+FLAG_COMPRESSED_ZIPS = 1
+# type, codec (see zip_compression.CODEC_IDS; 0 unless a compressed zip file), first child, child count, name
+# length, size, children size, name offset, content offset, content length
+NODE = struct.Struct('<BBIIIqqQQQ')
+# The same, without the codec
+NODE_V1 = struct.Struct('<BIIIqqQQQ')
+
+
+def write_snapshot(drives: Dict[str, FileSystemEntity], path: str, journal_lsn: int = 0) -> None:
+    """
+    Write the trees of the given drives to a snapshot file
+    :param drives: Dict[str, FileSystemEntity] - The drives to be saved, by name
+    :param path: str - The path of the snapshot file on disk
+    :param journal_lsn: int - The LSN of the last journal record the trees reflect
+    """
+    nodes: List[FileSystemEntity] = list(drives.values())
+    records = []
+    heap = bytearray()
+    flags = 0
+    index = 0
+    while index < len(nodes):
+        node = nodes[index]
+        index += 1
+        name = node.name.encode('utf-8')
+        name_offset = len(heap)
+        heap += name
+
+        children = getattr(node, 'children', None)
+        first_child, child_count, children_size = len(nodes), 0, 0
+        if children is not None:
+            child_count, children_size = len(children), node.children_size
+            nodes.extend(children.values())
+
+        content_offset, content_length = len(heap), 0
+        if hasattr(node, 'content'):
+            content = node.content.encode('utf-8')
+            content_length = len(content)
+            heap += content
+
+        codec_id = 0
+        if isinstance(node, CompressedZipFile):
+            codec_id = CODEC_IDS[node.codec]
+            flags |= FLAG_COMPRESSED_ZIPS
+        records.append(NODE.pack(node.type.value, codec_id, first_child, child_count, len(name), node.size,
+                                 children_size, name_offset, content_offset, content_length))
+
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'wb') as snapshot_file:
+        snapshot_file.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(drives), len(nodes), journal_lsn, flags))
+        snapshot_file.write(b''.join(records))
+        snapshot_file.write(heap)
+        snapshot_file.flush()
+        os.fsync(snapshot_file.fileno())
+    os.replace(temp_path, path)
+
+
+class SnapshotReader:
+    def __init__(self, path: str):
+        """
+        Memory-map a snapshot file.  Nodes are only built when they are first reached
+        :param path: str - The path of the snapshot file on disk
+        :raises CorruptSnapshotError
+        """
+        with open(path, 'rb') as snapshot_file:
+            try:
+                self._mmap = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise CorruptSnapshotError(f'Empty snapshot file {path}')
+
+        if len(self._mmap) < PREFIX.size:
+            raise CorruptSnapshotError(f'Truncated snapshot file {path}')
+        magic, version = PREFIX.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version not in READABLE_VERSIONS:
+            raise CorruptSnapshotError(f'Not a version {FORMAT_VERSION} snapshot file {path}')
+        header = HEADER if version >= 2 else HEADER_V1
+        if len(self._mmap) < header.size:
+            raise CorruptSnapshotError(f'Truncated snapshot file {path}')
+        _, _, self.drive_count, self.node_count, *rest = header.unpack_from(self._mmap, 0)
+        self.journal_lsn: int = rest[0] if rest else 0
+        self.has_compressed_zips: bool = bool(rest and rest[1] & FLAG_COMPRESSED_ZIPS)
+
+        self._node = NODE if version >= 2 else NODE_V1
+        self._node_offset = header.size
+        self._heap_offset = self._node_offset + self.node_count * self._node.size
+        if len(self._mmap) < self._heap_offset:
+            raise CorruptSnapshotError(f'Truncated snapshot file {path}')
+
+    def read_drives(self) -> Dict[str, FileSystemEntity]:
+        """
+        Build the drives of the snapshot, deferring everything below them
+        :return: Dict[str, FileSystemEntity] - The drives, by name
+        """
+        drives = {}
+        for index in range(self.drive_count):
+            drive = self._build_node(index, None)
+            drives[drive.name] = drive
+
+        return drives
+
+    def read_children(self, index: int, parent: FileSystemEntity) -> Dict[str, FileSystemEntity]:
+        """
+        Build the children of a container node
+        :param index: int - The index of the container in the node table
+        :param parent: FileSystemEntity - The container the children belong to
+        :return: Dict[str, FileSystemEntity] - The children, by name
+        """
+        first_child, child_count = self._record(index)[2:4]
+        children = {}
+        for child_index in range(first_child, first_child + child_count):
+            child = self._build_node(child_index, parent)
+            children[child.name] = child
+
+        return children
+
+    def read_content(self, index: int) -> str:
+        """
+        Read the content of a text file node
+        :param index: int - The index of the text file in the node table
+        :return: str
+        """
+        content_offset, content_length = self._record(index)[8:10]
+        return self._read_heap(content_offset, content_length)
+
+    def _record(self, index: int) -> Tuple:
+        if not 0 <= index < self.node_count:
+            raise CorruptSnapshotError(f'Node {index} is out of range')
+        record = self._node.unpack_from(self._mmap, self._node_offset + index * self._node.size)
+        # As laid out by NODE
+        return record if self._node is NODE else (record[0], 0) + record[1:]
+
+    def _read_heap(self, offset: int, length: int) -> str:
+        start = self._heap_offset + offset
+        if start + length > len(self._mmap):
+            raise CorruptSnapshotError('Heap reference is out of range')
+        return self._mmap[start:start + length].decode('utf-8')
+
+    def _build_node(self, index: int, parent: FileSystemEntity) -> FileSystemEntity:
+        type_value, codec_id, _, child_count, name_length, size, children_size, name_offset, _, content_length = \
+            self._record(index)
+        name = self._read_heap(name_offset, name_length)
+        entity_type = EntityTypes(type_value)
+
+        if entity_type is EntityTypes.DRIVE:
+            node = Drive(entity_type, name)
+        elif codec_id:
+            # Its compressed size is read below rather than computed from its children
+            node = CompressedZipFile.restore(entity_type, name, parent, CODEC_NAMES[codec_id])
+        else:
+            node = FileSystemEntityFactory.for_type(entity_type)(entity_type, name, parent)
+        node.size = size
+
+        if hasattr(node, 'children_size'):
+            node.children_size = children_size
+            if child_count:
+                node.defer_children(SnapshotChildren(self, index))
+        elif content_length:
+            node.defer_content(SnapshotContent(self, index))
+
+        return node
+
+
+class SnapshotChildren(LazyChildren):
+    __slots__ = ('reader', 'index')
+
+    def __init__(self, reader: SnapshotReader, index: int):
+        self.reader = reader
+        self.index = index
+
+    def load(self, parent: FileSystemEntity) -> Dict[str, FileSystemEntity]:
+        return self.reader.read_children(self.index, parent)
+
+
+class SnapshotContent(LazyContent):
+    __slots__ = ('reader', 'index')
+
+    def __init__(self, reader: SnapshotReader, index: int):
+        self.reader = reader
+        self.index = index
+
+    def load(self) -> str:
+        return self.reader.read_content(self.index)
@@ -0,0 +1,64 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+
+from async_file_system import AsyncFileSystem
+from file_system_entities.entity_types_enum import EntityTypes
+from helpers import MAIN_DRIVE
+
+
+class TestAsyncFileSystem(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.async_file_system = AsyncFileSystem(large_content_threshold=16)
+
+    def tearDown(self):
+        self.loop.run_until_complete(self.async_file_system.close())
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def run_async(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def test_mutations_should_be_applied_in_order(self):
+        async def mutate():
+            folder_path = os.path.join(MAIN_DRIVE, 'test_folder')
+            file_path = os.path.join(folder_path, 'text_file1')
+            # Queued together, so each operation relies on the previous ones having been applied first.  The tasks
+            # are scheduled one by one, as gather doesn't start its arguments in order before Python 3.7
+            await asyncio.gather(*[asyncio.ensure_future(operation) for operation in (
+                self.async_file_system.create(EntityTypes.FOLDER, 'test_folder', MAIN_DRIVE),
+                self.async_file_system.create(EntityTypes.TEXT_FILE, 'text_file1', folder_path),
+                self.async_file_system.write_to_file(file_path, 'Content that is large enough'),
+                self.async_file_system.move(file_path, os.path.join(MAIN_DRIVE, 'moved_file')),
+            )])
+            return await self.async_file_system.find_node_by_path(os.path.join(MAIN_DRIVE, 'moved_file'))
+
+        moved = self.run_async(mutate())
+        self.assertEqual('Content that is large enough', moved.content)
+        self.assertEqual(len(moved.content), self.async_file_system.file_system.get_root_node().size)
+
+    def test_errors_should_be_raised_to_the_caller(self):
+        with self.assertRaises(FileNotFoundError):
+            self.run_async(self.async_file_system.delete(os.path.join(MAIN_DRIVE, 'i_dont_exist')))
+        # Writes this large run in the executor
+        with self.assertRaises(FileNotFoundError):
+            self.run_async(self.async_file_system.write_to_file(os.path.join(MAIN_DRIVE, 'i_dont_exist'), 'x' * 16))
+        created = self.run_async(self.async_file_system.create(EntityTypes.FOLDER, 'test_folder', MAIN_DRIVE))
+        self.assertEqual('test_folder', created.name)
+
+    def test_save_and_load_should_round_trip(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            snapshot_path = os.path.join(temp_dir, 'file_system.snapshot')
+            self.run_async(self.async_file_system.create(EntityTypes.TEXT_FILE, 'text_file1', MAIN_DRIVE))
+            self.run_async(self.async_file_system.write_to_file(os.path.join(MAIN_DRIVE, 'text_file1'), 'Content'))
+            self.run_async(self.async_file_system.save(snapshot_path))
+            loaded = self.run_async(AsyncFileSystem.load(snapshot_path))
+            found = self.run_async(loaded.find_node_by_path(os.path.join(MAIN_DRIVE, 'text_file1')))
+            self.assertEqual('Content', found.content)
+        finally:
+            shutil.rmtree(temp_dir)
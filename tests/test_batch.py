@@ -0,0 +1,63 @@
+import os
+import unittest
+
+from file_system_entities.entity_types_enum import EntityTypes
+from file_system import FileSystem
+from helpers import MAIN_DRIVE
+
+
+class TestFileSystemBatch(unittest.TestCase):
+    def setUp(self):
+        self.file_system = FileSystem()
+        self.test_folder = self.file_system.create(EntityTypes.FOLDER, 'test_folder', MAIN_DRIVE)
+        self.text_file1 = self.file_system.create(EntityTypes.TEXT_FILE, 'text_file1', self.test_folder.path)
+        self.file_system.write_to_file(self.text_file1.path, 'Content')
+
+    def test_bulk_create_should_create_entities(self):
+        zip_path = os.path.join(MAIN_DRIVE, 'zip_file1')
+        with self.file_system.batch() as batch:
+            created = batch.bulk_create([
+                (EntityTypes.ZIP_FILE, 'zip_file1', MAIN_DRIVE),
+                (EntityTypes.TEXT_FILE, 'text_file2', zip_path),
+                (EntityTypes.TEXT_FILE, 'text_file3', zip_path),
+            ])
+        self.assertEqual(['zip_file1', 'text_file2', 'text_file3'], [entity.name for entity in created])
+        self.assertIs(created[2], self.file_system.find_node_by_path(os.path.join(zip_path, 'text_file3')))
+
+    def test_batch_should_defer_sizes_until_the_end(self):
+        with self.file_system.batch() as batch:
+            zip_file = batch.create(EntityTypes.ZIP_FILE, 'zip_file1', self.test_folder.path)
+            text_file = batch.create(EntityTypes.TEXT_FILE, 'text_file2', zip_file.path)
+            batch.write_to_file(text_file.path, 'Some more content')
+            batch.move(self.text_file1.path, os.path.join(zip_file.path, 'text_file1'))
+            batch.write_to_file(self.text_file1.path, 'Other content')
+            self.assertEqual(len('Content'), self.test_folder.size)
+        expected_size = int(round((len('Some more content') + len('Other content')) / 2))
+        self.assertEqual(expected_size, self.test_folder.size)
+        self.assertEqual(expected_size, self.file_system.get_root_node().size)
+        self.assertEqual([], self.file_system.verify_sizes())
+
+    def test_batch_should_roll_back_on_error(self):
+        with self.assertRaises(FileExistsError):
+            with self.file_system.batch() as batch:
+                folder = batch.create(EntityTypes.FOLDER, 'new_folder', MAIN_DRIVE)
+                batch.move(self.text_file1.path, os.path.join(folder.path, 'moved_file'))
+                batch.write_to_file(os.path.join(folder.path, 'moved_file'), 'Changed content')
+                batch.delete(self.test_folder.path)
+                batch.create(EntityTypes.FOLDER, 'new_folder', MAIN_DRIVE)
+        root = self.file_system.get_root_node()
+        self.assertNotIn('new_folder', root.children)
+        self.assertIs(self.test_folder, root.children['test_folder'])
+        self.assertIs(self.text_file1, self.file_system.find_node_by_path(os.path.join(self.test_folder.path,
+                                                                                       'text_file1')))
+        self.assertEqual('Content', self.text_file1.content)
+        self.assertIsNone(self.file_system.find_node_by_path(os.path.join(MAIN_DRIVE, 'new_folder')))
+        self.assertEqual(len('Content'), root.size)
+        self.assertEqual([], self.file_system.verify_sizes())
+
+    def test_nested_batches_should_join_the_outer_batch(self):
+        with self.file_system.batch() as outer:
+            with self.file_system.batch() as inner:
+                self.assertIs(outer, inner)
+                inner.create(EntityTypes.FOLDER, 'new_folder', MAIN_DRIVE)
+        self.assertEqual([], self.file_system.verify_sizes())
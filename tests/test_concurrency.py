@@ -0,0 +1,157 @@
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+from file_system_entities.entity_types_enum import EntityTypes
+from file_system import FileSystem
+from helpers import MAIN_DRIVE
+from illegal_file_system_operation import IllegalFileSystemOperation
+
+
+class TestConcurrentFileSystem(unittest.TestCase):
+    THREADS = 8
+    OPERATIONS = 300
+
+    def setUp(self):
+        self.file_system = FileSystem(concurrent=True)
+        self.shared_folder = self.file_system.create(EntityTypes.ZIP_FILE, 'shared', MAIN_DRIVE)
+        for i in range(self.THREADS):
+            self.file_system.create(EntityTypes.FOLDER, f'folder{i}', MAIN_DRIVE)
+
+    def run_threads(self, target):
+        errors = []
+
+        def run(thread_index):
+            try:
+                target(thread_index)
+            except Exception as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([], errors)
+
+    def test_concurrent_mutations_should_keep_sizes_consistent(self):
+        def mutate(thread_index):
+            rng = random.Random(thread_index)
+            own_folder = os.path.join(MAIN_DRIVE, f'folder{thread_index}')
+            for i in range(self.OPERATIONS):
+                name = f'file{thread_index}_{i}'
+                path = os.path.join(own_folder, name)
+                self.file_system.create(EntityTypes.TEXT_FILE, name, own_folder)
+                self.file_system.write_to_file(path, 'x' * rng.randint(0, 50))
+                if i % 3 == 0:
+                    moved_path = os.path.join(self.shared_folder.path, name)
+                    self.file_system.move(path, moved_path)
+                    self.file_system.write_to_file(moved_path, 'y' * rng.randint(0, 50))
+                    if i % 2 == 0:
+                        self.file_system.delete(moved_path)
+                self.assertIsNotNone(self.file_system.find_node_by_path(own_folder))
+
+        self.run_threads(mutate)
+        self.assertEqual([], self.file_system.verify_sizes())
+        expected_files = self.THREADS * (self.OPERATIONS - len(range(0, self.OPERATIONS, 6)))
+        actual_files = len(self.shared_folder.children) + sum(
+            len(self.file_system.find_node_by_path(os.path.join(MAIN_DRIVE, f'folder{i}')).children)
+            for i in range(self.THREADS))
+        self.assertEqual(expected_files, actual_files)
+
+    def test_concurrent_moves_should_never_form_cycles(self):
+        def move_folders(thread_index):
+            rng = random.Random(thread_index)
+            for _ in range(self.OPERATIONS):
+                source, dest = rng.sample(range(self.THREADS), 2)
+                source_node = self.file_system.find_node_by_path(os.path.join(MAIN_DRIVE, f'folder{source}'))
+                dest_node = self.file_system.find_node_by_path(os.path.join(MAIN_DRIVE, f'folder{dest}'))
+                if source_node is None or dest_node is None:
+                    continue
+                try:
+                    moved = self.file_system.move(source_node.path, os.path.join(dest_node.path, source_node.name))
+                    self.file_system.move(moved.path, os.path.join(MAIN_DRIVE, moved.name))
+                except (FileNotFoundError, FileExistsError, IllegalFileSystemOperation):
+                    pass
+
+        self.run_threads(move_folders)
+        seen = set()
+        stack = [self.file_system.get_root_node()]
+        while stack:
+            node = stack.pop()
+            self.assertNotIn(id(node), seen)
+            seen.add(id(node))
+            stack.extend(getattr(node, 'children', {}).values())
+        self.assertEqual(self.THREADS + 2, len(seen))
+
+    def test_batch_should_be_isolated_from_other_threads(self):
+        def create_in_batches(thread_index):
+            for i in range(20):
+                with self.file_system.batch() as batch:
+                    folder = batch.create(EntityTypes.FOLDER, f'batch{thread_index}_{i}', MAIN_DRIVE)
+                    file = batch.create(EntityTypes.TEXT_FILE, 'file', folder.path)
+                    batch.write_to_file(file.path, 'Content')
+
+        self.run_threads(create_in_batches)
+        self.assertEqual(self.THREADS * 20 * len('Content'), self.file_system.get_root_node().size)
+        self.assertEqual([], self.file_system.verify_sizes())
+
+    def test_create_racing_delete_of_its_parent_should_not_be_lost(self):
+        parent_path = os.path.join(MAIN_DRIVE, 'parent')
+        child_path = os.path.join(parent_path, 'child')
+        # Switch threads as often as possible, to interleave the create between the lookup of the parent and its lock
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        self.addCleanup(sys.setswitchinterval, switch_interval)
+        for _ in range(self.OPERATIONS * 5):
+            self.file_system.create(EntityTypes.FOLDER, 'parent', MAIN_DRIVE)
+            barrier = threading.Barrier(2)
+            errors = []
+
+            def delete_parent():
+                barrier.wait()
+                self.file_system.delete(parent_path)
+
+            def create_child():
+                barrier.wait()
+                try:
+                    self.file_system.create(EntityTypes.TEXT_FILE, 'child', parent_path)
+                except FileNotFoundError:
+                    pass
+                except Exception as error:
+                    errors.append(error)
+
+            threads = [threading.Thread(target=delete_parent), threading.Thread(target=create_child)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual([], errors)
+            # Whichever won, the child must not be reachable through a stale path index entry
+            self.assertIsNone(self.file_system.find_node_by_path(child_path))
+            with self.assertRaises(FileNotFoundError):
+                self.file_system.write_to_file(child_path, 'Lost')
+        self.assertEqual([], self.file_system.verify_sizes())
+
+    def test_save_should_write_a_consistent_tree(self):
+        snapshot_path = os.path.join(tempfile.mkdtemp(), 'file_system.snapshot')
+        self.addCleanup(shutil.rmtree, os.path.dirname(snapshot_path))
+
+        def mutate_or_save(thread_index):
+            own_folder = os.path.join(MAIN_DRIVE, f'folder{thread_index}')
+            for i in range(self.OPERATIONS // 10):
+                if thread_index == 0:
+                    self.file_system.save(snapshot_path)
+                    self.assertEqual([], FileSystem.load(snapshot_path).verify_sizes())
+                    continue
+                name = f'file{i}'
+                self.file_system.create(EntityTypes.TEXT_FILE, name, own_folder)
+                self.file_system.write_to_file(os.path.join(own_folder, name), 'x' * i)
+                self.file_system.move(os.path.join(own_folder, name),
+                                      os.path.join(self.shared_folder.path, f'{name}_{thread_index}'))
+
+        self.run_threads(mutate_or_save)
@@ -0,0 +1,108 @@
+import gc
+import os
+import shutil
+import tempfile
+import unittest
+
+from content_store import ChunkedContentStore
+from file_system_entities.entity_types_enum import EntityTypes
+from file_system import FileSystem
+from helpers import MAIN_DRIVE
+from journal import Journal, recover
+
+
+class TestChunkedContentStore(unittest.TestCase):
+    def setUp(self):
+        self.store = ChunkedContentStore(chunk_size=4)
+
+    def test_identical_contents_should_share_chunks(self):
+        first = self.store.put('abcdefghij')
+        second = self.store.put('abcdefghij')
+        self.assertEqual(first.keys, second.keys)
+        self.assertEqual(3, len(self.store))
+        self.assertEqual('defghi', first.read(3, 9))
+
+    def test_append_and_write_range_should_keep_the_original_content(self):
+        original = self.store.put('abcdefghij')
+        appended = self.store.append(original, 'klmno')
+        self.assertEqual('abcdefghijklmno', appended.read())
+        # The full chunks before the end are reused as they are
+        self.assertEqual(original.keys[:2], appended.keys[:2])
+        self.assertEqual('abXYZW12ijklmno', self.store.write_range(appended, 2, 'XYZW12').read())
+        self.assertEqual('abcdefghijklm1234', self.store.write_range(appended, 13, '1234').read())
+        self.assertEqual('abcdefghij', original.read())
+        with self.assertRaises(ValueError):
+            self.store.write_range(original, 11, 'x')
+
+    def test_chunks_should_be_released_with_their_last_handle(self):
+        first = self.store.put('abcdefghij')
+        second = self.store.append(first, 'klm')
+        del first
+        gc.collect()
+        self.assertEqual(4, len(self.store))
+        del second
+        gc.collect()
+        self.assertEqual(0, len(self.store))
+
+    def test_contents_shorter_than_a_chunk_should_be_kept_inline(self):
+        self.assertEqual('abc', self.store.put('abc'))
+        self.assertEqual('aXc', self.store.write_range('abc', 1, 'X'))
+        self.assertEqual(0, len(self.store))
+        appended = self.store.append('ab', 'cd')
+        self.assertEqual('abcd', appended.read())
+        self.assertEqual(1, len(self.store))
+
+    def test_handles_collected_while_the_lock_is_held_should_not_deadlock(self):
+        handle = self.store.put('abcdefgh')
+        # As if the garbage collector ran the finalizer of the handle while the store was chunking another content
+        with self.store._lock:
+            del handle
+            gc.collect()
+        self.assertEqual(0, len(self.store))
+
+
+class TestFileSystemContents(unittest.TestCase):
+    def setUp(self):
+        self.file_system = FileSystem(content_store=ChunkedContentStore(chunk_size=4))
+        self.test_folder = self.file_system.create(EntityTypes.FOLDER, 'test_folder', MAIN_DRIVE)
+        self.text_file1 = self.file_system.create(EntityTypes.TEXT_FILE, 'text_file1', self.test_folder.path)
+        self.file_system.write_to_file(self.text_file1.path, 'Content')
+
+    def test_append_to_file_and_write_range_should_update_sizes(self):
+        self.file_system.append_to_file(self.text_file1.path, ' of text file 1')
+        self.file_system.write_range(self.text_file1.path, 0, 'CONTENT')
+        self.assertEqual('CONTENT of text file 1', self.text_file1.content)
+        self.assertEqual('text', self.file_system.read_range(self.text_file1.path, 11, 15))
+        self.assertEqual(22, self.test_folder.size)
+        self.assertEqual([], self.file_system.verify_sizes())
+
+    def test_batch_rollback_should_restore_the_content(self):
+        with self.assertRaises(FileNotFoundError):
+            with self.file_system.batch() as batch:
+                batch.append_to_file(self.text_file1.path, ' appended')
+                batch.write_range(self.text_file1.path, 0, 'X')
+                batch.delete(os.path.join(MAIN_DRIVE, 'i_dont_exist'))
+        self.assertEqual('Content', self.text_file1.content)
+        self.assertEqual(7, self.file_system.get_root_node().size)
+
+    def test_snapshots_should_keep_overwritten_contents(self):
+        snapshot = self.file_system.snapshot()
+        self.file_system.append_to_file(self.text_file1.path, ' appended')
+        gc.collect()
+        self.assertEqual('Content', snapshot.find_node_by_path(self.text_file1.path).content)
+        self.assertEqual('Content appended', self.text_file1.content)
+
+    def test_journal_should_replay_appends_and_ranged_writes(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            journal_path = os.path.join(temp_dir, 'file_system.journal')
+            with Journal(journal_path) as journal:
+                file_system = FileSystem(journal)
+                file_system.create(EntityTypes.TEXT_FILE, 'text_file1', MAIN_DRIVE)
+                path = os.path.join(MAIN_DRIVE, 'text_file1')
+                file_system.write_to_file(path, 'Content')
+                file_system.append_to_file(path, ' appended')
+                file_system.write_range(path, 8, 'APP')
+            self.assertEqual('Content APPended', recover(journal_path).find_node_by_path(path).content)
+        finally:
+            shutil.rmtree(temp_dir)
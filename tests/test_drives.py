@@ -0,0 +1,103 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from file_system_entities.entity_types_enum import EntityTypes
+from file_system_entities.file_system_entities import Drive
+from file_system import FileSystem
+from helpers import MAIN_DRIVE
+from illegal_file_system_operation import IllegalFileSystemOperation
+from journal import Journal, recover
+
+
+class TestDrives(unittest.TestCase):
+    def setUp(self):
+        self.file_system = FileSystem()
+        self.tenant = self.file_system.create_drive('tenant1')
+        self.test_folder = self.file_system.create(EntityTypes.FOLDER, 'test_folder', self.tenant.path)
+        self.text_file1 = self.file_system.create(EntityTypes.TEXT_FILE, 'text_file1', self.test_folder.path)
+        self.file_system.write_to_file(self.text_file1.path, 'Content')
+
+    def test_paths_should_be_routed_to_their_drive(self):
+        self.assertIsInstance(self.tenant, Drive)
+        self.assertEqual('/tenant1', self.tenant.path)
+        self.assertIs(self.text_file1, self.file_system.find_node_by_path('/tenant1/test_folder/text_file1'))
+        self.file_system._path_index.clear()
+        self.assertIs(self.text_file1, self.file_system.find_node_by_path('/tenant1/test_folder/text_file1'))
+        self.assertIsNone(self.file_system.find_node_by_path('/tenant2/test_folder'))
+        self.assertEqual(7, self.tenant.size)
+        self.assertEqual(0, self.file_system.get_root_node().size)
+
+    def test_create_and_delete_drive_should_validate_names(self):
+        self.assertIsInstance(self.file_system.create(EntityTypes.DRIVE, '/tenant2'), Drive)
+        with self.assertRaises(FileExistsError):
+            self.file_system.create_drive('/tenant1')
+        with self.assertRaises(IllegalFileSystemOperation):
+            self.file_system.create_drive('tenant1/nested')
+        with self.assertRaises(IllegalFileSystemOperation):
+            self.file_system.create(EntityTypes.DRIVE, 'tenant3', MAIN_DRIVE)
+        with self.assertRaises(IllegalFileSystemOperation):
+            self.file_system.delete_drive(MAIN_DRIVE)
+
+        self.file_system.delete('/tenant1')
+        self.assertNotIn('/tenant1', self.file_system.drives)
+        self.assertIsNone(self.file_system.find_node_by_path(self.text_file1.path))
+        with self.assertRaises(FileNotFoundError):
+            self.file_system.delete_drive('tenant1')
+        self.file_system.wait_for_reclaimer()
+
+    def test_move_should_work_across_drives(self):
+        self.file_system.move(self.test_folder.path, os.path.join(MAIN_DRIVE, 'moved_folder'))
+        self.assertEqual(0, self.tenant.size)
+        self.assertEqual(7, self.file_system.get_root_node().size)
+        self.assertEqual('/root/moved_folder/text_file1', self.text_file1.path)
+        self.assertEqual([], self.file_system.verify_sizes())
+
+    def test_drives_should_be_snapshottable_individually(self):
+        snapshot = self.file_system.snapshot('tenant1')
+        self.file_system.write_to_file(self.text_file1.path, 'New content')
+        self.assertEqual(['/tenant1'], list(snapshot.drives))
+        self.assertEqual('Content', snapshot.find_node_by_path(self.text_file1.path).content)
+        self.assertEqual(7, snapshot.get_root_node().size)
+        with self.assertRaises(FileNotFoundError):
+            self.file_system.snapshot('tenant2')
+
+    def test_drives_should_be_journaled(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            journal_path = os.path.join(temp_dir, 'file_system.journal')
+            with Journal(journal_path) as journal:
+                file_system = FileSystem(journal)
+                file_system.create_drive('tenant1')
+                file_system.create_drive('tenant2')
+                file_system.create(EntityTypes.TEXT_FILE, 'text_file1', '/tenant1')
+                file_system.delete_drive('tenant2')
+            self.assertEqual([MAIN_DRIVE, '/tenant1'], list(recover(journal_path).drives))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_locked_drive_should_not_block_other_drives(self):
+        file_system = FileSystem(concurrent=True)
+        file_system.create_drive('tenant1')
+        file_system.create_drive('tenant2')
+        created = threading.Event()
+        with file_system.lock_drive('tenant1'):
+            def create_in(drive):
+                file_system.create(EntityTypes.FOLDER, 'test_folder', drive)
+                created.set()
+
+            other = threading.Thread(target=create_in, args=('/tenant2',))
+            other.start()
+            self.assertTrue(created.wait(5))
+            created.clear()
+            blocked = threading.Thread(target=create_in, args=('/tenant1',))
+            blocked.start()
+            self.assertFalse(created.wait(0.1))
+            # The holding thread may still mutate its drive
+            file_system.create(EntityTypes.FOLDER, 'own_folder', '/tenant1')
+        self.assertTrue(created.wait(5))
+        other.join()
+        blocked.join()
+        self.assertEqual({'test_folder', 'own_folder'}, set(file_system.drives['/tenant1'].children))
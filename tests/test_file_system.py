@@ -4,6 +4,7 @@ import unittest
 from file_system_entities.entity_types_enum import EntityTypes
 from file_system import FileSystem
 from helpers import MAIN_DRIVE
+from illegal_file_system_operation import IllegalFileSystemOperation
 
 
 class TestFileSystem(unittest.TestCase):
@@ -92,3 +93,177 @@ class TestFileSystem(unittest.TestCase):
         self.file_system.write_to_file(self.text_file4.path, content)
         self.assertEqual(expected_size, self.zip_file1.size)
 
+    def test_find_node_by_path_should_find_nested_node(self):
+        found = self.file_system.find_node_by_path(os.path.join(MAIN_DRIVE, 'test_folder2', 'zip_file1', 'text_file4'))
+        self.assertIs(self.text_file4, found)
+
+    def test_find_node_by_path_should_not_find_deleted_descendants(self):
+        self.file_system.delete(self.zip_file1.path)
+        self.assertIsNone(self.file_system.find_node_by_path(self.zip_file1.path))
+        self.assertIsNone(self.file_system.find_node_by_path(os.path.join(self.zip_file1.path, 'text_file4')))
+
+    def test_find_node_by_path_should_find_moved_descendants(self):
+        source_path = self.zip_file1.path
+        moved_path = os.path.join(self.test_folder.path, 'moved_zip')
+        self.file_system.find_node_by_path(os.path.join(source_path, 'text_file4'))
+        self.file_system.move(source_path, moved_path)
+        found = self.file_system.find_node_by_path(os.path.join(moved_path, 'text_file4'))
+        self.assertIs(self.text_file4, found)
+        self.assertEqual(os.path.join(moved_path, 'text_file4'), self.text_file4.path)
+        self.assertIsNone(self.file_system.find_node_by_path(os.path.join(source_path, 'text_file4')))
+
+    def test_find_node_by_path_should_handle_deep_trees(self):
+        parent, parent_path = self.test_folder, self.test_folder.path
+        for i in range(2000):
+            parent = self.file_system.create(EntityTypes.FOLDER, f'level{i}', parent_path)
+            parent_path = os.path.join(parent_path, parent.name)
+        self.file_system._path_index.clear()
+        self.assertIs(parent, self.file_system.find_node_by_path(parent_path))
+
+    def test_write_to_file_in_nested_zip_files_should_not_drift(self):
+        inner_zip = self.file_system.create(EntityTypes.ZIP_FILE, 'inner_zip', self.zip_file1.path)
+        inner_file = self.file_system.create(EntityTypes.TEXT_FILE, 'inner_file', inner_zip.path)
+        for length in (1, 3, 2, 7, 0, 5, 1, 9):
+            self.file_system.write_to_file(inner_file.path, 'x' * length)
+            self.file_system.write_to_file(self.text_file4.path, 'y' * (length + 1))
+            self.assertEqual([], self.file_system.verify_sizes())
+        self.assertEqual(int(round((int(round(9 / 2)) + 10) / 2)), self.zip_file1.size)
+
+    def test_delete_should_change_ancestor_sizes(self):
+        self.file_system.write_to_file(self.text_file4.path, 'Content of text file 4')
+        self.file_system.write_to_file(self.text_file3.path, 'Content')
+        self.file_system.delete(self.zip_file1.path)
+        self.assertEqual(len('Content'), self.test_folder2.size)
+        self.assertEqual(len('Content'), self.file_system.get_root_node().size)
+        self.assertEqual([], self.file_system.verify_sizes())
+
+    def test_verify_sizes_should_report_stale_sizes(self):
+        self.text_file1.content = 'Changed behind the file system\'s back'
+        mismatched = self.file_system.verify_sizes()
+        self.assertIn(self.text_file1.path, mismatched)
+        self.assertIn(self.test_folder.path, mismatched)
+        self.assertNotIn(self.test_folder2.path, mismatched)
+
+    def test_move_should_keep_node_and_update_sizes(self):
+        self.file_system.write_to_file(self.text_file4.path, 'Content of text file 4')
+        self.file_system.write_to_file(self.text_file1.path, 'Content')
+        moved = self.file_system.move(self.zip_file1.path, os.path.join(self.test_folder.path, 'moved_zip'))
+        self.assertIs(self.zip_file1, moved)
+        self.assertIs(self.test_folder, moved.parent)
+        self.assertEqual(0, self.test_folder2.size)
+        self.assertEqual(len('Content') + self.zip_file1.size, self.test_folder.size)
+        self.assertEqual([], self.file_system.verify_sizes())
+
+    def test_move_should_not_allow_moving_into_descendant(self):
+        with self.assertRaises(IllegalFileSystemOperation):
+            self.file_system.move(self.test_folder2.path, os.path.join(self.zip_file1.path, 'test_folder2'))
+
+    def test_move_should_not_leave_stale_index_entries_behind(self):
+        with self.file_system.batch() as batch:
+            batch.bulk_create((EntityTypes.TEXT_FILE, f'file{i}', self.test_folder.path) for i in range(1000))
+        subtree = [self.test_folder, *self.test_folder.children.values()]
+        for node in subtree:
+            self.assertIs(node, self.file_system.find_node_by_path(node.path))
+        test_folder_path = self.test_folder.path
+        moved_folder_path = os.path.join(self.test_folder2.path, 'moved_folder')
+        self.file_system.move(test_folder_path, moved_folder_path)
+        self.file_system.wait_for_reclaimer()
+        stale_keys = [key for key in self.file_system._path_index
+                      if key == test_folder_path or key.startswith(test_folder_path + os.sep)]
+        self.assertEqual([], stale_keys)
+        self.assertIsNone(self.file_system.find_node_by_path(os.path.join(test_folder_path, 'text_file1')))
+
+        self.file_system.delete(moved_folder_path)
+        self.file_system.wait_for_reclaimer()
+        subtree_ids = {id(node) for node in subtree}
+        self.assertEqual([], [key for key, (node, _) in self.file_system._path_index.items() if id(node) in subtree_ids])
+
+    def test_move_should_only_invalidate_the_moved_subtree(self):
+        metrics = self.file_system.enable_metrics()
+        text_file3_path = self.text_file3.path
+        self.file_system.find_node_by_path(text_file3_path)
+        renamed_path = os.path.join(self.test_folder.path, 'renamed_file')
+        self.file_system.move(self.text_file1.path, renamed_path)
+        metrics.reset()
+        self.assertIs(self.text_file3, self.file_system.find_node_by_path(text_file3_path))
+        self.assertEqual({'lookup.index_hits': 1}, metrics.export()['counters'])
+        self.assertIs(self.text_file1, self.file_system.find_node_by_path(renamed_path))
+
+    def test_delete_should_only_invalidate_the_deleted_subtree(self):
+        metrics = self.file_system.enable_metrics()
+        text_file3_path = self.text_file3.path
+        text_file1_path = self.text_file1.path
+        self.file_system.find_node_by_path(text_file3_path)
+        self.file_system.delete(text_file1_path)
+        metrics.reset()
+        self.assertIs(self.text_file3, self.file_system.find_node_by_path(text_file3_path))
+        self.assertEqual({'lookup.index_hits': 1}, metrics.export()['counters'])
+        self.assertIsNone(self.file_system.find_node_by_path(text_file1_path))
+        self.assertEqual('text_file1', self.text_file1.path)
+
+    def test_entities_should_not_have_instance_dicts(self):
+        for entity in (self.file_system.get_root_node(), self.test_folder, self.text_file1, self.zip_file1):
+            self.assertFalse(hasattr(entity, '__dict__'))
+        self.assertIs(EntityTypes.ZIP_FILE, self.zip_file1.type)
+
+    def test_empty_containers_should_share_children_store(self):
+        empty_folder = self.file_system.create(EntityTypes.FOLDER, 'empty_folder', self.test_folder.path)
+        self.file_system.delete(self.text_file4.path)
+        self.assertIs(empty_folder.children, self.zip_file1.children)
+        self.assertEqual(0, len(self.zip_file1.children))
+
+    def test_memoized_paths_should_follow_moves_and_deletes(self):
+        self.assertEqual(os.path.join(MAIN_DRIVE, 'test_folder', 'text_file1'), self.text_file1.path)
+        self.assertEqual(self.text_file1.path, self.file_system.path_cache.get(self.text_file1))
+        self.assertEqual(self.test_folder.path, self.file_system.path_cache.get(self.test_folder))
+
+        self.file_system.move(self.test_folder.path, os.path.join(self.test_folder2.path, 'moved_folder'))
+        self.assertIsNone(self.file_system.path_cache.get(self.text_file1))
+        self.assertEqual(os.path.join(MAIN_DRIVE, 'test_folder2', 'moved_folder', 'text_file1'), self.text_file1.path)
+
+        self.assertIsNotNone(self.file_system.path_cache.get(self.text_file1))
+        self.file_system.delete(self.test_folder2.path)
+        self.file_system.wait_for_reclaimer()
+        self.assertIsNone(self.file_system.path_cache.get(self.text_file1))
+        self.assertEqual(os.path.join('test_folder2', 'moved_folder', 'text_file1'), self.text_file1.path)
+
+    def test_path_caches_should_belong_to_their_file_system(self):
+        other_file_system = FileSystem()
+        other_folder = other_file_system.create(EntityTypes.FOLDER, 'test_folder', MAIN_DRIVE)
+        self.assertEqual(self.test_folder.path, other_folder.path)
+        self.assertIsNone(self.file_system.path_cache.get(other_folder))
+
+        # Invalidating the paths of one file system neither clears nor invalidates those of another
+        self.file_system.move(self.test_folder.path, os.path.join(self.test_folder2.path, 'moved_folder'))
+        self.assertEqual(other_folder.path, other_file_system.path_cache.get(other_folder))
+        self.assertIsNone(self.file_system.path_cache.get(self.test_folder))
+        self.assertLessEqual(1, len(self.file_system.path_cache))
+
+    def test_memoized_paths_should_only_be_invalidated_under_the_changed_paths(self):
+        path_cache = self.file_system.path_cache
+        text_file1_path = self.text_file1.path
+        path_cache.invalidate(os.path.join(MAIN_DRIVE, 'test'), os.path.join(MAIN_DRIVE, 'test_folder2'))
+        self.assertEqual(text_file1_path, path_cache.get(self.text_file1))
+        generation = path_cache.generation
+        path_cache.invalidate(os.path.join(MAIN_DRIVE, 'test_folder'))
+        self.assertIsNone(path_cache.get(self.text_file1))
+        self.assertTrue(path_cache.is_stale(text_file1_path, generation))
+        self.assertFalse(path_cache.is_stale(text_file1_path, path_cache.generation))
+
+        # Once swept, the invalidated paths are no longer checked, and what was stamped before is stale
+        self.assertEqual(text_file1_path, self.text_file1.path)
+        path_cache.sweep(path_cache.generation)
+        self.assertEqual(text_file1_path, path_cache.get(self.text_file1))
+        self.assertTrue(path_cache.is_stale(self.text_file3.path, generation))
+        self.assertEqual((), path_cache._stale)
+
+    def test_path_cache_should_be_bounded(self):
+        path_cache = self.file_system.path_cache
+        path_cache.capacity = 2
+        path_cache.discard(self.text_file4)
+        path_cache.discard(self.text_file1)
+        self.assertEqual(os.path.join(MAIN_DRIVE, 'test_folder2', 'zip_file1', 'text_file4'), self.text_file4.path)
+        self.assertEqual(os.path.join(MAIN_DRIVE, 'test_folder', 'text_file1'), self.text_file1.path)
+        self.assertEqual(2, len(path_cache))
+        self.assertIsNone(path_cache.get(self.text_file4))
+        self.assertEqual(self.text_file1.path, path_cache.get(self.text_file1))
@@ -0,0 +1,105 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from file_system_entities.entity_types_enum import EntityTypes
+from file_system import FileSystem
+from helpers import MAIN_DRIVE
+from journal import FSYNC_ALWAYS, FSYNC_BATCH, Journal, compact, read_records, recover
+
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.journal_path = os.path.join(self.temp_dir, 'file_system.journal')
+        self.snapshot_path = os.path.join(self.temp_dir, 'file_system.snapshot')
+        self.journal = Journal(self.journal_path, FSYNC_ALWAYS)
+        self.file_system = FileSystem(self.journal)
+        self.test_folder = self.file_system.create(EntityTypes.FOLDER, 'test_folder', MAIN_DRIVE)
+        self.zip_file1 = self.file_system.create(EntityTypes.ZIP_FILE, 'zip_file1', self.test_folder.path)
+        self.text_file1 = self.file_system.create(EntityTypes.TEXT_FILE, 'text_file1', self.zip_file1.path)
+        self.file_system.write_to_file(self.text_file1.path, 'Content')
+
+    def tearDown(self):
+        self.journal.close()
+        shutil.rmtree(self.temp_dir)
+
+    def assert_same_tree(self, expected: FileSystem, actual: FileSystem):
+        expected_root, actual_root = expected.get_root_node(), actual.get_root_node()
+        stack = [(expected_root, actual_root)]
+        while stack:
+            expected_node, actual_node = stack.pop()
+            self.assertEqual((expected_node.type, expected_node.path, expected_node.size),
+                             (actual_node.type, actual_node.path, actual_node.size))
+            self.assertEqual(getattr(expected_node, 'content', None), getattr(actual_node, 'content', None))
+            expected_children = getattr(expected_node, 'children', {})
+            actual_children = getattr(actual_node, 'children', {})
+            self.assertEqual(sorted(expected_children), sorted(actual_children))
+            stack.extend((expected_children[name], actual_children[name]) for name in expected_children)
+
+    def test_recover_should_replay_every_mutation(self):
+        self.file_system.move(self.text_file1.path, os.path.join(MAIN_DRIVE, 'moved_file'))
+        self.file_system.write_to_file(os.path.join(MAIN_DRIVE, 'moved_file'), 'Other content')
+        self.file_system.delete(self.zip_file1.path)
+        self.assert_same_tree(self.file_system, recover(self.journal_path))
+
+    def test_recover_should_ignore_torn_tail(self):
+        with open(self.journal_path, 'ab') as journal_file:
+            journal_file.write(b'\x40\x00\x00\x00partial record')
+        self.assert_same_tree(self.file_system, recover(self.journal_path))
+
+    def test_records_appended_after_a_torn_tail_should_be_recovered(self):
+        self.journal.close()
+        with open(self.journal_path, 'ab') as journal_file:
+            journal_file.write(b'\x40\x00\x00\x00partial record')
+        # Restart after the crash
+        self.journal = Journal(self.journal_path, FSYNC_ALWAYS)
+        self.file_system = recover(self.journal_path)
+        self.file_system.attach_journal(self.journal)
+        self.file_system.create(EntityTypes.FOLDER, 'new_folder', MAIN_DRIVE)
+        self.file_system.write_to_file(self.text_file1.path, 'Content after the crash')
+        self.assertEqual(6, len(list(read_records(self.journal_path))))
+        self.assert_same_tree(self.file_system, recover(self.journal_path))
+
+    def test_batch_should_only_be_journaled_when_it_succeeds(self):
+        record_count = len(list(read_records(self.journal_path)))
+        with self.assertRaises(FileNotFoundError):
+            with self.file_system.batch() as batch:
+                batch.create(EntityTypes.FOLDER, 'new_folder', MAIN_DRIVE)
+                batch.delete(os.path.join(MAIN_DRIVE, 'i_dont_exist'))
+        self.assertEqual(record_count, len(list(read_records(self.journal_path))))
+
+        with self.file_system.batch() as batch:
+            batch.create(EntityTypes.FOLDER, 'new_folder', MAIN_DRIVE)
+            batch.write_to_file(self.text_file1.path, 'Batched content')
+        self.assertEqual(record_count + 2, len(list(read_records(self.journal_path))))
+        self.assert_same_tree(self.file_system, recover(self.journal_path))
+
+    def test_compact_should_fold_journal_into_snapshot(self):
+        self.assertEqual(4, compact(self.journal_path, self.snapshot_path))
+        self.assertEqual([], list(read_records(self.journal_path)))
+        self.file_system.write_to_file(self.text_file1.path, 'Content after compaction')
+        self.assert_same_tree(self.file_system, recover(self.journal_path, self.snapshot_path))
+
+    def test_compact_should_keep_appending_to_an_open_journal(self):
+        self.assertEqual(4, compact(self.journal_path, self.snapshot_path, self.journal))
+        self.file_system.write_to_file(self.text_file1.path, 'Content after compaction')
+        self.assertEqual(1, compact(self.journal_path, self.snapshot_path, self.journal))
+        self.file_system.create(EntityTypes.FOLDER, 'new_folder', MAIN_DRIVE)
+        self.assertEqual(1, len(list(read_records(self.journal_path))))
+        self.assert_same_tree(self.file_system, recover(self.journal_path, self.snapshot_path))
+
+    def test_recover_should_skip_records_already_in_the_snapshot(self):
+        # As if compaction crashed after replacing the snapshot, before truncating the journal
+        recover(self.journal_path).save(self.snapshot_path)
+        self.file_system.write_to_file(self.text_file1.path, 'Content after the snapshot')
+        self.assert_same_tree(self.file_system, recover(self.journal_path, self.snapshot_path))
+        self.assertEqual(1, compact(self.journal_path, self.snapshot_path))
+
+    def test_batch_fsync_policy_should_sync_on_close(self):
+        journal_path = os.path.join(self.temp_dir, 'batched.journal')
+        with Journal(journal_path, FSYNC_BATCH, group_size=1000, group_interval=60) as journal:
+            file_system = FileSystem(journal)
+            file_system.create(EntityTypes.FOLDER, 'test_folder', MAIN_DRIVE)
+        self.assertEqual(1, len(list(read_records(journal_path))))
@@ -0,0 +1,82 @@
+import unittest
+
+from file_system_entities.entity_types_enum import EntityTypes
+from file_system import FileSystem
+from helpers import MAIN_DRIVE, file_path
+from metrics import LatencyHistogram, NullMetrics
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.file_system = FileSystem(metrics=True)
+        self.test_folder = self.file_system.create(EntityTypes.FOLDER, 'test_folder', MAIN_DRIVE)
+        self.text_file = self.file_system.create(EntityTypes.TEXT_FILE, 'text_file', self.test_folder.path)
+        self.file_system.metrics.reset()
+
+    def test_operations_should_be_counted_and_timed(self):
+        self.file_system.write_to_file(self.text_file.path, 'content')
+        self.file_system.move(self.text_file.path, file_path(MAIN_DRIVE, 'text_file'))
+        with self.assertRaises(FileNotFoundError):
+            self.file_system.delete(self.text_file.path + '_missing')
+
+        operations = self.file_system.metrics.export()['operations']
+        self.assertEqual(1, operations['write']['count'])
+        self.assertEqual(1, operations['move']['count'])
+        self.assertEqual(0, operations['move']['errors'])
+        self.assertEqual(1, operations['delete']['errors'])
+        self.assertLessEqual(operations['write']['min_seconds'], operations['write']['p99_seconds'])
+
+    def test_lookups_should_count_index_hits_misses_and_nodes_visited(self):
+        self.file_system._path_index.clear()
+        self.file_system.find_node_by_path(self.text_file.path)
+        self.file_system.find_node_by_path(self.text_file.path)
+
+        counters = self.file_system.metrics.export()['counters']
+        self.assertEqual(1, counters['lookup.index_misses'])
+        self.assertEqual(1, counters['lookup.index_hits'])
+        self.assertEqual(2, counters['lookup.nodes_visited'])
+
+    def test_size_propagation_steps_should_be_counted(self):
+        self.file_system.write_to_file(self.text_file.path, 'content')
+        # The folder and the drive
+        self.assertEqual(2, self.file_system.metrics.export()['counters']['size_propagation_steps'])
+
+    def test_hooks_should_be_called_around_each_operation(self):
+        calls = []
+        self.file_system.metrics.add_hooks(pre=lambda operation, args: calls.append(('pre', operation, args)),
+                                           post=lambda operation, args, seconds, error: calls.append(
+                                               ('post', operation, error)))
+        self.file_system.write_to_file(self.text_file.path, 'content')
+
+        write_calls = [call for call in calls if call[1] == 'write']
+        self.assertEqual([('pre', 'write', (self.text_file.path, 'content')), ('post', 'write', None)], write_calls)
+
+    def test_sampled_profiling_should_export_the_profiled_functions(self):
+        self.file_system.metrics.enable_profiling(sample_rate=1.0)
+        self.file_system.write_to_file(self.text_file.path, 'content')
+
+        functions = [function['function'] for function in self.file_system.metrics.export()['profile']]
+        self.assertIn('_update_content', functions)
+
+    def test_metrics_should_be_disabled_by_default(self):
+        file_system = FileSystem()
+        self.assertIsInstance(file_system.metrics, NullMetrics)
+        file_system.create(EntityTypes.FOLDER, 'test_folder', MAIN_DRIVE)
+
+        metrics = file_system.enable_metrics()
+        file_system.find_node_by_path(file_path(MAIN_DRIVE, 'test_folder'))
+        self.assertEqual(1, metrics.export()['operations']['lookup']['count'])
+
+    def test_histogram_percentiles_should_bound_the_latencies(self):
+        histogram = LatencyHistogram()
+        for microseconds in range(1, 101):
+            histogram.record(microseconds / 1e6)
+
+        self.assertEqual(100, histogram.count)
+        self.assertLessEqual(50 / 1e6, histogram.percentile(50))
+        self.assertEqual(100 / 1e6, histogram.percentile(99))
+        self.assertEqual(100, sum(histogram.export()['buckets_us'].values()))
+
+
+if __name__ == '__main__':
+    unittest.main()
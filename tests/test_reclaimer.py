@@ -0,0 +1,77 @@
+import os
+import threading
+import unittest
+
+from file_system_entities.entity_types_enum import EntityTypes
+from file_system import FileSystem
+from helpers import MAIN_DRIVE, file_path, normalize_path
+from reclaimer import Reclaimer
+
+
+class TestReclaimer(unittest.TestCase):
+    def setUp(self):
+        self.file_system = FileSystem(indexed=True)
+        self.test_folder = self.file_system.create(EntityTypes.FOLDER, 'test_folder', MAIN_DRIVE)
+        with self.file_system.batch() as batch:
+            for i in range(100):
+                batch.create(EntityTypes.TEXT_FILE, f'text_file{i}', self.test_folder.path)
+        self.text_file_path = file_path(self.test_folder.path, 'text_file1')
+        self.file_system.find_node_by_path(self.text_file_path)
+
+    def test_delete_should_detach_and_reclaim_in_the_background(self):
+        self.file_system.delete(self.test_folder.path)
+        # Until the reclaimer is done, the deleted nodes are filtered out rather than deregistered
+        self.assertIsNone(self.file_system.find_node_by_path(self.text_file_path))
+        self.assertEqual([], self.file_system.find(type=EntityTypes.TEXT_FILE))
+
+        self.file_system.wait_for_reclaimer()
+        self.assertNotIn(normalize_path(self.text_file_path), self.file_system._path_index)
+        self.assertEqual([], self.file_system._indexes.find(name='text_file1'))
+        self.assertEqual(0, self.file_system.get_root_node().size)
+
+    def test_batch_deletes_should_only_be_reclaimed_once_the_batch_succeeds(self):
+        with self.assertRaises(FileNotFoundError):
+            with self.file_system.batch() as batch:
+                batch.delete(self.test_folder.path)
+                self.assertEqual([], self.file_system.find(name='text_file1'))
+                batch.delete(self.test_folder.path)
+        self.file_system.wait_for_reclaimer()
+        self.assertEqual(1, len(self.file_system.find(name='text_file1')))
+        self.assertIsNotNone(self.file_system.find_node_by_path(self.text_file_path))
+
+        with self.file_system.batch() as batch:
+            batch.delete(self.test_folder.path)
+        self.file_system.wait_for_reclaimer()
+        self.assertEqual([], self.file_system._indexes.find(name='text_file1'))
+
+    def test_reclaimer_thread_should_exit_when_idle_and_restart_on_demand(self):
+        reclaimed = []
+        reclaimer = Reclaimer(lambda node, path: reclaimed.append((threading.current_thread().name, path)),
+                              idle_timeout=0.01)
+        reclaimer.submit(self.test_folder, os.path.join(MAIN_DRIVE, 'first'))
+        reclaimer.wait()
+        thread = reclaimer._worker._thread
+        if thread is not None:
+            thread.join()
+        self.assertIsNone(reclaimer._worker._thread)
+        reclaimer.submit(self.test_folder, os.path.join(MAIN_DRIVE, 'second'))
+        reclaimer.wait()
+        self.assertEqual([('file-system-reclaimer', os.path.join(MAIN_DRIVE, 'first')),
+                          ('file-system-reclaimer', os.path.join(MAIN_DRIVE, 'second'))], reclaimed)
+        self.assertEqual(0, reclaimer.pending)
+
+    def test_reclaim_errors_should_be_raised_by_wait(self):
+        reclaimed = []
+
+        def reclaim(node, path):
+            if path.endswith('first'):
+                raise ValueError(path)
+            reclaimed.append(path)
+
+        reclaimer = Reclaimer(reclaim)
+        reclaimer.submit(self.test_folder, os.path.join(MAIN_DRIVE, 'first'))
+        reclaimer.submit(self.test_folder, os.path.join(MAIN_DRIVE, 'second'))
+        with self.assertRaises(ValueError):
+            reclaimer.wait()
+        self.assertEqual([os.path.join(MAIN_DRIVE, 'second')], reclaimed)
+        reclaimer.wait()
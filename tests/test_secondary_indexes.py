@@ -0,0 +1,85 @@
+import os
+import unittest
+
+from file_system_entities.entity_types_enum import EntityTypes
+from file_system import FileSystem
+from helpers import MAIN_DRIVE
+from secondary_indexes import SortedSizeIndex
+
+
+class TestSecondaryIndexes(unittest.TestCase):
+    def setUp(self):
+        self.file_system = FileSystem(indexed=True)
+        self.test_folder = self.file_system.create(EntityTypes.FOLDER, 'test_folder', MAIN_DRIVE)
+        self.zip_file1 = self.file_system.create(EntityTypes.ZIP_FILE, 'zip_file1', self.test_folder.path)
+        self.text_file1 = self.file_system.create(EntityTypes.TEXT_FILE, 'text_file1', self.test_folder.path)
+        self.text_file2 = self.file_system.create(EntityTypes.TEXT_FILE, 'text_file2', self.zip_file1.path)
+        self.file_system.write_to_file(self.text_file1.path, 'Content')
+        self.file_system.write_to_file(self.text_file2.path, 'Content of text file 2')
+
+    def test_find_should_query_by_name_and_type(self):
+        self.assertEqual([self.text_file1], self.file_system.find(name='text_file1'))
+        self.assertEqual({self.text_file1, self.text_file2}, set(self.file_system.find(type=EntityTypes.TEXT_FILE)))
+        self.assertEqual([], self.file_system.find(name='text_file1', type=EntityTypes.FOLDER))
+
+    def test_find_should_query_by_size(self):
+        # text_file1 is 7 long, text_file2 22, zip_file1 11, test_folder 18 and the drive 18
+        found = self.file_system.find(min_size=8, max_size=20)
+        self.assertEqual(self.zip_file1, found[0])
+        self.assertEqual({self.test_folder, self.file_system.get_root_node()}, set(found[1:]))
+        self.assertEqual([self.text_file2], self.file_system.find(largest=1))
+        self.assertEqual([self.zip_file1], self.file_system.find(type=EntityTypes.ZIP_FILE, largest=10))
+        self.assertEqual([self.text_file1], self.file_system.find(type=EntityTypes.TEXT_FILE, max_size=10))
+
+    def test_indexes_should_follow_mutations(self):
+        self.file_system.move(self.text_file2.path, os.path.join(MAIN_DRIVE, 'moved_file'))
+        self.assertEqual([], self.file_system.find(name='text_file2'))
+        self.assertEqual([self.text_file2], self.file_system.find(name='moved_file'))
+        self.assertEqual([self.text_file2], self.file_system.find(type=EntityTypes.TEXT_FILE, largest=1))
+        # Moving the text file out emptied the zip file
+        self.assertEqual([self.zip_file1], self.file_system.find(type=EntityTypes.ZIP_FILE, max_size=0))
+
+        self.file_system.delete(self.test_folder.path)
+        self.assertEqual([], self.file_system.find(name='zip_file1'))
+        self.assertEqual([self.text_file2], self.file_system.find(type=EntityTypes.TEXT_FILE))
+
+    def test_indexes_should_follow_batches_and_rollbacks(self):
+        with self.file_system.batch() as batch:
+            batch.create(EntityTypes.TEXT_FILE, 'text_file3', self.zip_file1.path)
+            batch.write_to_file(os.path.join(self.zip_file1.path, 'text_file3'), 'x' * 100)
+        self.assertEqual([self.zip_file1], self.file_system.find(type=EntityTypes.ZIP_FILE, min_size=61))
+
+        with self.assertRaises(FileNotFoundError):
+            with self.file_system.batch() as batch:
+                batch.delete(self.test_folder.path)
+                batch.delete(self.test_folder.path)
+        self.assertEqual([self.zip_file1], self.file_system.find(name='zip_file1', min_size=61))
+
+    def test_find_should_work_without_indexes(self):
+        file_system = FileSystem()
+        text_file = file_system.create(EntityTypes.TEXT_FILE, 'text_file1', MAIN_DRIVE)
+        file_system.write_to_file(text_file.path, 'Content')
+        self.assertEqual([text_file], file_system.find(type=EntityTypes.TEXT_FILE, largest=1))
+        file_system.enable_indexes()
+        self.assertEqual([text_file], file_system.find(name='text_file1'))
+
+    def test_sorted_size_index_should_stay_sorted_across_buckets(self):
+        class Node:
+            def __init__(self, size):
+                self.size = size
+
+        index = SortedSizeIndex()
+        index.LOAD = 4
+        nodes = [Node((i * 7) % 50) for i in range(50)]
+        for node in nodes:
+            index.add(node)
+        for node in nodes[::3]:
+            index.discard(node)
+        nodes[1].size = 1000
+        index.add(nodes[1])
+
+        remaining = [node for i, node in enumerate(nodes) if i % 3]
+        self.assertEqual(sorted(node.size for node in remaining), [node.size for node in index.iter_range()])
+        self.assertEqual([1000], [node.size for node in index.iter_range(min_size=100)])
+        self.assertEqual(nodes[1], next(index.iter_descending()))
+        self.assertEqual(len(remaining), len(index))
@@ -0,0 +1,74 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from corrupt_snapshot_error import CorruptSnapshotError
+from file_system_entities.entity_types_enum import EntityTypes
+from file_system import FileSystem
+from helpers import MAIN_DRIVE
+from snapshot import HEADER_V1, MAGIC, NODE_V1
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.snapshot_path = os.path.join(self.temp_dir, 'file_system.snapshot')
+        self.file_system = FileSystem()
+        self.test_folder = self.file_system.create(EntityTypes.FOLDER, 'test_folder', MAIN_DRIVE)
+        self.zip_file1 = self.file_system.create(EntityTypes.ZIP_FILE, 'zip_file1', self.test_folder.path)
+        self.text_file1 = self.file_system.create(EntityTypes.TEXT_FILE, 'text_file1', self.zip_file1.path)
+        self.text_file2 = self.file_system.create(EntityTypes.TEXT_FILE, 'text_file2', MAIN_DRIVE)
+        self.file_system.write_to_file(self.text_file1.path, 'Content with ünïcödé')
+        self.file_system.write_to_file(self.text_file2.path, 'Content')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_load_should_restore_tree(self):
+        self.file_system.save(self.snapshot_path)
+        loaded = FileSystem.load(self.snapshot_path)
+        text_file1 = loaded.find_node_by_path(self.text_file1.path)
+        self.assertEqual('Content with ünïcödé', text_file1.content)
+        self.assertEqual(EntityTypes.ZIP_FILE, text_file1.parent.type)
+        self.assertEqual(self.file_system.get_root_node().size, loaded.get_root_node().size)
+        self.assertEqual(self.zip_file1.size, loaded.find_node_by_path(self.zip_file1.path).size)
+        self.assertEqual([], loaded.verify_sizes())
+
+    def test_load_should_build_nodes_lazily(self):
+        self.file_system.save(self.snapshot_path)
+        loaded = FileSystem.load(self.snapshot_path)
+        root = loaded.get_root_node()
+        self.assertFalse(root.children_loaded())
+        test_folder = loaded.find_node_by_path(self.test_folder.path)
+        self.assertTrue(root.children_loaded())
+        self.assertFalse(test_folder.children_loaded())
+        self.assertEqual(self.test_folder.size, test_folder.size)
+
+    def test_loaded_file_system_should_accept_mutations(self):
+        self.file_system.save(self.snapshot_path)
+        loaded = FileSystem.load(self.snapshot_path)
+        loaded.move(self.text_file1.path, os.path.join(MAIN_DRIVE, 'moved_file'))
+        loaded.create(EntityTypes.FOLDER, 'new_folder', self.zip_file1.path)
+        self.assertEqual(len('Content with ünïcödé') + len('Content'), loaded.get_root_node().size)
+        self.assertEqual([], loaded.verify_sizes())
+
+    def test_load_should_reject_corrupt_snapshot(self):
+        with open(self.snapshot_path, 'wb') as snapshot_file:
+            snapshot_file.write(b'not a snapshot')
+        with self.assertRaises(CorruptSnapshotError):
+            FileSystem.load(self.snapshot_path)
+
+    def test_load_should_read_version_1_snapshots(self):
+        # The main drive, holding a single text file
+        heap = MAIN_DRIVE.encode('utf-8') + b'text_file1' + b'Content'
+        drive_name_length = len(MAIN_DRIVE.encode('utf-8'))
+        with open(self.snapshot_path, 'wb') as snapshot_file:
+            snapshot_file.write(HEADER_V1.pack(MAGIC, 1, 1, 2))
+            snapshot_file.write(NODE_V1.pack(EntityTypes.DRIVE.value, 1, 1, drive_name_length, 7, 7, 0, 0, 0))
+            snapshot_file.write(NODE_V1.pack(EntityTypes.TEXT_FILE.value, 2, 0, 10, 7, 0, drive_name_length,
+                                             drive_name_length + 10, 7))
+            snapshot_file.write(heap)
+        loaded = FileSystem.load(self.snapshot_path)
+        self.assertEqual('Content', loaded.find_node_by_path(os.path.join(MAIN_DRIVE, 'text_file1')).content)
+        self.assertEqual([], loaded.verify_sizes())
@@ -0,0 +1,112 @@
+import csv
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from file_system_entities.entity_types_enum import EntityTypes
+from file_system import FileSystem
+from helpers import MAIN_DRIVE, file_path
+from illegal_file_system_operation import IllegalFileSystemOperation
+from journal import FSYNC_BATCH, Journal, recover
+
+
+class TestTreeImport(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.source = os.path.join(self.temp_dir, 'source')
+        os.makedirs(os.path.join(self.source, 'folder', 'nested_folder'))
+        self.write(os.path.join(self.source, 'folder', 'text_file1'), 'Content')
+        self.write(os.path.join(self.source, 'folder', 'nested_folder', 'text_file2'), 'More\r\ncontent')
+        self.write(os.path.join(self.source, 'text_file3'), '')
+        self.file_system = FileSystem(indexed=True)
+        self.test_folder = self.file_system.create(EntityTypes.FOLDER, 'test_folder', MAIN_DRIVE)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    @staticmethod
+    def write(path: str, content: str):
+        with open(path, 'w', newline='') as text_file:
+            text_file.write(content)
+
+    def assert_imported(self, parent_path: str):
+        folder = self.file_system.find_node_by_path(file_path(parent_path, 'folder'))
+        text_file2 = self.file_system.find_node_by_path(file_path(parent_path, 'folder/nested_folder/text_file2'))
+        self.assertEqual(EntityTypes.FOLDER, folder.type)
+        self.assertEqual('More\r\ncontent', text_file2.content)
+        self.assertEqual(20, folder.size)
+        self.assertEqual(20, self.file_system.get_root_node().size)
+        self.assertEqual([], self.file_system.verify_sizes())
+        self.assertEqual([text_file2], self.file_system.find(name='text_file2'))
+
+    def test_import_directory_with_threads(self):
+        roots = self.file_system.import_tree(self.source, self.test_folder.path, executor='thread')
+        self.assertEqual(['folder', 'text_file3'], sorted(root.name for root in roots))
+        self.assert_imported(self.test_folder.path)
+
+    def test_import_directory_with_processes(self):
+        self.file_system.import_tree(self.source, self.test_folder.path, workers=2)
+        self.assert_imported(self.test_folder.path)
+
+    def test_import_jsonl_manifest(self):
+        manifest = os.path.join(self.temp_dir, 'manifest.jsonl')
+        with open(manifest, 'w') as manifest_file:
+            for entry in ({'path': 'folder/nested_folder/text_file2', 'source': 'source/folder/nested_folder/text_file2'},
+                          {'path': 'folder/text_file1', 'content': 'Content'},
+                          {'path': 'folder', 'type': 'folder'},
+                          {'path': 'zip_file', 'type': 'ZIP_FILE'}):
+                manifest_file.write(json.dumps(entry) + '\n')
+
+        self.file_system.import_tree(manifest, self.test_folder.path, executor='thread')
+        self.assert_imported(self.test_folder.path)
+        zip_file = self.file_system.find_node_by_path(file_path(self.test_folder.path, 'zip_file'))
+        self.assertEqual(EntityTypes.ZIP_FILE, zip_file.type)
+
+    def test_import_csv_manifest(self):
+        manifest = os.path.join(self.temp_dir, 'manifest.csv')
+        with open(manifest, 'w', newline='') as manifest_file:
+            writer = csv.DictWriter(manifest_file, ['path', 'type', 'content'])
+            writer.writeheader()
+            writer.writerow({'path': 'folder/nested_folder/text_file2', 'content': 'More\r\ncontent'})
+            writer.writerow({'path': 'folder/text_file1', 'type': 'TEXT_FILE', 'content': 'Content'})
+
+        self.file_system.import_tree(manifest, self.test_folder.path, executor='thread')
+        self.assert_imported(self.test_folder.path)
+
+    def test_failed_import_should_import_nothing(self):
+        self.file_system.create(EntityTypes.TEXT_FILE, 'text_file3', self.test_folder.path)
+        with self.assertRaises(FileExistsError):
+            self.file_system.import_tree(self.source, self.test_folder.path, executor='thread')
+        self.assertIsNone(self.file_system.find_node_by_path(file_path(self.test_folder.path, 'folder')))
+        self.assertEqual(0, self.file_system.get_root_node().size)
+        self.assertEqual([], self.file_system.find(name='text_file2'))
+
+        manifest = os.path.join(self.temp_dir, 'manifest.jsonl')
+        self.write(manifest, json.dumps({'path': 'text_file/child', 'type': 'FOLDER'}) + '\n'
+                   + json.dumps({'path': 'text_file', 'type': 'TEXT_FILE'}) + '\n')
+        with self.assertRaises(FileExistsError):
+            self.file_system.import_tree(manifest, MAIN_DRIVE, executor='thread')
+        self.write(manifest, json.dumps({'path': '../escape'}) + '\n')
+        with self.assertRaises(ValueError):
+            self.file_system.import_tree(manifest, MAIN_DRIVE, executor='thread')
+        with self.assertRaises(IllegalFileSystemOperation):
+            self.file_system.import_tree(self.source, file_path(self.test_folder.path, 'text_file3'),
+                                         executor='thread')
+
+    def test_import_should_be_journaled(self):
+        journal_path = os.path.join(self.temp_dir, 'file_system.journal')
+        journal = Journal(journal_path, FSYNC_BATCH)
+        self.file_system.attach_journal(journal)
+        self.file_system.import_tree(self.source, MAIN_DRIVE, executor='thread')
+        journal.close()
+
+        recovered = recover(journal_path)
+        text_file2 = recovered.find_node_by_path(file_path(MAIN_DRIVE, 'folder/nested_folder/text_file2'))
+        self.assertEqual('More\r\ncontent', text_file2.content)
+        self.assertEqual(20, recovered.get_root_node().size)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import io
+import os
+import sys
+import unittest
+
+from file_system_entities.entity_types_enum import EntityTypes
+from file_system import FileSystem
+from helpers import MAIN_DRIVE
+from tree_walk import render_tree
+
+
+class TestTreeWalk(unittest.TestCase):
+    def setUp(self):
+        self.file_system = FileSystem()
+        self.test_folder = self.file_system.create(EntityTypes.FOLDER, 'test_folder', MAIN_DRIVE)
+        self.test_folder2 = self.file_system.create(EntityTypes.FOLDER, 'test_folder2', MAIN_DRIVE)
+        self.text_file1 = self.file_system.create(EntityTypes.TEXT_FILE, 'text_file1', self.test_folder.path)
+        self.zip_file1 = self.file_system.create(EntityTypes.ZIP_FILE, 'zip_file1', self.test_folder.path)
+        self.text_file2 = self.file_system.create(EntityTypes.TEXT_FILE, 'text_file2', self.zip_file1.path)
+        self.file_system.write_to_file(self.text_file2.path, 'Content')
+
+    def names(self, nodes):
+        return [node.name for node in nodes]
+
+    def test_iter_descendants_should_support_every_order(self):
+        self.assertEqual(['test_folder', 'text_file1', 'zip_file1', 'text_file2', 'test_folder2'],
+                         self.names(self.file_system.iter_descendants(MAIN_DRIVE)))
+        self.assertEqual(['text_file1', 'text_file2', 'zip_file1', 'test_folder', 'test_folder2'],
+                         self.names(self.file_system.iter_descendants(MAIN_DRIVE, order='post')))
+        self.assertEqual(['test_folder', 'test_folder2', 'text_file1', 'zip_file1', 'text_file2'],
+                         self.names(self.file_system.iter_descendants(MAIN_DRIVE, order='bfs')))
+
+    def test_walk_should_support_depth_limits_and_pruning(self):
+        self.assertEqual([(MAIN_DRIVE, 0), ('test_folder', 1), ('test_folder2', 1)],
+                         [(entry.node.name, entry.depth) for entry in self.file_system.walk(max_depth=1)])
+        pruned = self.file_system.iter_descendants(self.test_folder.path, prune=lambda node: node.type == EntityTypes.ZIP_FILE)
+        self.assertEqual(['text_file1', 'zip_file1'], self.names(pruned))
+
+    def test_walk_should_handle_deep_trees(self):
+        parent_path = self.test_folder2.path
+        for i in range(sys.getrecursionlimit() + 100):
+            self.file_system.create(EntityTypes.FOLDER, 'level', parent_path)
+            parent_path = os.path.join(parent_path, 'level')
+        self.assertEqual(sys.getrecursionlimit() + 100,
+                         sum(1 for _ in self.file_system.iter_descendants(self.test_folder2.path, order='post')))
+        output = io.StringIO()
+        render_tree(self.test_folder2, output, buffer_lines=7)
+        self.assertEqual(sys.getrecursionlimit() + 101, len(output.getvalue().splitlines()))
+
+    def test_render_tree_should_draw_the_tree(self):
+        output = io.StringIO()
+        render_tree(self.file_system.get_root_node(), output)
+        self.assertEqual('\n'.join([
+            '|- /root (4)',
+            '   |- test_folder (4)',
+            '   |  |- text_file1 (0)',
+            '   |  |- zip_file1 (4)',
+            '   |     |- text_file2 (7)',
+            '   |- test_folder2 (0)',
+        ]) + '\n', output.getvalue())
@@ -0,0 +1,78 @@
+import gc
+import os
+import unittest
+
+from file_system_entities.entity_types_enum import EntityTypes
+from file_system import FileSystem
+from helpers import MAIN_DRIVE
+
+
+class TestVersioning(unittest.TestCase):
+    def setUp(self):
+        self.file_system = FileSystem()
+        self.test_folder = self.file_system.create(EntityTypes.FOLDER, 'test_folder', MAIN_DRIVE)
+        self.zip_file1 = self.file_system.create(EntityTypes.ZIP_FILE, 'zip_file1', self.test_folder.path)
+        self.text_file1 = self.file_system.create(EntityTypes.TEXT_FILE, 'text_file1', self.zip_file1.path)
+        self.text_file2 = self.file_system.create(EntityTypes.TEXT_FILE, 'text_file2', self.test_folder.path)
+        self.file_system.write_to_file(self.text_file1.path, 'Content')
+        self.file_system.write_to_file(self.text_file2.path, 'Other content')
+
+    def describe(self, root):
+        """
+        Flatten a tree into {path: (size, content)}
+        """
+        nodes = {}
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            nodes[node.path] = (node.size, getattr(node, 'content', None))
+            stack.extend(getattr(node, 'children', {}).values())
+        return nodes
+
+    def test_snapshot_should_not_see_later_mutations(self):
+        expected = self.describe(self.file_system.get_root_node())
+        snapshot = self.file_system.snapshot()
+        text_file1_path = self.text_file1.path
+        self.file_system.write_to_file(self.text_file1.path, 'Changed content')
+        self.file_system.move(self.zip_file1.path, os.path.join(MAIN_DRIVE, 'moved_zip'))
+        self.file_system.create(EntityTypes.FOLDER, 'new_folder', self.test_folder.path)
+        self.file_system.delete(self.text_file2.path)
+        self.assertEqual(expected, self.describe(snapshot.get_root_node()))
+        self.assertEqual('Content', snapshot.find_node_by_path(text_file1_path).content)
+        self.assertIsNone(snapshot.find_node_by_path(os.path.join(MAIN_DRIVE, 'moved_zip')))
+
+    def test_snapshots_should_each_keep_their_own_point_in_time(self):
+        first = self.file_system.snapshot()
+        self.file_system.write_to_file(self.text_file2.path, 'Second')
+        second = self.file_system.snapshot()
+        self.file_system.write_to_file(self.text_file2.path, 'Third content')
+        self.assertEqual('Other content', first.find_node_by_path(self.text_file2.path).content)
+        self.assertEqual('Second', second.find_node_by_path(self.text_file2.path).content)
+        self.assertEqual(len('Second') + int(round(len('Content') / 2)),
+                         second.find_node_by_path(self.test_folder.path).size)
+        self.assertEqual('Third content', self.text_file2.content)
+
+    def test_child_lookups_should_see_the_children_of_each_snapshot(self):
+        first = self.file_system.snapshot()
+        self.file_system.create(EntityTypes.FOLDER, 'new_folder', self.test_folder.path)
+        second = self.file_system.snapshot()
+        self.file_system.delete(self.text_file2.path)
+        self.file_system.delete(os.path.join(self.test_folder.path, 'new_folder'))
+
+        first_folder, second_folder = (snapshot.find_node_by_path(self.test_folder.path) for snapshot in (first, second))
+        self.assertIsNone(first_folder.child('new_folder'))
+        self.assertEqual('new_folder', second_folder.child('new_folder').name)
+        self.assertEqual('Other content', first_folder.child('text_file2').content)
+        self.assertIsNone(first_folder.child('text_file2').child('anything'))
+        self.assertEqual(sorted(second_folder.children), ['new_folder', 'text_file2', 'zip_file1'])
+
+    def test_snapshot_should_take_constant_time_and_release_its_records(self):
+        snapshot = self.file_system.snapshot()
+        self.assertEqual({}, self.file_system._versions._histories)
+        self.file_system.write_to_file(self.text_file1.path, 'Changed content')
+        self.assertNotEqual({}, self.file_system._versions._histories)
+        del snapshot
+        gc.collect()
+        self.assertFalse(self.file_system._versions.active)
+        self.file_system.write_to_file(self.text_file1.path, 'Content')
+        self.assertEqual({}, self.file_system._versions._histories)
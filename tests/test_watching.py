@@ -0,0 +1,168 @@
+import asyncio
+import os
+import threading
+import unittest
+
+from file_system_entities.entity_types_enum import EntityTypes
+from file_system import FileSystem
+from helpers import MAIN_DRIVE, file_path
+from watching import CREATED, DELETED, MODIFIED, MOVED, Event, coalesce
+
+
+class TestWatching(unittest.TestCase):
+    def setUp(self):
+        self.file_system = FileSystem()
+        self.test_folder = self.file_system.create(EntityTypes.FOLDER, 'test_folder', MAIN_DRIVE)
+        self.nested_folder = self.file_system.create(EntityTypes.FOLDER, 'nested_folder', self.test_folder.path)
+        self.text_file = self.file_system.create(EntityTypes.TEXT_FILE, 'text_file', self.nested_folder.path)
+        self.events = []
+
+    def watch(self, path: str, recursive: bool = True):
+        return self.file_system.watch(path, self.events.extend, recursive)
+
+    def test_watch_should_report_changes_to_the_subtree(self):
+        self.watch(self.test_folder.path)
+        text_file_path, moved_file_path = self.text_file.path, file_path(MAIN_DRIVE, 'moved_file')
+        nested_folder_path = self.nested_folder.path
+        self.file_system.create(EntityTypes.TEXT_FILE, 'other_file', MAIN_DRIVE)
+        self.file_system.write_to_file(text_file_path, 'Content')
+        self.file_system.wait_for_watchers()
+        self.file_system.move(text_file_path, moved_file_path)
+        self.file_system.wait_for_watchers()
+        self.file_system.delete(nested_folder_path)
+        self.file_system.wait_for_watchers()
+
+        self.assertEqual([
+            Event(MODIFIED, text_file_path, None, 7),
+            Event(MODIFIED, self.test_folder.path, None, 7),
+            Event(MOVED, text_file_path, moved_file_path, 7),
+            Event(MODIFIED, self.test_folder.path, None, 0),
+            Event(DELETED, nested_folder_path, None, None),
+        ], self.events)
+
+    def test_watch_should_coalesce_changes(self):
+        self.watch(self.test_folder.path)
+        with self.file_system.batch() as batch:
+            for i in range(10):
+                batch.append_to_file(self.text_file.path, 'x')
+            batch.create(EntityTypes.TEXT_FILE, 'new_file', self.test_folder.path)
+            batch.write_to_file(file_path(self.test_folder.path, 'new_file'), 'Content')
+            batch.create(EntityTypes.FOLDER, 'temporary_folder', self.test_folder.path)
+            batch.delete(file_path(self.test_folder.path, 'temporary_folder'))
+        self.file_system.wait_for_watchers()
+
+        self.assertEqual([
+            Event(MODIFIED, self.text_file.path, None, 10),
+            Event(CREATED, file_path(self.test_folder.path, 'new_file'), None, 7),
+            Event(MODIFIED, self.test_folder.path, None, 17),
+        ], self.events)
+
+    def test_failed_batch_should_not_be_reported(self):
+        self.watch(MAIN_DRIVE)
+        with self.assertRaises(FileNotFoundError):
+            with self.file_system.batch() as batch:
+                batch.write_to_file(self.text_file.path, 'Content')
+                batch.delete(file_path(MAIN_DRIVE, 'missing'))
+        self.file_system.wait_for_watchers()
+        self.assertEqual([], self.events)
+
+    def test_non_recursive_watch_should_only_report_children(self):
+        self.watch(self.test_folder.path, recursive=False)
+        self.file_system.create(EntityTypes.TEXT_FILE, 'child_file', self.test_folder.path)
+        self.file_system.wait_for_watchers()
+        self.file_system.write_to_file(self.text_file.path, 'Content')
+        self.file_system.wait_for_watchers()
+
+        self.assertEqual([
+            Event(CREATED, file_path(self.test_folder.path, 'child_file'), None, 0),
+            Event(MODIFIED, self.test_folder.path, None, 7),
+        ], self.events)
+
+    def test_cancelled_watch_should_not_be_reported(self):
+        watch = self.watch(self.test_folder.path)
+        watch.cancel()
+        self.file_system.write_to_file(self.text_file.path, 'Content')
+        self.file_system.wait_for_watchers()
+        self.assertEqual([], self.events)
+
+    def test_watch_should_deliver_to_an_event_loop(self):
+        async def watch_changes():
+            events = asyncio.Queue()
+            self.file_system.watch(self.test_folder.path, events.put_nowait, loop=asyncio.get_event_loop())
+            self.file_system.write_to_file(self.text_file.path, 'Content')
+            return await asyncio.wait_for(events.get(), 5)
+
+        loop = asyncio.new_event_loop()
+        try:
+            events = loop.run_until_complete(watch_changes())
+        finally:
+            loop.close()
+        self.assertEqual([Event(MODIFIED, self.text_file.path, None, 7), Event(MODIFIED, self.test_folder.path, None, 7)],
+                         events)
+
+    def test_watch_should_report_its_node_going_away_with_an_ancestor(self):
+        test_folder_path, text_file_path = self.test_folder.path, self.text_file.path
+        self.watch(text_file_path)
+        moved_folder_path = file_path(MAIN_DRIVE, 'moved_folder')
+        self.file_system.move(test_folder_path, moved_folder_path)
+        self.file_system.wait_for_watchers()
+        moved_file_path = os.path.join(moved_folder_path, 'nested_folder', 'text_file')
+        self.file_system.move(moved_folder_path, test_folder_path)
+        self.file_system.wait_for_watchers()
+        self.file_system.delete(test_folder_path)
+        self.file_system.wait_for_watchers()
+
+        self.assertEqual([
+            Event(MOVED, text_file_path, moved_file_path, 0),
+            Event(MOVED, moved_file_path, text_file_path, 0),
+            Event(DELETED, text_file_path, None, None),
+        ], self.events)
+
+    def test_watch_should_only_report_changes_made_after_it_was_registered(self):
+        released = threading.Event()
+        self.file_system.watch(self.test_folder.path, lambda events: released.wait(5))
+        self.file_system.write_to_file(self.text_file.path, 'Content')
+        # Queued while the dispatcher is busy delivering the first change
+        self.file_system.write_to_file(self.text_file.path, 'Other content')
+        self.watch(self.test_folder.path)
+        released.set()
+        self.file_system.wait_for_watchers()
+        self.assertEqual([], self.events)
+
+    def test_watched_nodes_should_be_looked_up_on_the_mutating_thread(self):
+        threads = set()
+        find_node_by_path = self.file_system.find_node_by_path
+
+        def resolve(path):
+            threads.add(threading.current_thread())
+            return find_node_by_path(path)
+
+        self.watch(self.test_folder.path)
+        self.file_system._watches.resolve = resolve
+        self.file_system.write_to_file(self.text_file.path, 'Content')
+        self.file_system.delete(self.nested_folder.path)
+        self.file_system.wait_for_watchers()
+        self.assertEqual({threading.current_thread()}, threads)
+
+    def test_failing_callbacks_should_be_raised_by_wait(self):
+        def fail(events):
+            raise ValueError(events)
+
+        self.file_system.watch(self.test_folder.path, fail)
+        self.watch(self.test_folder.path)
+        self.file_system.write_to_file(self.text_file.path, 'Content')
+        with self.assertRaises(ValueError):
+            self.file_system.wait_for_watchers()
+        self.assertEqual(2, len(self.events))
+        self.file_system.wait_for_watchers()
+
+    def test_coalesce_should_not_merge_across_moves(self):
+        path = os.path.join(MAIN_DRIVE, 'file')
+        changes = [(MODIFIED, path, None, None), (MOVED, path, path + '2', None), (MODIFIED, path, None, None),
+                   (DELETED, path, None, None)]
+        self.assertEqual([Event(MODIFIED, path, None, None), Event(MOVED, path, path + '2', None),
+                          Event(DELETED, path, None, None)], coalesce(changes))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,170 @@
+import os
+import shutil
+import tempfile
+import unittest
+import zlib
+
+from file_system_entities.entity_types_enum import EntityTypes
+from file_system import FileSystem
+from helpers import MAIN_DRIVE
+from journal import Journal, recover
+from zip_compression import NODE, CompressedZipFile, compress_children, evict, is_compressed
+
+
+class TestZipCompression(unittest.TestCase):
+    def setUp(self):
+        self.file_system = FileSystem(zip_codec='zlib', zip_cache_size=1, indexed=True)
+        self.zip_file1 = self.file_system.create(EntityTypes.ZIP_FILE, 'zip_file1', MAIN_DRIVE)
+        self.text_file1 = self.file_system.create(EntityTypes.TEXT_FILE, 'text_file1', self.zip_file1.path)
+        self.file_system.write_to_file(self.text_file1.path, 'Content ' * 1000)
+
+    def test_zip_files_should_report_their_compressed_size(self):
+        self.assertIsInstance(self.zip_file1, CompressedZipFile)
+        self.assertEqual(len(compress_children(self.zip_file1)), self.zip_file1.size)
+        self.assertLess(self.zip_file1.size, 8000 // 10)
+        self.assertEqual(8000, self.zip_file1.children_size)
+        self.assertEqual(self.zip_file1.size, self.file_system.get_root_node().size)
+        self.assertEqual([], self.file_system.verify_sizes())
+
+        # The compressed size changes even when the size of the children doesn't
+        size = self.zip_file1.size
+        self.file_system.write_to_file(self.text_file1.path, os.urandom(4000).hex())
+        self.assertGreater(self.zip_file1.size, size)
+        self.assertEqual(self.zip_file1.size, self.file_system.get_root_node().size)
+
+    def test_least_recently_used_zip_files_should_be_evicted_and_decompressed_on_access(self):
+        zip_file2 = self.file_system.create(EntityTypes.ZIP_FILE, 'zip_file2', MAIN_DRIVE)
+        self.assertTrue(is_compressed(self.zip_file1))
+        self.assertFalse(is_compressed(zip_file2))
+
+        text_file1 = self.file_system.find_node_by_path(os.path.join(self.zip_file1.path, 'text_file1'))
+        self.assertIsNot(self.text_file1, text_file1)
+        self.assertEqual('Content ' * 1000, text_file1.content)
+        self.assertEqual([text_file1], self.file_system.find(name='text_file1'))
+
+        # Decompressing zip_file1 made zip_file2 the least recently used one
+        self.file_system.trim_zip_cache()
+        self.assertTrue(is_compressed(zip_file2))
+        self.assertFalse(is_compressed(self.zip_file1))
+
+    def test_nested_zip_files_should_stay_compressed_inside_their_parent(self):
+        nested = self.file_system.create(EntityTypes.ZIP_FILE, 'nested', self.zip_file1.path)
+        text_file2 = self.file_system.create(EntityTypes.TEXT_FILE, 'text_file2', nested.path)
+        self.file_system.write_to_file(text_file2.path, 'Nested content')
+        self.assertEqual(self.zip_file1.size, self.file_system.get_root_node().size)
+        self.assertEqual(len(compress_children(self.zip_file1)), self.zip_file1.size)
+
+        evict(nested)
+        evict(self.zip_file1)
+        self.assertTrue(is_compressed(self.zip_file1))
+        nested = self.zip_file1.children['nested']
+        self.assertTrue(is_compressed(nested))
+        self.assertEqual('Nested content', nested.children['text_file2'].content)
+        self.assertEqual(len('Nested content'), nested.children_size)
+
+    def test_snapshots_should_keep_zip_files_compressed(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            snapshot_path = os.path.join(temp_dir, 'file_system.snapshot')
+            nested = self.file_system.create(EntityTypes.ZIP_FILE, 'nested', self.zip_file1.path)
+            self.file_system.create(EntityTypes.ZIP_FILE, 'zip_file2', MAIN_DRIVE)
+            self.assertTrue(is_compressed(self.zip_file1))
+            self.file_system.save(snapshot_path)
+
+            # Loaded without a zip codec, the zip files stay compressed even though new ones won't be
+            loaded = FileSystem.load(snapshot_path)
+            zip_file1 = loaded.find_node_by_path(self.zip_file1.path)
+            self.assertIsInstance(zip_file1, CompressedZipFile)
+            self.assertEqual('zlib', loaded.find_node_by_path(nested.path).codec)
+            self.assertEqual(self.file_system.get_root_node().size, loaded.get_root_node().size)
+            self.assertEqual([], loaded.verify_sizes())
+            text_file = loaded.create(EntityTypes.TEXT_FILE, 'text_file2', nested.path)
+            loaded.write_to_file(text_file.path, os.urandom(100).hex())
+            self.assertEqual(len(compress_children(zip_file1)), zip_file1.size)
+            self.assertEqual(zip_file1.size + loaded.find_node_by_path(os.path.join(MAIN_DRIVE, 'zip_file2')).size,
+                             loaded.get_root_node().size)
+            self.assertEqual([], loaded.verify_sizes())
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_recover_should_keep_zip_files_compressed(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            journal_path = os.path.join(temp_dir, 'file_system.journal')
+            with Journal(journal_path) as journal:
+                file_system = FileSystem(journal, zip_codec='zlib')
+                zip_file = file_system.create(EntityTypes.ZIP_FILE, 'zip_file1', MAIN_DRIVE)
+                text_file = file_system.create(EntityTypes.TEXT_FILE, 'text_file1', zip_file.path)
+                file_system.write_to_file(text_file.path, 'Content ' * 1000)
+            recovered = recover(journal_path, zip_codec='zlib')
+            self.assertEqual(zip_file.size, recovered.get_root_node().size)
+            self.assertEqual([], recovered.verify_sizes())
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_lzma_and_the_default_halving_rule(self):
+        file_system = FileSystem(zip_codec='lzma')
+        zip_file = file_system.create(EntityTypes.ZIP_FILE, 'zip_file1', MAIN_DRIVE)
+        text_file = file_system.create(EntityTypes.TEXT_FILE, 'text_file1', zip_file.path)
+        file_system.write_to_file(text_file.path, 'Content ' * 1000)
+        self.assertEqual(len(compress_children(zip_file)), zip_file.size)
+
+        file_system = FileSystem()
+        zip_file = file_system.create(EntityTypes.ZIP_FILE, 'zip_file1', MAIN_DRIVE)
+        self.assertNotIsInstance(zip_file, CompressedZipFile)
+        with self.assertRaises(ValueError):
+            CompressedZipFile(EntityTypes.ZIP_FILE, 'zip_file2', zip_file, codec='zstd')
+        # Text files are compressed on their own, with the codec of their zip file
+        blob = compress_children(self.zip_file1)
+        _, _, name_length, _, _, payload_length = NODE.unpack_from(blob)
+        payload = blob[NODE.size + name_length:NODE.size + name_length + payload_length]
+        self.assertEqual(('Content ' * 1000).encode('utf-8'), zlib.decompress(payload))
+
+    def test_only_changed_text_files_should_be_recompressed(self):
+        text_file2 = self.file_system.create(EntityTypes.TEXT_FILE, 'text_file2', self.zip_file1.path)
+        self.file_system.write_to_file(text_file2.path, 'Other content')
+        member_size = self.zip_file1.member_sizes[id(self.text_file1)]
+        self.file_system.append_to_file(text_file2.path, ' appended')
+        self.assertIs(member_size, self.zip_file1.member_sizes[id(self.text_file1)])
+        self.assertEqual(len(compress_children(self.zip_file1)), self.zip_file1.size)
+
+        self.file_system.delete(text_file2.path)
+        self.assertEqual([id(self.text_file1)], list(self.zip_file1.member_sizes))
+        self.assertEqual(len(compress_children(self.zip_file1)), self.zip_file1.size)
+
+    def test_compressed_size_should_follow_every_kind_of_change(self):
+        # Nothing is evicted, so that the nodes held by the test stay valid
+        file_system = FileSystem(zip_codec='zlib')
+        zip_file1 = file_system.create(EntityTypes.ZIP_FILE, 'zip_file1', MAIN_DRIVE)
+        folder = file_system.create(EntityTypes.FOLDER, 'folder', zip_file1.path)
+        text_file2 = file_system.create(EntityTypes.TEXT_FILE, 'text_file2', folder.path)
+        file_system.write_to_file(text_file2.path, 'Other content')
+        nested = file_system.create(EntityTypes.ZIP_FILE, 'nested', folder.path)
+        text_file3 = file_system.create(EntityTypes.TEXT_FILE, 'text_file3', nested.path)
+        file_system.write_to_file(text_file3.path, 'Nested content')
+        zip_file2 = file_system.create(EntityTypes.ZIP_FILE, 'zip_file2', MAIN_DRIVE)
+        file_system.move(folder.path, os.path.join(zip_file1.path, 'renamed_folder'))
+        file_system.append_to_file(text_file3.path, ' appended')
+        file_system.move(text_file2.path, os.path.join(zip_file2.path, 'text_file2'))
+        file_system.move(nested.path, os.path.join(zip_file2.path, 'nested'))
+        file_system.write_range(text_file2.path, 0, 'Changed')
+        file_system.delete(nested.path)
+        for zip_file in (zip_file1, zip_file2):
+            self.assertEqual(len(compress_children(zip_file)), zip_file.size)
+        self.assertEqual([], file_system.verify_sizes())
+        self.assertEqual([id(text_file2)], list(zip_file2.member_sizes))
+
+    def test_reads_should_mark_zip_files_as_used(self):
+        file_system = FileSystem(zip_codec='zlib', zip_cache_size=2)
+        zip_file1 = file_system.create(EntityTypes.ZIP_FILE, 'zip_file1', MAIN_DRIVE)
+        text_file1 = file_system.create(EntityTypes.TEXT_FILE, 'text_file1', zip_file1.path)
+        zip_file2 = file_system.create(EntityTypes.ZIP_FILE, 'zip_file2', MAIN_DRIVE)
+        file_system.read_range(text_file1.path)
+        file_system.create(EntityTypes.ZIP_FILE, 'zip_file3', MAIN_DRIVE)
+        self.assertTrue(is_compressed(zip_file2))
+        self.assertFalse(is_compressed(zip_file1))
+
+        # Walking through the children of a zip file uses it too
+        list(file_system.iter_descendants(zip_file1.path))
+        file_system.create(EntityTypes.ZIP_FILE, 'zip_file4', MAIN_DRIVE)
+        self.assertFalse(is_compressed(zip_file1))
@@ -0,0 +1,272 @@
+"""
+Bulk import of real directory trees and manifests (see FileSystem.import_tree).
+
+Listing the directories and reading the files runs in a pool of worker processes (or threads), one task per
+directory and one per chunk of READ_CHUNK files, so that both wide and deep trees are spread over the workers.  As
+the results come back, the imported nodes are built as detached subtrees with exact sizes, ready to be grafted onto
+a file system in one batch.
+
+A manifest is either a JSONL file (one JSON object per line) or a CSV file (with a header row) of entities, with
+the fields:
+
+    path     The path of the entity relative to where it is imported, '/'-separated; missing parents are created
+             as folders
+    type     FOLDER, TEXT_FILE or ZIP_FILE (TEXT_FILE by default)
+    content  The content of a text file
+    source   A real file to read the content of a text file from, relative to the manifest
+"""
+import csv
+import errno
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from pathlib import PurePosixPath
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from content_store import Content
+from file_system_entities.entity_factory import FileSystemEntityFactory
+from file_system_entities.entity_types_enum import EntityTypes
+from file_system_entities.file_system_entities import FileSystemEntity, TextFile
+from illegal_file_system_operation import IllegalFileSystemOperation
+from tree_walk import iter_tree
+from zip_compression import CompressedZipFile
+
+EXECUTORS = {'process': ProcessPoolExecutor, 'thread': ThreadPoolExecutor}
+MANIFEST_FORMATS = ('.jsonl', '.csv')
+# How many files a worker reads per task
+READ_CHUNK = 256
+
+
+def list_directory(path: str) -> Tuple[List[str], List[str]]:
+    """
+    List a real directory, skipping symbolic links and special files (runs in a worker)
+    :param path: str - The path of the directory
+    :return: Tuple[List[str], List[str]] - The names of its subdirectories and of its regular files, sorted
+    """
+    folders, files = [], []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                folders.append(entry.name)
+            elif entry.is_file(follow_symlinks=False):
+                files.append(entry.name)
+
+    return sorted(folders), sorted(files)
+
+
+def read_files(paths: List[str]) -> List[str]:
+    """
+    Read real files as text, as is (runs in a worker)
+    :param paths: List[str] - The paths of the files
+    :return: List[str] - Their contents, with invalid UTF-8 replaced
+    """
+    contents = []
+    for path in paths:
+        with open(path, encoding='utf-8', errors='replace', newline='') as text_file:
+            contents.append(text_file.read())
+
+    return contents
+
+
+class TreeBuilder:
+    def __init__(self, put_content: Callable[[str], Content], zip_codec: str = None):
+        """
+        Builds detached subtrees (their roots have no parent) to be grafted onto a file system
+        :param put_content: Callable[[str], Content] - Stores the content of a text file (see ContentStore.put)
+        :param zip_codec: str - The codec of the zip files, if they are compressed (see the zip_compression module)
+        """
+        self.put_content = put_content
+        self.zip_codec = zip_codec
+        # The roots of the subtrees, by name
+        self.roots: Dict[str, FileSystemEntity] = {}
+        # The nodes added by path, for manifests
+        self._nodes: Dict[Tuple[str, ...], FileSystemEntity] = {}
+
+    def add(self, parent: Optional[FileSystemEntity], type: EntityTypes, name: str) -> FileSystemEntity:
+        """
+        Add a node
+        :param parent: FileSystemEntity - The parent node, or None for the root of a subtree
+        :param type: EntityTypes - The type of the node
+        :param name: str - The name of the node
+        :return: FileSystemEntity - The new node
+        :raises FileExistsError, IllegalFileSystemOperation
+        """
+        if type == EntityTypes.DRIVE:
+            raise IllegalFileSystemOperation('A drive cannot be contained in any entity')
+        siblings = self.roots if parent is None else getattr(parent, 'children', None)
+        if siblings is None:
+            raise IllegalFileSystemOperation('Parent cannot contain any other entity')
+        if name in siblings:
+            raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), name)
+
+        if type == EntityTypes.ZIP_FILE and self.zip_codec:
+            node = CompressedZipFile(type, name, parent, self.zip_codec)
+        else:
+            node = FileSystemEntityFactory.for_type(type)(type, name, parent)
+        if parent is None:
+            self.roots[name] = node
+        else:
+            parent.add_child(node)
+
+        return node
+
+    def add_path(self, parts: Tuple[str, ...], type: EntityTypes) -> FileSystemEntity:
+        """
+        Add a node by its path, creating its missing ancestors as folders.  Adding a path again returns the node
+        already there, if it has the same type
+        :param parts: Tuple[str, ...] - The names along the path
+        :param type: EntityTypes - The type of the node
+        :return: FileSystemEntity - The node
+        :raises FileExistsError, IllegalFileSystemOperation
+        """
+        node = self._nodes.get(parts)
+        if node is not None:
+            if node.type != type:
+                raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), '/'.join(parts))
+            return node
+
+        parent = self.add_path(parts[:-1], EntityTypes.FOLDER) if len(parts) > 1 else None
+        node = self._nodes[parts] = self.add(parent, type, parts[-1])
+
+        return node
+
+    def set_content(self, node: TextFile, content: str) -> None:
+        """
+        Set the content of a text file; its size is only updated by finish()
+        :param node: TextFile
+        :param content: str
+        """
+        node.content = self.put_content(content)
+
+    def finish(self) -> List[FileSystemEntity]:
+        """
+        Compute the size of every node, children first
+        :return: List[FileSystemEntity] - The roots of the subtrees
+        """
+        self._nodes.clear()
+        for root in self.roots.values():
+            for node, _, _ in iter_tree(root, order='post'):
+                node.set_size()
+
+        return list(self.roots.values())
+
+
+def build_tree(source: str, put_content: Callable[[str], Content], zip_codec: str = None, workers: int = None,
+               executor: str = 'process') -> List[FileSystemEntity]:
+    """
+    Build the subtrees of a real directory or of a manifest (see the module docstring)
+    :param source: str - The path of a directory, whose entries become the roots of the subtrees, or of a .jsonl or
+            .csv manifest
+    :param put_content: Callable[[str], Content] - Stores the content of a text file (see ContentStore.put)
+    :param zip_codec: str - The codec of the zip files, if they are compressed (see the zip_compression module)
+    :param workers: int - The size of the pool (by default, as many as concurrent.futures picks)
+    :param executor: str - 'process' or 'thread'
+    :return: List[FileSystemEntity] - The detached roots of the subtrees, with their sizes computed
+    :raises FileNotFoundError, FileExistsError, IllegalFileSystemOperation, ValueError
+    """
+    if executor not in EXECUTORS:
+        raise ValueError(f'Unknown executor {executor}, expected one of {tuple(EXECUTORS)}')
+    is_manifest = os.path.isfile(source) and os.path.splitext(source)[1].lower() in MANIFEST_FORMATS
+    if not is_manifest and not os.path.isdir(source):
+        raise ValueError(f'{source} is neither a directory nor a {" or ".join(MANIFEST_FORMATS)} manifest')
+
+    builder = TreeBuilder(put_content, zip_codec)
+    pending: Dict[Future, Tuple] = {}
+    pool = EXECUTORS[executor](max_workers=workers)
+    try:
+        if is_manifest:
+            _read_manifest(source, builder, pool, pending)
+        else:
+            pending[pool.submit(list_directory, source)] = (source, None)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                directory, nodes = pending.pop(future)
+                if directory is None:
+                    for node, content in zip(nodes, future.result()):
+                        builder.set_content(node, content)
+                else:
+                    _add_directory(directory, nodes, future.result(), builder, pool, pending)
+    finally:
+        for future in pending:
+            future.cancel()
+        pool.shutdown()
+
+    return builder.finish()
+
+
+def _add_directory(directory: str, parent: Optional[FileSystemEntity], listing: Tuple[List[str], List[str]],
+                   builder: TreeBuilder, pool, pending: Dict[Future, Tuple]) -> None:
+    """
+    Add the entries of a listed directory, and submit the tasks listing its subdirectories and reading its files
+    :param directory: str - The real path of the directory
+    :param parent: FileSystemEntity - The node of the directory, or None for the imported directory itself
+    :param listing: Tuple[List[str], List[str]] - See list_directory
+    :param builder: TreeBuilder
+    :param pool: Executor
+    :param pending: Dict[Future, Tuple] - The tasks submitted so far => (real directory path, its node) for listings,
+            or (None, the text file nodes) for reads
+    """
+    folders, files = listing
+    for name in folders:
+        node = builder.add(parent, EntityTypes.FOLDER, name)
+        path = os.path.join(directory, name)
+        pending[pool.submit(list_directory, path)] = (path, node)
+    for start in range(0, len(files), READ_CHUNK):
+        names = files[start:start + READ_CHUNK]
+        nodes = [builder.add(parent, EntityTypes.TEXT_FILE, name) for name in names]
+        pending[pool.submit(read_files, [os.path.join(directory, name) for name in names])] = (None, nodes)
+
+
+def _read_manifest(manifest: str, builder: TreeBuilder, pool, pending: Dict[Future, Tuple]) -> None:
+    """
+    Add the entities of a manifest, and submit the tasks reading the contents given by a source file
+    :param manifest: str - The path of the manifest
+    :param builder: TreeBuilder
+    :param pool: Executor
+    :param pending: Dict[Future, Tuple] - See _add_directory
+    """
+    base = os.path.dirname(os.path.abspath(manifest))
+    sources: List[Tuple[TextFile, str]] = []
+    for line, entry in enumerate(_iter_manifest(manifest), 1):
+        path = entry.get('path') or ''
+        parts = PurePosixPath(path).parts
+        if not parts or parts[0] == '/' or any(part in ('.', '..') for part in parts):
+            raise ValueError(f'{manifest}:{line}: invalid path {path!r}')
+        type_name = (entry.get('type') or EntityTypes.TEXT_FILE.name).upper()
+        if type_name not in EntityTypes.__members__:
+            raise ValueError(f'{manifest}:{line}: unknown type {type_name}')
+
+        node = builder.add_path(parts, EntityTypes[type_name])
+        content, source = entry.get('content'), entry.get('source')
+        if (content or source) and not isinstance(node, TextFile):
+            raise ValueError(f'{manifest}:{line}: only text files have a content')
+        if source:
+            sources.append((node, os.path.join(base, source)))
+            if len(sources) == READ_CHUNK:
+                _submit_reads(sources, pool, pending)
+        elif content:
+            builder.set_content(node, content)
+    _submit_reads(sources, pool, pending)
+
+
+def _submit_reads(sources: List[Tuple[TextFile, str]], pool, pending: Dict[Future, Tuple]) -> None:
+    if sources:
+        nodes, paths = zip(*sources)
+        pending[pool.submit(read_files, list(paths))] = (None, nodes)
+        sources.clear()
+
+
+def _iter_manifest(manifest: str) -> Iterator[Dict[str, str]]:
+    """
+    Read the entries of a manifest
+    :param manifest: str - The path of a .jsonl or .csv manifest
+    :return: Iterator[Dict[str, str]]
+    """
+    with open(manifest, encoding='utf-8', newline='') as manifest_file:
+        if manifest.lower().endswith('.csv'):
+            yield from csv.DictReader(manifest_file)
+            return
+        for line in manifest_file:
+            if line.strip():
+                yield json.loads(line)
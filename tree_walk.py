@@ -0,0 +1,102 @@
+"""
+Iterative (explicit stack) traversal and rendering of file system trees, safe for trees of any depth
+"""
+import sys
+from collections import deque, namedtuple
+from typing import Callable, Iterator, TextIO
+
+ORDERS = ('pre', 'post', 'bfs')
+# How many rendered lines are buffered before they are written out
+RENDER_BUFFER_LINES = 1024
+
+TreeEntry = namedtuple('TreeEntry', ['node', 'depth', 'is_last'])
+TreeEntry.__doc__ = """
+A node reached by a walk
+:param node: FileSystemEntity - The file system node (entity)
+:param depth: int - The number of levels below the root of the walk
+:param is_last: bool - Whether the node is the last child of its parent (True for the root of the walk)
+"""
+
+
+def _children(node) -> list:
+    return list(getattr(node, 'children', {}).values())
+
+
+def iter_tree(root, order: str = 'pre', max_depth: int = None,
+              prune: Callable[[object], bool] = None) -> Iterator[TreeEntry]:
+    """
+    Walk a tree without recursion
+    :param root: FileSystemEntity - The node to start from (a snapshot view works as well)
+    :param order: str - 'pre' (parents before children), 'post' (children before parents) or 'bfs' (level by level)
+    :param max_depth: int - Don't descend below this depth (the root is at depth 0)
+    :param prune: Callable[[FileSystemEntity], bool] - Don't descend into the nodes for which this returns True
+            (the nodes themselves are still yielded)
+    :return: Iterator[TreeEntry]
+    """
+    if order not in ORDERS:
+        raise ValueError(f'Unknown order {order}, expected one of {ORDERS}')
+
+    def expandable(node, depth: int) -> bool:
+        return (max_depth is None or depth < max_depth) and not (prune is not None and prune(node))
+
+    if order == 'bfs':
+        queue = deque([TreeEntry(root, 0, True)])
+        while queue:
+            entry = queue.popleft()
+            yield entry
+            if expandable(entry.node, entry.depth):
+                children = _children(entry.node)
+                queue.extend(TreeEntry(child, entry.depth + 1, i == len(children) - 1)
+                             for i, child in enumerate(children))
+        return
+
+    if order == 'pre':
+        stack = [TreeEntry(root, 0, True)]
+        while stack:
+            entry = stack.pop()
+            yield entry
+            if expandable(entry.node, entry.depth):
+                children = _children(entry.node)
+                stack.extend(TreeEntry(children[i], entry.depth + 1, i == len(children) - 1)
+                             for i in range(len(children) - 1, -1, -1))
+        return
+
+    # Post-order: each entry is pushed twice, yielded the second time once its children are done
+    stack = [(TreeEntry(root, 0, True), False)]
+    while stack:
+        entry, children_done = stack.pop()
+        if children_done or not expandable(entry.node, entry.depth):
+            yield entry
+            continue
+        stack.append((entry, True))
+        children = _children(entry.node)
+        stack.extend((TreeEntry(children[i], entry.depth + 1, i == len(children) - 1), False)
+                     for i in range(len(children) - 1, -1, -1))
+
+
+def render_tree(root, file: TextIO = None, max_depth: int = None, prune: Callable[[object], bool] = None,
+                buffer_lines: int = RENDER_BUFFER_LINES) -> None:
+    """
+    Render a tree, one node per line with its size, streaming buffered output to a file object
+    :param root: FileSystemEntity - The node to start from (a snapshot view works as well)
+    :param file: TextIO - Where the tree is written to; sys.stdout by default
+    :param max_depth: int - Don't render below this depth (the root is at depth 0)
+    :param prune: Callable[[FileSystemEntity], bool] - Don't render the descendants of the nodes for which this
+            returns True
+    :param buffer_lines: int - How many lines are buffered before they are written out
+    """
+    file = file if file is not None else sys.stdout
+    # prefixes[d] is the prefix of the lines of the nodes at depth d
+    prefixes = ['']
+    lines = []
+    for node, depth, is_last in iter_tree(root, 'pre', max_depth, prune):
+        prefix = prefixes[depth]
+        lines.append(f'{prefix}|- {node.name} ({node.size})')
+        del prefixes[depth + 1:]
+        prefixes.append(prefix + ('   ' if is_last else '|  '))
+        if len(lines) >= buffer_lines:
+            file.write('\n'.join(lines) + '\n')
+            lines.clear()
+
+    if lines:
+        file.write('\n'.join(lines) + '\n')
@@ -0,0 +1,306 @@
+"""
+Copy-on-write, point-in-time snapshots of a file system tree.
+
+Taking a snapshot is O(1): it only closes the current epoch.  Afterwards, the first time a node is changed in an
+epoch, its previous state is preserved in a version record tagged with that epoch (for containers, only the
+entries of the children that change are preserved).  A snapshot taken at epoch E reads each node from the first
+record newer than E, or from the live node if it hasn't changed since.  Nothing is preserved while no snapshot
+is alive, and the records are dropped once the last snapshot is released.
+"""
+import threading
+import weakref
+from pathlib import Path
+from typing import Dict, Iterator, List, Mapping, Optional, Tuple
+
+from content_store import ContentHandle
+from file_system_entities.file_system_entities import FileSystemEntity, LazyContent
+from helpers import drive_name, file_path, normalize_path, MAIN_DRIVE
+
+# Marks a child that didn't exist yet at the time of a version record
+_MISSING = object()
+
+
+class _VersionRecord:
+    __slots__ = ('epoch', 'name', 'parent', 'size', 'children_size', 'content', 'children')
+
+    def __init__(self, epoch: int, node: FileSystemEntity):
+        self.epoch = epoch
+        self.name = node.name
+        self.parent = getattr(node, 'parent', None)
+        self.size = node.size
+        self.children_size = getattr(node, 'children_size', None)
+        self.content = getattr(node, '_content', None)
+        # name => child before the first change of that name in the epoch (or _MISSING)
+        self.children: Optional[Dict[str, object]] = None
+
+
+class VersionStore:
+    def __init__(self):
+        """
+        The version records of the nodes of a file system, and the clock of its snapshots
+        """
+        self.epoch = 0
+        self._live_snapshots = 0
+        self._histories: Dict[int, Tuple[FileSystemEntity, List[_VersionRecord]]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def active(self) -> bool:
+        """
+        Whether any snapshot is alive, in which case changed nodes must be preserved
+        :return: bool
+        """
+        return self._live_snapshots > 0
+
+    def snapshot(self, drives: Dict[str, FileSystemEntity]) -> 'FileSystemSnapshot':
+        """
+        Take a snapshot of the tree as it is now
+        :param drives: Dict[str, FileSystemEntity] - The drives of the file system, by name
+        :return: FileSystemSnapshot
+        """
+        with self._lock:
+            if not self._live_snapshots:
+                self._histories.clear()
+            snapshot = FileSystemSnapshot(self, self.epoch, dict(drives))
+            self.epoch += 1
+            self._live_snapshots += 1
+        weakref.finalize(snapshot, self._release)
+
+        return snapshot
+
+    def _release(self) -> None:
+        with self._lock:
+            self._live_snapshots -= 1
+            if not self._live_snapshots:
+                self._histories.clear()
+
+    def preserve(self, node: FileSystemEntity) -> Optional[_VersionRecord]:
+        """
+        Preserve the state of a node before it is changed, unless it was already preserved in the current epoch.
+        Must be called while holding the node's lock in concurrent mode
+        :param node: FileSystemEntity - The node about to change
+        :return: _VersionRecord - The record of the current epoch, or None if no snapshot is alive
+        """
+        if not self._live_snapshots:
+            return None
+        entry = self._histories.get(id(node))
+        if entry is None:
+            entry = self._histories.setdefault(id(node), (node, []))
+        records = entry[1]
+        if not records or records[-1].epoch != self.epoch:
+            records.append(_VersionRecord(self.epoch, node))
+
+        return records[-1]
+
+    def preserve_child(self, parent: FileSystemEntity, name: str) -> None:
+        """
+        Preserve the child of a container under a given name before it is added, removed or replaced
+        :param parent: FileSystemEntity - The container about to change
+        :param name: str - The name of the child about to change
+        """
+        record = self.preserve(parent)
+        if record is None:
+            return
+        if record.children is None:
+            record.children = {}
+        if name not in record.children:
+            record.children[name] = parent.children.get(name, _MISSING)
+
+    def state_at(self, node: FileSystemEntity, epoch: int) -> Optional[_VersionRecord]:
+        """
+        Get the preserved state of a node as of a snapshot
+        :param node: FileSystemEntity - The node
+        :param epoch: int - The epoch of the snapshot
+        :return: _VersionRecord - The first record newer than the snapshot, or None if the node is unchanged since
+        """
+        entry = self._histories.get(id(node))
+        if entry is not None:
+            for record in entry[1]:
+                if record.epoch > epoch:
+                    return record
+
+        return None
+
+    def child_at(self, node: FileSystemEntity, name: str, epoch: int) -> Optional[FileSystemEntity]:
+        """
+        Get a single child of a container as of a snapshot, without building all of its children
+        :param node: FileSystemEntity - The container
+        :param name: str - The name of the child
+        :param epoch: int - The epoch of the snapshot
+        :return: FileSystemEntity - The child, or None if there was no child by that name
+        """
+        # Read before the records, see SnapshotNode._field
+        child = node.children.get(name)
+        entry = self._histories.get(id(node))
+        if entry is None:
+            return child
+
+        # The oldest record newer than the snapshot that preserved the name wins
+        for record in entry[1]:
+            if record.epoch > epoch and record.children is not None and name in record.children:
+                preserved = record.children[name]
+                return None if preserved is _MISSING else preserved
+
+        return child
+
+    def children_at(self, node: FileSystemEntity, epoch: int) -> Dict[str, FileSystemEntity]:
+        """
+        Get the children of a container as of a snapshot
+        :param node: FileSystemEntity - The container
+        :param epoch: int - The epoch of the snapshot
+        :return: Dict[str, FileSystemEntity] - The children, by name
+        """
+        children = dict(node.children)
+        entry = self._histories.get(id(node))
+        if entry is None:
+            return children
+
+        # The oldest record newer than the snapshot wins for each name, so apply the newest records first
+        for record in reversed(entry[1]):
+            if record.epoch <= epoch:
+                break
+            for name, child in (record.children or {}).items():
+                if child is _MISSING:
+                    children.pop(name, None)
+                else:
+                    children[name] = child
+
+        return children
+
+
+class SnapshotNode:
+    __slots__ = ('_store', '_epoch', '_node', '_parent')
+
+    def __init__(self, store: VersionStore, epoch: int, node: FileSystemEntity, parent: 'SnapshotNode' = None):
+        """
+        A read-only view of a file system node (entity) as of a snapshot
+        :param store: VersionStore - The version records of the file system
+        :param epoch: int - The epoch of the snapshot
+        :param node: FileSystemEntity - The live node
+        :param parent: SnapshotNode - The view of the parent of the node
+        """
+        self._store = store
+        self._epoch = epoch
+        self._node = node
+        self._parent = parent
+
+    def _field(self, name: str):
+        # The live value is read first: if the node changes after that, its former state is preserved by the time
+        # the record is looked up, whereas reading the live node after finding no record could see the change
+        value = getattr(self._node, name)
+        record = self._store.state_at(self._node, self._epoch)
+        return getattr(record, name) if record is not None else value
+
+    @property
+    def type(self):
+        return self._node.type
+
+    @property
+    def name(self) -> str:
+        return self._field('name')
+
+    @property
+    def size(self) -> int:
+        return self._field('size')
+
+    @property
+    def parent(self) -> 'SnapshotNode':
+        if self._parent is None:
+            raise AttributeError('parent')
+        return self._parent
+
+    @property
+    def path(self) -> str:
+        names = []
+        node = self
+        while node is not None:
+            names.append(node.name)
+            node = node._parent
+
+        path = names.pop()
+        while names:
+            path = file_path(path, names.pop())
+
+        return path
+
+    @property
+    def children_size(self) -> int:
+        if not hasattr(self._node, 'children'):
+            raise AttributeError('children_size')
+        return self._field('children_size')
+
+    @property
+    def children(self) -> Mapping[str, 'SnapshotNode']:
+        if not hasattr(self._node, 'children'):
+            raise AttributeError('children')
+        return {name: SnapshotNode(self._store, self._epoch, child, self)
+                for name, child in self._store.children_at(self._node, self._epoch).items()}
+
+    def child(self, name: str) -> Optional['SnapshotNode']:
+        """
+        Get a single child, without building the view of every child (see children)
+        :param name: str - The name of the child
+        :return: SnapshotNode - The view of the child, or None if there was no child by that name (or this node
+                isn't a container)
+        """
+        if not hasattr(self._node, 'children'):
+            return None
+        child = self._store.child_at(self._node, name, self._epoch)
+        return SnapshotNode(self._store, self._epoch, child, self) if child is not None else None
+
+    @property
+    def content(self) -> str:
+        if not hasattr(self._node, 'content'):
+            raise AttributeError('content')
+        # See _field
+        content = self._node.stored_content
+        record = self._store.state_at(self._node, self._epoch)
+        if record is None:
+            return content.read() if isinstance(content, ContentHandle) else content
+        content = record.content.load() if isinstance(record.content, LazyContent) else record.content
+        return content.read() if isinstance(content, ContentHandle) else content
+
+
+class FileSystemSnapshot:
+    def __init__(self, store: VersionStore, epoch: int, drives: Dict[str, FileSystemEntity]):
+        """
+        An immutable, read-only view of a whole file system (or of some of its drives) at a point in time.  Obtained through
+        FileSystem.snapshot(); it keeps preserving changes until it is garbage collected
+        :param store: VersionStore - The version records of the file system
+        :param epoch: int - The epoch the snapshot was taken in
+        :param drives: Dict[str, FileSystemEntity] - The drives of the file system at that time, by name
+        """
+        self.epoch = epoch
+        self.drives: Dict[str, SnapshotNode] = {name: SnapshotNode(store, epoch, drive)
+                                                for name, drive in drives.items()}
+
+    def get_root_node(self) -> SnapshotNode:
+        # A snapshot of a single drive is rooted at that drive
+        return self.drives[MAIN_DRIVE] if MAIN_DRIVE in self.drives else next(iter(self.drives.values()))
+
+    def find_node_by_path(self, path: str) -> Optional[SnapshotNode]:
+        """
+        Find a node of the snapshot based on its file path
+        :param path: str - The full path of the node (entity) to be located
+        :return: SnapshotNode - The view of the node, or None if it didn't exist at the time of the snapshot
+        """
+        node = self.drives.get(drive_name(path))
+        if node is None:
+            return None
+        for name in Path(normalize_path(path)).parts[2:]:
+            node = node.child(name)
+            if node is None:
+                return None
+
+        return node
+
+    def iter_nodes(self) -> Iterator[SnapshotNode]:
+        """
+        Iterate over every node of the snapshot, depth first
+        :return: Iterator[SnapshotNode]
+        """
+        stack = list(self.drives.values())
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(getattr(node, 'children', {}).values())
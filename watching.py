@@ -0,0 +1,327 @@
+"""
+Change notifications of a FileSystem (see FileSystem.watch).
+
+Mutations only enqueue a raw change, along with the watched nodes it may concern (looked up on the mutating thread,
+in O(depth), so that the dispatcher never reads paths while the tree changes under it).  A dispatcher thread,
+running while there are changes to deliver, drains the queue in batches, coalesces the changes of each batch (e.g.
+several writes to the same file become one MODIFIED event, and a file created and deleted again is not reported at
+all), and hands every watch the events of its subtree as one list.  A watch is only handed the changes enqueued
+after it was registered.
+"""
+import itertools
+import os
+import threading
+from collections import namedtuple
+from typing import Callable, Dict, List, Optional, Set
+
+from worker import IDLE_TIMEOUT, Worker
+
+CREATED = 'created'
+DELETED = 'deleted'
+MOVED = 'moved'
+MODIFIED = 'modified'
+
+# How long the dispatcher waits for more changes to coalesce with the first one of a batch
+COALESCE_DELAY = 0.01
+# The maximum number of enqueued changes (or groups of changes, see emit_many) coalesced into one batch
+MAX_BATCH = 10000
+
+Event = namedtuple('Event', ['kind', 'path', 'dest_path', 'size'])
+Event.__doc__ = """
+A change to a watched subtree
+:param kind: str - CREATED, DELETED, MOVED or MODIFIED (the content of a text file, or the size of the watched node)
+:param path: str - The normalized path of the node (its former path, for MOVED).  A created, deleted or moved
+        subtree is reported by its root only, except to the watches within it, which are told that their own
+        node was deleted or moved
+:param dest_path: str - The new path of the node, for MOVED
+:param size: int - The size of the node when the event was delivered, or None for DELETED
+"""
+
+
+class Watch:
+    def __init__(self, manager: 'WatchManager', path: str, callback: Callable[[List[Event]], None],
+                 recursive: bool = True, loop=None):
+        """
+        A subscription to the changes of a subtree, obtained through FileSystem.watch
+        :param manager: WatchManager - The manager the watch is registered with
+        :param path: str - The normalized path of the watched node
+        :param callback: Callable[[List[Event]], None] - Called with each batch of events
+        :param recursive: bool - Whether to watch the whole subtree, or only the node and its children
+        :param loop: asyncio.AbstractEventLoop - If given, the callback is called on this event loop rather than
+                on the dispatcher thread
+        """
+        self.manager = manager
+        self.path = path
+        self.callback = callback
+        self.recursive = recursive
+        self.loop = loop
+        self.size: Optional[int] = None
+        # The sequence number of the last change enqueued before the watch was registered
+        self.since = 0
+        self._prefix = path.rstrip(os.sep) + os.sep
+
+    def matches(self, path: Optional[str], recursive: bool = None) -> bool:
+        """
+        Check whether a change to a path concerns the watch
+        :param path: str - A normalized path
+        :param recursive: bool - Whether to match the whole subtree (by default, as the watch does)
+        :return: bool
+        """
+        if path is None:
+            return False
+        if path == self.path:
+            return True
+        if not path.startswith(self._prefix):
+            return False
+
+        return (self.recursive if recursive is None else recursive) or os.sep not in path[len(self._prefix):]
+
+    def within(self, path: Optional[str]) -> bool:
+        """
+        Check whether the watched node is a descendant of a path, so that deleting or moving the path takes it along
+        :param path: str - A normalized path
+        :return: bool
+        """
+        return path is not None and self.path.startswith(path.rstrip(os.sep) + os.sep)
+
+    def cancel(self) -> None:
+        """
+        Stop delivering events to the watch
+        """
+        self.manager.remove(self)
+
+    def deliver(self, events: List[Event]) -> None:
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.callback, events)
+        else:
+            self.callback(events)
+
+
+class WatchManager:
+    enabled = True
+
+    def __init__(self, resolve: Callable[[str], object], coalesce_delay: float = COALESCE_DELAY,
+                 idle_timeout: float = IDLE_TIMEOUT):
+        """
+        The watches of a file system, and the dispatcher delivering their events
+        :param resolve: Callable[[str], FileSystemEntity] - Finds a node by its path (see FileSystem.find_node_by_path);
+                only called from the threads that register watches and enqueue changes
+        :param coalesce_delay: float - See COALESCE_DELAY
+        :param idle_timeout: float - See IDLE_TIMEOUT
+        """
+        self.resolve = resolve
+        # Replaced, never mutated, so that the dispatcher can iterate over them without locking
+        self.watches: tuple = ()
+        self._paths: frozenset = frozenset()
+        self._sequence = itertools.count(1)
+        self._last_sequence = 0
+        self._lock = threading.Lock()
+        self._worker = Worker(self._dispatch, 'file-system-watch-dispatcher', idle_timeout, MAX_BATCH, coalesce_delay)
+
+    def add(self, path: str, callback: Callable[[List[Event]], None], recursive: bool = True, loop=None) -> Watch:
+        """
+        Register a watch (see Watch)
+        :return: Watch
+        """
+        watch = Watch(self, path, callback, recursive, loop)
+        node = self.resolve(path)
+        watch.size = node.size if node is not None else None
+        with self._lock:
+            watch.since = self._last_sequence
+            self.watches += (watch,)
+            self._paths = frozenset(other.path for other in self.watches)
+
+        return watch
+
+    def remove(self, watch: Watch) -> None:
+        with self._lock:
+            self.watches = tuple(other for other in self.watches if other is not watch)
+            self._paths = frozenset(other.path for other in self.watches)
+
+    def emit(self, kind: str, path: str, dest_path: str = None, node=None) -> None:
+        """
+        Enqueue a change, in O(depth) (deletes and moves also check every watch, for the ones within their subtree)
+        :param kind: str - CREATED, DELETED, MOVED or MODIFIED
+        :param path: str - The normalized path of the changed node (its former path, for MOVED)
+        :param dest_path: str - The new path of the node, for MOVED
+        :param node: FileSystemEntity - The changed node, whose size is read when the event is delivered
+        """
+        self._enqueue(((kind, path, dest_path, node),))
+
+    def emit_many(self, changes: List[tuple]) -> None:
+        """
+        Enqueue several changes, always delivered in the same batch
+        :param changes: List[tuple] - The arguments of emit for each change
+        """
+        if changes:
+            self._enqueue(tuple(changes))
+
+    def _enqueue(self, changes: tuple) -> None:
+        # The watched nodes are looked up here, on the mutating thread, rather than by the dispatcher
+        resolved = {path: self.resolve(path) for path in self._concerned_paths(changes)}
+        with self._lock:
+            self._last_sequence = next(self._sequence)
+            self._worker.submit((self._last_sequence, changes, resolved))
+
+    def _concerned_paths(self, changes: tuple) -> Set[str]:
+        """
+        Get the watched paths whose node may have changed along with some changes: the ancestors of the changed paths
+        (and the paths themselves), and the descendants of the deleted and moved ones
+        :param changes: tuple - The (kind, path, dest_path, node) of each change
+        :return: Set[str]
+        """
+        watched = self._paths
+        concerned = set()
+        if not watched:
+            return concerned
+        for kind, path, dest_path, _ in changes:
+            for changed_path in (path, dest_path):
+                if changed_path is None:
+                    continue
+                ancestor = changed_path
+                while True:
+                    if ancestor in watched:
+                        concerned.add(ancestor)
+                    parent = os.path.dirname(ancestor)
+                    if parent == ancestor:
+                        break
+                    ancestor = parent
+                if kind in (DELETED, MOVED):
+                    prefix = changed_path.rstrip(os.sep) + os.sep
+                    concerned.update(watched_path for watched_path in watched if watched_path.startswith(prefix))
+
+        return concerned
+
+    def wait(self) -> None:
+        """
+        Block until every change enqueued so far has been delivered, then raise the first error raised by a callback
+        since the last wait, if any
+        """
+        self._worker.wait()
+
+    def _dispatch(self, items: List[tuple]) -> None:
+        """
+        Hand every watch the events of its subtree, along with a MODIFIED event for the watched node itself if
+        its size changed
+        :param items: List[tuple] - The (sequence number, changes, resolved watched nodes) enqueued, in order
+        """
+        resolved: Dict[str, object] = {}
+        for _, _, nodes in items:
+            resolved.update(nodes)
+        # Index of the first item => the coalesced events of the items from there on
+        coalesced: Dict[int, List[Event]] = {}
+        error = None
+        for watch in self.watches:
+            start = next((index for index, item in enumerate(items) if item[0] > watch.since), len(items))
+            if start == len(items):
+                continue
+            if start not in coalesced:
+                coalesced[start] = coalesce([change for _, changes, _ in items[start:] for change in changes])
+            try:
+                self._deliver(watch, coalesced[start], resolved)
+            except Exception as callback_error:
+                # A failing callback must not stop the deliveries to the other watches
+                error = error or callback_error
+        if error is not None:
+            raise error
+
+    @staticmethod
+    def _deliver(watch: Watch, events: List[Event], resolved: Dict[str, object]) -> None:
+        """
+        Hand a watch the events that concern it
+        :param watch: Watch
+        :param events: List[Event] - The coalesced events of a batch
+        :param resolved: Dict[str, FileSystemEntity] - The watched nodes looked up when the changes were enqueued
+        """
+        matched = []
+        # Only changes within the subtree (or to an ancestor) can change the size of the watched node, even if it
+        # isn't recursive
+        concerned = False
+        exists = watch.size is not None
+        for event in events:
+            if watch.matches(event.path) or watch.matches(event.dest_path):
+                matched.append(event)
+            if watch.matches(event.path, True) or watch.matches(event.dest_path, True):
+                concerned = True
+            elif event.kind in (DELETED, MOVED) and watch.within(event.path):
+                # The watched node went away along with an ancestor
+                concerned = True
+                if exists and event.kind == DELETED:
+                    matched.append(Event(DELETED, watch.path, None, None))
+                elif exists:
+                    dest_path = event.dest_path + watch.path[len(event.path):]
+                    matched.append(Event(MOVED, watch.path, dest_path, watch.size))
+                exists = False
+            if event.kind == MOVED and watch.within(event.dest_path):
+                # A node may have been moved to the watched path along with an ancestor
+                concerned = True
+                node = resolved.get(watch.path)
+                if node is not None:
+                    source_path = event.path + watch.path[len(event.dest_path):]
+                    matched.append(Event(MOVED, source_path, watch.path, node.size))
+                    exists = True
+        if not concerned:
+            return
+
+        node = resolved.get(watch.path, watch)
+        size = watch.size if node is watch else getattr(node, 'size', None)
+        if size is not None and size != watch.size and not any(watch.path in (event.path, event.dest_path)
+                                                               for event in matched):
+            matched.append(Event(MODIFIED, watch.path, None, size))
+        watch.size = size
+        if matched:
+            watch.deliver(matched)
+
+
+class NullWatchManager:
+    """
+    Stands in for WatchManager while a file system has never been watched
+    """
+    enabled = False
+    watches = ()
+
+    def emit(self, kind: str, path: str, dest_path: str = None, node=None) -> None:
+        pass
+
+    def emit_many(self, changes: List[tuple]) -> None:
+        pass
+
+    def wait(self) -> None:
+        pass
+
+
+def coalesce(changes: List[tuple]) -> List[Event]:
+    """
+    Merge the changes of a batch: repeated MODIFIED events of a path are reported once, MODIFIED events of a path
+    created in the same batch are folded into its CREATED event, the MODIFIED events of a deleted path are dropped,
+    and a path created then deleted in the same batch isn't reported at all.  Moves are never merged across, since
+    they change what the paths refer to
+    :param changes: List[tuple] - The (kind, path, dest_path, node) of each change, in order
+    :return: List[Event] - With sizes read from the nodes as they are now
+    """
+    events: List[Optional[tuple]] = []
+    # path => index in events of its latest CREATED or MODIFIED change since the last move
+    latest: Dict[str, int] = {}
+    for change in changes:
+        kind, path = change[0], change[1]
+        if kind == MOVED:
+            latest.clear()
+            events.append(change)
+            continue
+
+        index = latest.get(path)
+        if kind == MODIFIED and index is not None:
+            continue
+        if kind == DELETED and index is not None:
+            # The changes to a path that is deleted in the end don't matter, and neither does deleting a new path
+            created = events[index][0] == CREATED
+            events[index] = None
+            del latest[path]
+            if created:
+                continue
+        if kind != DELETED:
+            latest[path] = len(events)
+        events.append(change)
+
+    return [Event(kind, path, dest_path, node.size if node is not None and kind != DELETED else None)
+            for kind, path, dest_path, node in filter(None, events)]
@@ -0,0 +1,99 @@
+"""
+A background thread that only runs while there is work to do.
+
+Items are handled in submission order, possibly several at a time.  The thread exits once it has been idle for a
+while, and is started again by the next submit.  A failure to handle some items doesn't stop the thread: the first
+one is kept, and raised by the next wait().
+"""
+import queue
+import threading
+import time
+from typing import Callable, List, Optional
+
+# How long the thread waits for more work before exiting (it is restarted on the next submit)
+IDLE_TIMEOUT = 0.5
+
+
+class Worker:
+    def __init__(self, handle: Callable[[List], None], name: str, idle_timeout: float = IDLE_TIMEOUT,
+                 max_batch: int = 1, delay: float = 0):
+        """
+        Handles submitted items on a background thread
+        :param handle: Callable[[List], None] - Called on the thread with each batch of items, in order
+        :param name: str - The name of the thread
+        :param idle_timeout: float - See IDLE_TIMEOUT
+        :param max_batch: int - The maximum number of items handled together
+        :param delay: float - How long to wait for more items to batch with the first one
+        """
+        self._handle = handle
+        self.name = name
+        self.idle_timeout = idle_timeout
+        self.max_batch = max_batch
+        self.delay = delay
+        self._queue: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._error: Optional[BaseException] = None
+
+    @property
+    def pending(self) -> int:
+        """
+        The number of items submitted but not handled yet
+        :return: int
+        """
+        return self._queue.unfinished_tasks
+
+    def submit(self, item) -> None:
+        """
+        Hand an item over to the thread, starting it if it isn't running
+        :param item: The item
+        """
+        self._queue.put(item)
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def wait(self) -> None:
+        """
+        Block until every item submitted so far has been handled, then raise the first error raised by the
+        handler since the last wait, if any
+        """
+        self._queue.join()
+        with self._lock:
+            error, self._error = self._error, None
+        if error is not None:
+            raise error
+
+    def _run(self) -> None:
+        while True:
+            try:
+                items = [self._queue.get(timeout=self.idle_timeout)]
+            except queue.Empty:
+                with self._lock:
+                    # Anything submitted before the lock was taken is still picked up by this thread
+                    if self._queue.empty():
+                        self._thread = None
+                        return
+                continue
+
+            if self.delay:
+                time.sleep(self.delay)
+            while len(items) < self.max_batch:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            count = len(items)
+            try:
+                self._handle(items)
+            except Exception as error:
+                with self._lock:
+                    if self._error is None:
+                        self._error = error
+            finally:
+                # Drop the references before reporting the work as done, so that the items are freed on this thread
+                items = None
+                for _ in range(count):
+                    self._queue.task_done()
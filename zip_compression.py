@@ -0,0 +1,394 @@
+"""
+Optional real compression of zip files.
+
+A CompressedZipFile reports the true compressed size of its subtree (zlib or lzma from the standard library)
+instead of half the size of its children.  Its subtree can be evicted from memory, leaving only the compressed
+bytes behind; it is decompressed again, lazily, the first time its children are accessed.  A ZipCache keeps track
+of the decompressed zip files, least recently used first, so that the file system can evict the oldest ones.
+
+The compressed subtree is a pre-order list of nodes, each framed as NODE followed by the name and a payload (the
+compressed content of a text file, or the compressed subtree of a nested compressed zip file).  Like the members
+of a real zip archive, every text file is compressed on its own, so that the compressed size of a zip file is
+updated by a delta: writing a text file only recompresses that file (see member_size_delta), and adding or removing
+a subtree only walks that subtree (see subtree_compressed_size).  Nested compressed zip files are embedded
+compressed, so decompressing a zip file never decompresses the zip files it contains.
+"""
+import enum
+import lzma
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from file_system_entities.entity_types_enum import EntityTypes
+from content_store import Content, ContentHandle
+from file_system_entities.file_system_entities import FileSystemEntity, Folder, LazyChildren, TextFile, ZipFile
+from helpers import calc_size
+from tree_walk import iter_tree
+
+CODECS = {'zlib': zlib, 'lzma': lzma}
+# How many zip files are kept decompressed by default
+ZIP_CACHE_SIZE = 64
+
+# type, codec (0 unless the payload is a compressed subtree), name length, size, children size, payload length or
+# child count; the payload of a text file is compressed with the codec of the zip file it belongs to
+NODE = struct.Struct('<BBIqqQ')
+CODEC_IDS = {'zlib': 1, 'lzma': 2}
+CODEC_NAMES = {codec_id: codec for codec, codec_id in CODEC_IDS.items()}
+
+
+class CompressedZipFile(ZipFile):
+    __slots__ = ('codec', 'member_sizes', 'cache')
+
+    def __init__(self, type: enum.Enum, name: str, parent: FileSystemEntity, codec: str = 'zlib'):
+        """
+        Initialize a ZipFile instance that reports the true compressed size of its subtree
+        :param type: enum.Enum - The ID of the file system node type from the entity types enum
+        :param name: str - The name of the file system node (entity)
+        :param parent: FileSystemEntity - Parent file system node (entity)
+        :param codec: str - 'zlib' or 'lzma'
+        """
+        if codec not in CODECS:
+            raise ValueError(f'Unknown codec {codec}, expected one of {tuple(CODECS)}')
+        # The cache the zip file is registered with while decompressed, see ZipCache.touch
+        self.cache: Optional[ZipCache] = None
+        super().__init__(type, name, parent)
+        self.codec = codec
+        # id of a text file => (its content, the length of its compressed content), see compressed_size
+        self.member_sizes: Dict[int, Tuple[Content, int]] = {}
+        self.size = compressed_size(self)
+
+    @classmethod
+    def restore(cls, type: enum.Enum, name: str, parent: FileSystemEntity, codec: str) -> 'CompressedZipFile':
+        """
+        Build a zip file whose size and children are set afterwards, without computing its compressed size
+        """
+        zip_file = cls.__new__(cls)
+        zip_file.cache = None
+        ZipFile.__init__(zip_file, type, name, parent)
+        zip_file.codec = codec
+        zip_file.member_sizes = {}
+
+        return zip_file
+
+    @property
+    def children(self) -> Dict[str, FileSystemEntity]:
+        # Every access to the children counts as a use of the zip file, see ZipCache.used
+        children = ZipFile.children.fget(self)
+        if self.cache is not None:
+            self.cache.used(self)
+
+        return children
+
+    def set_size(self) -> None:
+        self.children_size = calc_size(self.children)
+        self.size = compressed_size(self)
+
+    def size_for(self, children_size: int) -> int:
+        # The compressed size can't be derived from the size of the children: it is only recomputed (by the file
+        # system, once a mutation is complete) from the subtree itself, so size deltas from within stop here
+        return self.size
+
+
+class CompressedChildren(LazyChildren):
+    """
+    Placeholder for the children of an evicted compressed zip file, holding its compressed subtree
+    """
+    __slots__ = ('blob', 'cache')
+
+    def __init__(self, blob: bytes, cache: 'ZipCache' = None):
+        self.blob = blob
+        self.cache = cache
+
+    def load(self, parent: CompressedZipFile) -> Dict[str, FileSystemEntity]:
+        children = _decode_children(parent, self.blob, self.cache)
+        if self.cache is not None:
+            self.cache.loaded(parent, children)
+
+        return children
+
+
+def is_compressed(node: FileSystemEntity) -> bool:
+    """
+    Check whether a node is a zip file whose subtree is currently compressed, without decompressing it
+    :param node: FileSystemEntity
+    :return: bool
+    """
+    # The children of a zip file loaded from a snapshot file may be deferred without being compressed
+    return isinstance(node, CompressedZipFile) and isinstance(node._children, CompressedChildren)
+
+
+def compressed_size(zip_file: CompressedZipFile) -> int:
+    """
+    Compute the compressed size of the subtree of a zip file, as it is now, i.e. len(compress_children(zip_file)),
+    only compressing the text files whose content changed since the last call.  The nested compressed zip files
+    count for their own size, so they must be up to date
+    :param zip_file: CompressedZipFile
+    :return: int
+    """
+    if is_compressed(zip_file):
+        return len(zip_file._children.blob)
+
+    member_sizes = {}
+    size = 0
+    nested = (lambda node: node is not zip_file and isinstance(node, CompressedZipFile))
+    for node, depth, _ in iter_tree(zip_file, prune=nested):
+        if not depth:
+            continue
+        size += NODE.size + len(node.name.encode('utf-8'))
+        if isinstance(node, CompressedZipFile):
+            size += node.size
+        elif isinstance(node, TextFile):
+            entry = _member_size(zip_file, node)
+            member_sizes[id(node)] = entry
+            size += entry[1]
+    # Deleted and moved out text files are dropped
+    zip_file.member_sizes = member_sizes
+
+    return size
+
+
+def containing_zip(node: Optional[FileSystemEntity]) -> Optional[CompressedZipFile]:
+    """
+    Find the innermost compressed zip file at or above a node
+    :param node: FileSystemEntity
+    :return: CompressedZipFile - None if the node isn't inside a compressed zip file
+    """
+    while node is not None and not isinstance(node, CompressedZipFile):
+        node = getattr(node, 'parent', None)
+
+    return node
+
+
+def member_size_delta(zip_file: CompressedZipFile, text_file: TextFile, old_content: Content) -> int:
+    """
+    Get the change in the compressed size of a zip file caused by replacing the content of one of its text files,
+    only compressing that text file
+    :param zip_file: CompressedZipFile - The innermost compressed zip file above the text file
+    :param text_file: TextFile - The text file, holding its new content
+    :param old_content: Content - Its content before the change
+    :return: int
+    """
+    codec = CODECS[zip_file.codec]
+    entry = zip_file.member_sizes.get(id(text_file))
+    if entry is not None and entry[0] is old_content:
+        old_size = entry[1]
+    else:
+        # The members of a decompressed zip file are only known once written to
+        old_text = old_content.read() if isinstance(old_content, ContentHandle) else old_content
+        old_size = len(codec.compress(old_text.encode('utf-8')))
+    entry = _member_size(zip_file, text_file)
+    zip_file.member_sizes[id(text_file)] = entry
+
+    return entry[1] - old_size
+
+
+def subtree_compressed_size(zip_file: CompressedZipFile, root: FileSystemEntity, remove: bool = False) -> int:
+    """
+    Get the share of a subtree in the compressed size of a zip file, and register (or forget) its text files with
+    the zip file, walking only that subtree.  Nested compressed zip files count for their own size
+    :param zip_file: CompressedZipFile - The innermost compressed zip file above the subtree
+    :param root: FileSystemEntity - The root of the subtree, which was just added to the zip file or removed from it
+    :param remove: bool - Whether the subtree was removed
+    :return: int
+    """
+    member_sizes = zip_file.member_sizes
+    size = 0
+    for node, _, _ in iter_tree(root, prune=lambda node: isinstance(node, CompressedZipFile)):
+        size += NODE.size + len(node.name.encode('utf-8'))
+        if isinstance(node, CompressedZipFile):
+            size += node.size
+        elif isinstance(node, TextFile):
+            entry = _member_size(zip_file, node)
+            if remove:
+                member_sizes.pop(id(node), None)
+            else:
+                member_sizes[id(node)] = entry
+            size += entry[1]
+
+    return size
+
+
+def _member_size(zip_file: CompressedZipFile, text_file: TextFile) -> Tuple[Content, int]:
+    """
+    Get the content of a text file and the length of its compressed content, only compressing it if its content
+    changed since it was last registered with the zip file
+    :param zip_file: CompressedZipFile - The innermost compressed zip file above the text file
+    :param text_file: TextFile
+    :return: Tuple[Content, int]
+    """
+    content = text_file.stored_content
+    entry = zip_file.member_sizes.get(id(text_file))
+    if entry is None or entry[0] is not content:
+        entry = (content, len(CODECS[zip_file.codec].compress(text_file.content.encode('utf-8'))))
+
+    return entry
+
+
+def compress_children(zip_file: CompressedZipFile) -> bytes:
+    """
+    Compress the subtree of a zip file, as it is now
+    :param zip_file: CompressedZipFile
+    :return: bytes
+    """
+    if is_compressed(zip_file):
+        return zip_file._children.blob
+
+    # Nested decompressed zip files are compressed first, bottom-up, so that they can be embedded compressed
+    blobs: Dict[int, bytes] = {}
+    for node, _, _ in iter_tree(zip_file, order='post', prune=is_compressed):
+        if isinstance(node, CompressedZipFile) and not is_compressed(node):
+            blobs[id(node)] = _encode_children(node, blobs)
+
+    return blobs[id(zip_file)]
+
+
+def evict(zip_file: CompressedZipFile, cache: 'ZipCache' = None) -> None:
+    """
+    Drop the subtree of a zip file from memory, keeping it compressed until its children are accessed again
+    :param zip_file: CompressedZipFile
+    :param cache: ZipCache - The cache the zip file is registered with once decompressed again
+    """
+    if not is_compressed(zip_file):
+        zip_file.defer_children(CompressedChildren(compress_children(zip_file), cache))
+
+
+def _encode_children(zip_file: CompressedZipFile, blobs: Dict[int, bytes]) -> bytes:
+    """
+    Serialize the descendants of a zip file
+    :param zip_file: CompressedZipFile
+    :param blobs: Dict[int, bytes] - The compressed subtrees of the decompressed zip files it contains, by id
+    :return: bytes
+    """
+    parts = []
+    nested = (lambda node: node is not zip_file and isinstance(node, CompressedZipFile))
+    for node, depth, _ in iter_tree(zip_file, prune=nested):
+        if not depth:
+            continue
+        codec_id = 0
+        if isinstance(node, CompressedZipFile):
+            codec_id = CODEC_IDS[node.codec]
+            payload = blobs.get(id(node)) or compress_children(node)
+            count = len(payload)
+        elif hasattr(node, 'children'):
+            payload = b''
+            count = len(node.children)
+        else:
+            payload = CODECS[zip_file.codec].compress(node.content.encode('utf-8'))
+            count = len(payload)
+        name = node.name.encode('utf-8')
+        parts.append(NODE.pack(node.type.value, codec_id, len(name), node.size, getattr(node, 'children_size', 0),
+                               count))
+        parts.append(name)
+        parts.append(payload)
+
+    return b''.join(parts)
+
+
+def _decode_children(zip_file: CompressedZipFile, data: bytes, cache: 'ZipCache') -> Dict[str, FileSystemEntity]:
+    """
+    Build the descendants of a zip file from their serialized form
+    :param zip_file: CompressedZipFile
+    :param data: bytes - See _encode_children
+    :param cache: ZipCache - Given to the placeholders of the nested compressed zip files
+    :return: Dict[str, FileSystemEntity] - The children of zip_file, by name
+    """
+    codec = CODECS[zip_file.codec]
+    children: Dict[str, FileSystemEntity] = {}
+    # [container, number of its children still to be decoded]; the zip file itself takes every remaining node
+    stack = [[zip_file, -1]]
+    offset = 0
+    while offset < len(data):
+        while not stack[-1][1]:
+            stack.pop()
+        parent = stack[-1][0]
+        stack[-1][1] -= 1
+
+        type_value, codec_id, name_length, size, children_size, count = NODE.unpack_from(data, offset)
+        offset += NODE.size
+        name = data[offset:offset + name_length].decode('utf-8')
+        offset += name_length
+
+        entity_type = EntityTypes(type_value)
+        if codec_id:
+            node = CompressedZipFile.restore(entity_type, name, parent, CODEC_NAMES[codec_id])
+            node.defer_children(CompressedChildren(data[offset:offset + count], cache))
+            offset += count
+        elif entity_type == EntityTypes.TEXT_FILE:
+            node = TextFile(entity_type, name, parent, codec.decompress(data[offset:offset + count]).decode('utf-8'))
+            offset += count
+        else:
+            node = (ZipFile if entity_type == EntityTypes.ZIP_FILE else Folder)(entity_type, name, parent)
+            if count:
+                stack.append([node, count])
+        node.size = size
+        if hasattr(node, 'children_size'):
+            node.children_size = children_size
+
+        if parent is zip_file:
+            children[name] = node
+        else:
+            parent.add_child(node)
+
+    return children
+
+
+class ZipCache:
+    def __init__(self, capacity: int = ZIP_CACHE_SIZE,
+                 on_load: Callable[[CompressedZipFile, Dict[str, FileSystemEntity]], None] = None):
+        """
+        The decompressed zip files of a file system, least recently used first
+        :param capacity: int - How many zip files may stay decompressed (see overflow)
+        :param on_load: Callable - Called with each zip file whose children were just decompressed, and the children
+        """
+        self.capacity = capacity
+        self.on_load = on_load
+        self._zip_files: 'OrderedDict[int, CompressedZipFile]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._zip_files)
+
+    def touch(self, zip_file: CompressedZipFile) -> None:
+        """
+        Mark a decompressed zip file as the most recently used
+        :param zip_file: CompressedZipFile
+        """
+        with self._lock:
+            self._zip_files[id(zip_file)] = zip_file
+            self._zip_files.move_to_end(id(zip_file))
+        zip_file.cache = self
+
+    def used(self, zip_file: CompressedZipFile) -> None:
+        """
+        Mark a zip file whose children were accessed as the most recently used, if it is still registered (a zip
+        file being evicted, or deleted, isn't registered again)
+        :param zip_file: CompressedZipFile
+        """
+        if self._zip_files.get(id(zip_file)) is zip_file:
+            with self._lock:
+                if self._zip_files.get(id(zip_file)) is zip_file:
+                    self._zip_files.move_to_end(id(zip_file))
+
+    def loaded(self, zip_file: CompressedZipFile, children: Dict[str, FileSystemEntity]) -> None:
+        """
+        Register a zip file whose children were just decompressed
+        :param zip_file: CompressedZipFile
+        :param children: Dict[str, FileSystemEntity] - Its children, by name
+        """
+        self.touch(zip_file)
+        if self.on_load is not None:
+            self.on_load(zip_file, children)
+
+    def overflow(self) -> List[CompressedZipFile]:
+        """
+        Forget the least recently used zip files beyond the capacity of the cache
+        :return: List[CompressedZipFile] - The zip files to be evicted, least recently used first
+        """
+        with self._lock:
+            overflow = []
+            while len(self._zip_files) > self.capacity:
+                overflow.append(self._zip_files.popitem(last=False)[1])
+
+            return overflow